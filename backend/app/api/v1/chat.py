@@ -1,12 +1,20 @@
+import json
 import logging
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from typing import List
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ...services.rag_service import RAGService, get_rag_service
+from ...services.interaction_history import ASSISTANT_ROLE, USER_ROLE, Turn
+from ...services.profile_writer import ProfileWriter
+from ...services.retrieval_client import RetrievalClient
+from ...services.summary_compaction import SummaryCompactor
 from ...services.user_service import UserService, get_user_service
-from ...db.session import get_db
-from ...core.exceptions import LLMServiceError
+from ...db.session import AsyncSessionLocal, get_async_db
+from ...core.config import settings
+from ...core.exceptions import LLMServiceError, RAGServiceError
 from ...core.security import sanitize_input
 
 router = APIRouter()
@@ -19,25 +27,38 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
 
+def get_profile_writer(request: Request) -> ProfileWriter | None:
+    return request.app.state.profile_writer
+
+def get_summary_compactor(request: Request) -> SummaryCompactor | RetrievalClient:
+    """The in-process summary compactor, or the retrieval server that runs it when workers share one."""
+    return request.app.state.retrieval_client or request.app.state.summary_compactor
+
+def _sanitize_request(request: ChatRequest) -> str:
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message cannot be empty.")
+
+    sanitized_message = sanitize_input(request.message)
+    if not sanitized_message:
+        raise HTTPException(status_code=400, detail="Sanitized message is empty.")
+    return sanitized_message
+
 @router.post("/", response_model=ChatResponse)
 async def handle_chat(
     request: ChatRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     rag_service: RAGService = Depends(get_rag_service),
     user_service: UserService = Depends(get_user_service),
+    profile_writer: ProfileWriter | None = Depends(get_profile_writer),
+    summary_compactor: SummaryCompactor | RetrievalClient = Depends(get_summary_compactor),
 ):
     print("Hii")
     """
     Handles incoming chat messages, provides a personalized response,
     and logs the interaction to build user memory.
     """
-    if not request.message:
-        raise HTTPException(status_code=400, detail="Message cannot be empty.")
-
-    sanitized_message = sanitize_input(request.message)
-    if not sanitized_message:
-        raise HTTPException(status_code=400, detail="Sanitized message is empty.")
+    sanitized_message = _sanitize_request(request)
 
     try:
         # The RAG service will automatically use user context if telegram_id is provided
@@ -49,10 +70,15 @@ async def handle_chat(
 
         # If a user is part of the conversation, log the interaction for future personalization
         if request.telegram_id:
-            interaction_to_log = f"User: {request.message}\nAI: {answer}"
             # This runs in the background and doesn't block the response
             background_tasks.add_task(
-                user_service.update_interaction_summary, db, request.telegram_id, interaction_to_log
+                _log_interaction,
+                user_service,
+                profile_writer,
+                summary_compactor,
+                request.telegram_id,
+                request.message,
+                answer,
             )
 
         return ChatResponse(response=answer)
@@ -62,3 +88,99 @@ async def handle_chat(
     except Exception as e:
         logger.error(f"Unexpected error handling chat request: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="An internal error occurred.")
+
+async def _log_interaction(
+    user_service: UserService,
+    profile_writer: ProfileWriter | None,
+    summary_compactor: SummaryCompactor | RetrievalClient,
+    telegram_id: int,
+    message: str,
+    answer: str,
+):
+    """
+    Logs an exchange as two turns through the profile writer, or else in its own
+    session: the request's session is closed once the response is sent. Folding older
+    turns into the summary is left to the summary compactor.
+    """
+    turns = [Turn.create(USER_ROLE, message), Turn.create(ASSISTANT_ROLE, answer)]
+    if profile_writer:
+        unsummarized_tokens = await user_service.log_interaction(profile_writer, telegram_id, turns)
+    else:
+        async with AsyncSessionLocal() as db:
+            unsummarized_tokens = await user_service.add_interactions(db, telegram_id, turns)
+    if not isinstance(summary_compactor, RetrievalClient):
+        summary_compactor.request(telegram_id, unsummarized_tokens)
+    elif unsummarized_tokens > settings.SUMMARY_COMPACTION_HIGH_WATER_TOKENS:
+        # Below the mark the compactor ignores the request; spare the round trip
+        try:
+            await summary_compactor.request_compaction(telegram_id, unsummarized_tokens)
+        except RAGServiceError as e:
+            # The next interaction logged for the user asks again
+            logger.warning(f"Could not request a summary compaction for user {telegram_id}: {e}")
+
+async def _log_streamed_interaction(
+    user_service: UserService,
+    profile_writer: ProfileWriter | None,
+    summary_compactor: SummaryCompactor | RetrievalClient,
+    telegram_id: int,
+    message: str,
+    answer_parts: List[str],
+):
+    """Logs a streamed interaction once the full answer has been sent."""
+    answer = "".join(answer_parts).strip()
+    if answer:
+        await _log_interaction(user_service, profile_writer, summary_compactor, telegram_id, message, answer)
+
+@router.post("/stream")
+async def handle_chat_stream(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    rag_service: RAGService = Depends(get_rag_service),
+    user_service: UserService = Depends(get_user_service),
+    profile_writer: ProfileWriter | None = Depends(get_profile_writer),
+    summary_compactor: SummaryCompactor | RetrievalClient = Depends(get_summary_compactor),
+):
+    """
+    Streaming variant of the chat endpoint. The answer is sent as Server-Sent Events:
+    one `data: {"delta": "..."}` event per token batch, followed by an `event: done`.
+    A failure, even after part of the answer was sent, ends the stream with an
+    `event: error` carrying `{"error": "..."}` instead, for clients to show apart from the answer.
+    """
+    sanitized_message = _sanitize_request(request)
+    answer_parts: List[str] = []
+
+    async def event_stream():
+        try:
+            async for delta in rag_service.query_stream(
+                db=db,
+                user_query=sanitized_message,
+                user_id=request.telegram_id,
+            ):
+                answer_parts.append(delta)
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+        except (LLMServiceError, RAGServiceError) as e:
+            # A partial answer is not logged as an interaction
+            answer_parts.clear()
+            error = f"I'm sorry, but I encountered an issue: {e}"
+            yield f"event: error\ndata: {json.dumps({'error': error})}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+
+    # Background tasks run after the stream completes, when the full answer is known
+    if request.telegram_id:
+        background_tasks.add_task(
+            _log_streamed_interaction,
+            user_service,
+            profile_writer,
+            summary_compactor,
+            request.telegram_id,
+            request.message,
+            answer_parts,
+        )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,39 +1,94 @@
 import logging
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException
-from sqlalchemy.orm import Session
+import os
+import tempfile
+from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 
-from ...services.rag_service import RAGService, get_rag_service
-from ...db.session import get_db
+from ...core.config import settings
+from ...core.exceptions import RAGServiceError
+from ...core.startup import require_ready
+from ...services.document_processing import SUPPORTED_EXTENSIONS, hash_file
+from ...services.ingestion_jobs import IngestionJobQueue, IngestionQueueFullError
+from ...services.retrieval_client import RetrievalClient
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.post("/upload", status_code=201)
+def get_ingestion_jobs(request: Request) -> IngestionJobQueue | RetrievalClient:
+    """The in-process ingestion queue, or the retrieval server that owns the queue when workers share one."""
+    require_ready(request)
+    return request.app.state.retrieval_client or request.app.state.ingestion_jobs
+
+def _spool_upload(file: UploadFile) -> tuple[str, str]:
+    """Copies an upload to a temporary file in blocks; returns its path and content hash."""
+    with tempfile.NamedTemporaryFile(
+        suffix=os.path.splitext(file.filename)[1], dir=settings.INGEST_SPOOL_DIR, delete=False
+    ) as spool:
+        try:
+            return spool.name, hash_file(file.file, spool)
+        except Exception:
+            os.remove(spool.name)
+            raise
+
+@router.post("/upload", status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    rag_service: RAGService = Depends(get_rag_service),
+    priority: int = Query(0, description="Jobs with a higher priority are ingested first."),
+    ingestion_jobs: IngestionJobQueue | RetrievalClient = Depends(get_ingestion_jobs),
 ):
     """
-    Uploads a document (.txt, .md, or .pdf), processes its content, and ingests it into the knowledge base.
+    Uploads a document (.txt, .md, or .pdf) and queues it for ingestion into the knowledge base.
+    Returns a job id whose progress can be followed at `GET /api/v1/ingest/jobs/{job_id}`.
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file name provided.")
 
-    supported_extensions = {".txt", ".md", ".pdf"}
-    if not any(file.filename.endswith(ext) for ext in supported_extensions):
-        raise HTTPException(status_code=400, detail=f"Invalid file type. Supported types: {', '.join(supported_extensions)}")
+    if not any(file.filename.endswith(ext) for ext in SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail=f"Invalid file type. Supported types: {', '.join(sorted(SUPPORTED_EXTENSIONS))}")
 
     try:
-        content = await file.read()
-        await rag_service.ingest_document(
-            db=db,
-            file_name=file.filename,
-            content=content
-        )
-        return {"message": f"Successfully ingested '{file.filename}'"}
-    except HTTPException:
-        raise
+        # Spool the upload to disk in blocks instead of reading it into memory
+        path, content_hash = await run_in_threadpool(_spool_upload, file)
     except Exception as e:
-        logger.error(f"Error ingesting file {file.filename}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to ingest file: {e}")
\ No newline at end of file
+        logger.error(f"Error spooling file {file.filename}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to receive file: {e}")
+
+    try:
+        if isinstance(ingestion_jobs, RetrievalClient):
+            # The spool directory is shared with the retrieval server, which takes the file over
+            job = await ingestion_jobs.submit_ingestion(file.filename, path, content_hash, priority=priority)
+        else:
+            job = ingestion_jobs.submit(file.filename, path, content_hash, priority=priority).to_dict()
+    except IngestionQueueFullError as e:
+        os.remove(path)
+        raise HTTPException(status_code=429, detail=str(e))
+    except RAGServiceError as e:
+        os.remove(path)
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {
+        "message": f"Queued '{file.filename}' for ingestion.",
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/api/v1/ingest/jobs/{job['job_id']}",
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: str,
+    ingestion_jobs: IngestionJobQueue | RetrievalClient = Depends(get_ingestion_jobs),
+):
+    """
+    Returns the status and progress (pages extracted, chunks embedded) of an ingestion job.
+    """
+    if isinstance(ingestion_jobs, RetrievalClient):
+        try:
+            job = await ingestion_jobs.get_ingestion_job(job_id)
+        except RAGServiceError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    else:
+        job = ingestion_jobs.get(job_id)
+        job = job.to_dict() if job else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found.")
+    return job
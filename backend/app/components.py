@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict
+from fastapi.concurrency import run_in_threadpool
+
+from .core.config import settings
+from .core.startup import StartupProgress
+from .services.answer_cache import SemanticAnswerCache
+from .services.chunk_store import load_chunk_store
+from .services.embedding_models import load_embedding_model
+from .services.embedding_service import EmbeddingService, QueryEmbeddingCache
+from .services.ingestion_jobs import IngestionJobQueue
+from .services.keyword_index import build_tokenizer, load_keyword_index
+from .services.llm_service import get_llm_service
+from .services.rag_service import create_rag_service
+from .services.reranker import CrossEncoderReranker
+from .services.user_service import get_user_service
+from .services.vector_store import build_vector_store, chroma_hnsw_metadata
+
+logger = logging.getLogger(__name__)
+
+# Loading and teardown of the long-lived retrieval components (models, ChromaDB, indexes,
+# caches and the ingestion queue), kept in `app.state`. Shared by the API app, which runs
+# them in-process, and the retrieval server, which runs them once for all API workers.
+
+def _load_models(state):
+    """Loads the embedding model and optional re-ranker, then runs one inference through each."""
+    startup: StartupProgress = state.startup
+    logger.info(f"Initializing Sentence Transformer model ({settings.EMBEDDING_BACKEND} backend)...")
+    with startup.step("embedding model"):
+        state.rag_model = load_embedding_model(settings.EMBEDDING_MODEL)
+    logger.info("Model initialized.")
+
+    state.reranker = None
+    if settings.RERANKER_ENABLED:
+        logger.info(f"Loading cross-encoder re-ranker '{settings.RERANKER_MODEL}'...")
+        with startup.step("re-ranker model"):
+            from sentence_transformers import CrossEncoder
+
+            state.reranker = CrossEncoderReranker(
+                CrossEncoder(settings.RERANKER_MODEL, device="cpu"),
+                batch_size=settings.RERANKER_BATCH_SIZE,
+                cache_size=settings.RERANKER_CACHE_SIZE,
+                latency_budget_ms=settings.RERANKER_LATENCY_BUDGET_MS,
+            )
+        logger.info("Re-ranker loaded.")
+
+    # The first inference allocates buffers and initializes kernels; pay for it before taking traffic
+    with startup.step("warm-up"):
+        state.rag_model.encode(["Warm-up query."], batch_size=1)
+        if state.reranker:
+            state.reranker.model.predict([("Warm-up query.", "Warm-up passage.")], batch_size=1)
+
+def _open_stores(state):
+    """Opens ChromaDB and loads the indexes and stores kept next to it."""
+    startup: StartupProgress = state.startup
+    logger.info("Initializing ChromaDB client...")
+    with startup.step("vector database"):
+        import chromadb
+
+        state.chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
+        state.rag_collection = state.chroma_client.get_or_create_collection(
+            name=settings.COLLECTION_NAME, metadata=chroma_hnsw_metadata()
+        )
+    logger.info("ChromaDB client initialized.")
+
+    # Before the vector store, which keeps its exact embeddings in the chunk store with the flat backend
+    with startup.step("chunk store"):
+        state.chunk_store = load_chunk_store(
+            settings.CHUNK_STORE_PATH, state.rag_collection, hot_cache_size=settings.CHUNK_STORE_HOT_CACHE_SIZE
+        )
+
+    with startup.step("vector index"):
+        state.vector_store = build_vector_store(state.rag_collection, state.chunk_store)
+    logger.info(f"Vector store loaded. Backend: {settings.VECTOR_STORE_BACKEND}.")
+
+    logger.info("Loading keyword index...")
+    with startup.step("keyword index"):
+        state.keyword_index = load_keyword_index(
+            settings.KEYWORD_INDEX_PATH,
+            state.rag_collection,
+            build_tokenizer(stop_words=settings.KEYWORD_STOP_WORDS, stemming=settings.KEYWORD_STEMMING),
+        )
+    logger.info("Keyword index loaded.")
+
+async def load_components(state):
+    """
+    Loads the models and opens the stores (concurrently, in worker threads), then marks
+    the application ready. Until then, endpoints that need them answer 503.
+    """
+    startup: StartupProgress = state.startup
+    try:
+        await asyncio.gather(run_in_threadpool(_load_models, state), run_in_threadpool(_open_stores, state))
+        state.embedding_service = EmbeddingService(
+            state.rag_model,
+            max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+            max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS,
+            ingest_batch_size=settings.EMBEDDING_INGEST_BATCH_SIZE,
+            query_cache=QueryEmbeddingCache(settings.QUERY_EMBEDDING_CACHE_SIZE),
+        )
+        state.embedding_service.start()
+        startup.mark_ready()
+    except Exception as e:
+        logger.error(f"Failed to load models and indexes: {e}", exc_info=True)
+        startup.mark_failed(str(e))
+
+def start_components(state):
+    """
+    Creates the answer cache and the ingestion queue with its executors; the models and
+    stores are loaded afterwards by `load_components`.
+    """
+    state.embedding_service = None
+
+    state.answer_cache = None
+    if settings.ANSWER_CACHE_ENABLED:
+        state.answer_cache = SemanticAnswerCache(
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+            cache_personalized=settings.ANSWER_CACHE_PERSONALIZED,
+        )
+        logger.info("Semantic answer cache enabled.")
+
+    # Spawned rather than forked so workers never inherit the model's threads
+    state.extraction_pool = ProcessPoolExecutor(
+        max_workers=settings.INGEST_EXTRACTION_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    # Blocking ingestion work gets its own threads so it never starves chat requests
+    state.ingest_executor = ThreadPoolExecutor(
+        max_workers=settings.INGEST_MAX_CONCURRENT_JOBS + 1, thread_name_prefix="ingest"
+    )
+    state.ingestion_jobs = IngestionJobQueue(
+        rag_service_factory=lambda: create_rag_service(state, get_llm_service(), get_user_service(get_llm_service())),
+        concurrency=settings.INGEST_MAX_CONCURRENT_JOBS,
+        max_queued_jobs=settings.INGEST_MAX_QUEUED_JOBS,
+        max_finished_jobs=settings.INGEST_MAX_FINISHED_JOBS,
+    )
+    state.ingestion_jobs.start()
+
+async def stop_components(state):
+    """Stops the ingestion queue, the embedding service and the executors."""
+    await state.ingestion_jobs.stop()
+    if state.embedding_service:
+        await state.embedding_service.stop()
+    state.extraction_pool.shutdown(wait=False, cancel_futures=True)
+    state.ingest_executor.shutdown(wait=False, cancel_futures=True)
+
+def component_metrics(state) -> Dict[str, Any]:
+    """Runtime statistics of the in-process caches and indexes, once they are loaded."""
+    answer_cache = state.answer_cache
+    return {
+        "keyword_index": state.keyword_index.stats(),
+        "chunk_store": state.chunk_store.stats(),
+        "vector_store": state.vector_store.stats(),
+        "embedding_service": state.embedding_service.stats(),
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "reranker": state.reranker.stats() if state.reranker else None,
+        "ingestion_jobs": state.ingestion_jobs.stats(),
+    }
@@ -3,12 +3,37 @@ from pydantic import field_validator
 
 class Settings(BaseSettings):
     # Core App Settings
-    DATABASE_URL: str = "sqlite:///./greenstein.db"
+    DATABASE_URL: str = "sqlite:///./greenstein.db"  # Also used through aiosqlite / asyncpg on the request path
+    DB_POOL_SIZE: int = 10  # Connections kept open per engine
+    DB_MAX_OVERFLOW: int = 20  # Extra connections allowed under bursts
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    SQLITE_WAL_MODE: bool = True  # Readers proceed while a write is in progress
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # fsync at checkpoints rather than every commit; safe with WAL
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # How long a connection waits for the write lock before failing
+    PROFILE_WRITER_ENABLED: bool = True  # Batch interaction-log writes through one writer task
+    PROFILE_WRITER_FLUSH_MS: float = 5.0
+    PROFILE_WRITER_MAX_BATCH_SIZE: int = 256
+    USER_PROFILE_CACHE_ENABLED: bool = True  # Serve active users' profiles from memory on the chat path
+    USER_PROFILE_CACHE_MAX_ENTRIES: int = 10000
+    USER_PROFILE_CACHE_TTL_SECONDS: float = 600.0
+    INTERACTION_CONTEXT_MAX_TURNS: int = 10  # Latest turns considered for personalization, and cached per user
+    INTERACTION_CONTEXT_TOKEN_BUDGET: int = 800  # Summary plus recent turns put in a personalized prompt
+    INTERACTION_SUMMARY_MAX_CHARS: int = 1200  # Length the rolling summary is condensed to
+    SUMMARY_COMPACTION_HIGH_WATER_TOKENS: int = 1500  # Turns not yet in the summary beyond this are folded into it
+    SUMMARY_COMPACTION_LOW_WATER_TOKENS: int = 500  # ... keeping the newest turns up to this out of it
+    SUMMARY_COMPACTION_DEBOUNCE_SECONDS: float = 30.0  # Compaction waits until the user is quiet this long
+    SUMMARY_COMPACTION_MAX_DELAY_SECONDS: float = 300.0  # ... but no longer than this after the first request
+    SUMMARY_COMPACTION_MAX_BATCH_SIZE: int = 8  # Users compacted together, each with its own LLM call
     OPENAI_API_KEY: str
 
     # LLM Settings
     LLM_MODEL: str = "gpt-3.5-turbo-1106"
     LLM_TIMEOUT: int = 30
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 512
+    LLM_CACHE_TTL_SECONDS: int = 3600
+    LLM_CACHE_DB_PATH: str | None = None  # e.g. "./llm_cache.sqlite3" to add an on-disk tier
 
     # Telegram Bot Settings
     TELEGRAM_TOKEN: str
@@ -18,9 +43,57 @@ class Settings(BaseSettings):
     # RAG and VectorDB Settings
     CHROMA_PERSIST_DIR: str = "./chroma_db"
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch"  # "torch" (SentenceTransformer) or "onnx" (ONNX Runtime on CPU)
+    EMBEDDING_ONNX_DIR: str = "./models/onnx"  # Where ONNX exports are kept; created on first start
+    EMBEDDING_ONNX_QUANTIZE: bool = False  # Run the int8 dynamically quantized export
+    EMBEDDING_ONNX_THREADS: int = 0  # ONNX Runtime intra-op threads; 0 lets it decide
+    EMBEDDING_MAX_BATCH_SIZE: int = 32  # Max texts coalesced into one query-time encode call
+    EMBEDDING_MAX_WAIT_MS: float = 5.0  # How long the micro-batcher waits to fill a batch
+    EMBEDDING_INGEST_BATCH_SIZE: int = 256
+    QUERY_EMBEDDING_CACHE_SIZE: int = 2048  # Number of cached query embeddings; 0 disables the cache
     COLLECTION_NAME: str = "greenstein_collection"
     BACKEND_URL: str = "http://localhost:8000"
-    RAG_N_RESULTS: int = 2
+    STARTUP_BACKGROUND_LOADING: bool = True  # Load models and indexes after the server starts; watch /ready
+    RETRIEVAL_SERVER_SOCKET: str | None = None  # Socket of the shared retrieval server; models load in-process if unset
+    RETRIEVAL_SERVER_TIMEOUT_SECONDS: float = 30.0
+    VECTOR_STORE_BACKEND: str = "chroma"  # "chroma" (its HNSW index) or "flat" (in-process search; vectors kept out of ChromaDB)
+    VECTOR_INDEX_SPACE: str = "l2"  # Distance metric: "l2", "cosine" or "ip"; applied when the collection is created
+    HNSW_M: int = 16  # Graph links per node; more improves recall at the cost of memory
+    HNSW_CONSTRUCTION_EF: int = 100  # Candidate list size while building the graph
+    HNSW_SEARCH_EF: int = 10  # Candidate list size while searching; more improves recall at the cost of latency
+    VECTOR_INDEX_PATH: str = "./chroma_db/flat_vector_index.npz"  # Used by the "flat" backend
+    VECTOR_QUANTIZATION: str = "none"  # "flat" backend only: "none", "float16" or "int8" (per-vector scale)
+    VECTOR_RESCORE_FACTOR: int = 4  # Quantized search re-scores this many times n_results with exact vectors
+    RAG_N_RESULTS: int = 2  # Chunks passed to the LLM
+    RAG_KEYWORD_TIMEOUT_MS: float = 500.0  # Keyword search is dropped from fusion beyond this
+    RAG_SEMANTIC_TIMEOUT_MS: float = 2000.0  # Query embedding + vector search is dropped from fusion beyond this
+
+    # Cross-Encoder Re-Ranking Settings
+    RERANKER_ENABLED: bool = False
+    RERANKER_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATE_POOL: int = 20  # Candidates taken from each retriever and after fusion
+    RERANKER_BATCH_SIZE: int = 16
+    RERANKER_CACHE_SIZE: int = 10000  # Cached (query, chunk) scores; 0 disables the cache
+    RERANKER_LATENCY_BUDGET_MS: float = 300.0  # Re-ranking is truncated or skipped beyond this
+    KEYWORD_INDEX_PATH: str = "./chroma_db/bm25_index.pkl"
+    KEYWORD_STOP_WORDS: bool = True  # Drop English stop words from indexed chunks and queries
+    KEYWORD_STEMMING: bool = True  # Apply light suffix stemming to indexed chunks and queries
+    CHUNK_STORE_PATH: str = "./chroma_db/chunk_store.sqlite3"
+    CHUNK_STORE_HOT_CACHE_SIZE: int = 2048  # Frequently retrieved chunk texts kept in memory; 0 disables
+
+    # Document Ingestion Settings
+    INGEST_EXTRACTION_WORKERS: int = 2  # Worker processes extracting text from uploaded documents
+    INGEST_MAX_CONCURRENT_JOBS: int = 1  # Documents ingested at the same time by the background job queue
+    INGEST_MAX_QUEUED_JOBS: int = 100  # Uploads beyond this are rejected with 429 until the queue drains
+    INGEST_MAX_FINISHED_JOBS: int = 1000  # Finished jobs kept for the status endpoint
+    INGEST_SPOOL_DIR: str | None = None  # Where uploads and extracted pages are spooled; system temp dir if unset
+
+    # Semantic Answer Cache Settings
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_PERSONALIZED: bool = True
 
     @field_validator("OPENAI_API_KEY", "TELEGRAM_TOKEN", "BOT_USERNAME")
     def not_empty(cls, v):
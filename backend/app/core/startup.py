@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from fastapi import HTTPException, Request
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProgress:
+    """
+    Tracks the background loading of models and indexes: how long each step took, and
+    whether the application is ready to serve traffic that depends on them.
+    """
+
+    def __init__(self, started: float | None = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.status = "loading"
+        self.error: str | None = None
+        self.ready_after: float | None = None
+        self.steps: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    @contextmanager
+    def step(self, name: str):
+        """Times one loading step; steps may run concurrently in different threads."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.steps[name] = time.perf_counter() - started
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            self.steps[name] = seconds
+
+    def mark_ready(self):
+        self.ready_after = time.perf_counter() - self.started
+        self.status = "ready"
+        breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.steps.items())
+        logger.info(f"Ready after {self.ready_after:.2f}s. Startup breakdown: {breakdown}.")
+
+    def mark_failed(self, error: str):
+        self.status = "failed"
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "status": self.status,
+                "error": self.error,
+                "ready_after_seconds": self.ready_after,
+                "steps": {name: round(seconds, 3) for name, seconds in self.steps.items()},
+            }
+
+
+def require_ready(request: Request):
+    """Rejects a request with 503 while the models and indexes it needs are still loading."""
+    startup: StartupProgress = request.app.state.startup
+    if not startup.ready:
+        detail = "The service is starting up; try again shortly."
+        if startup.status == "failed":
+            detail = "The service failed to start."
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
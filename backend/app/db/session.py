@@ -1,16 +1,73 @@
-from sqlalchemy import create_engine
+from typing import Any, AsyncIterator, Dict
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from ..core.config import settings
 from ..models.base import Base
 from ..models.user import User
+from ..models.document import Document, DocumentChunk  # noqa: F401 - registers the tables
+from ..models.interaction import Interaction  # noqa: F401 - registers the table
 
-engine = create_engine(
-    settings.DATABASE_URL, 
-    connect_args={"check_same_thread": False} # Needed for SQLite
-)
+# Async drivers for the request path, by database backend
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def async_database_url(url: str) -> URL:
+    """The async-driver form of a database URL, e.g. sqlite:// -> sqlite+aiosqlite://."""
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for '{parsed.get_backend_name()}' databases.")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}")
+
+def engine_options(url: URL) -> Dict[str, Any]:
+    if url.get_backend_name() == "sqlite":
+        options: Dict[str, Any] = {"connect_args": {"check_same_thread": False}}  # Needed for SQLite
+        if url.database in (None, "", ":memory:"):
+            return options  # A single shared in-memory connection; there is no pool to size
+    else:
+        options = {"pool_pre_ping": True}
+    return {
+        **options,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    }
+
+def _apply_sqlite_pragmas(engine: Engine, url: URL):
+    """Puts every new SQLite connection in WAL mode, with relaxed fsyncs and a busy timeout."""
+    if url.get_backend_name() != "sqlite":
+        return
+    in_memory = url.database in (None, "", ":memory:")
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if settings.SQLITE_WAL_MODE and not in_memory:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        finally:
+            cursor.close()
+
+# Sync engine: schema setup, ingestion (on its own executor) and the scripts
+engine = create_engine(settings.DATABASE_URL, **engine_options(make_url(settings.DATABASE_URL)))
+
+_apply_sqlite_pragmas(engine, engine.url)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: the request path (users and chat), which must not occupy threadpool threads
+_async_url = async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(_async_url, **engine_options(_async_url))
+_apply_sqlite_pragmas(async_engine.sync_engine, _async_url)
+
+# Objects stay usable after commit, so nothing needs a refresh round trip
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -18,9 +75,27 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _add_missing_columns():
+    """Adds nullable columns introduced after a table was first created (create_all never alters tables)."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(dialect=engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
 def init_db():
     # Create all tables in the database.
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
 
     # Add dummy data for testing and demonstration
     db = SessionLocal()
@@ -1,41 +1,102 @@
+import time
+
+# Taken before the imports below, so the startup breakdown includes them
+_PROCESS_STARTED = time.perf_counter()
+
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-import chromadb
-from sentence_transformers import SentenceTransformer
+from fastapi.responses import JSONResponse
 
 from .api.v1 import chat as chat_v1, agents as agents_v1, ingest
-from .db.session import init_db
+from .components import component_metrics, load_components, start_components, stop_components
+from .core.exceptions import RAGServiceError
+from .db.session import AsyncSessionLocal, async_engine, init_db
+from .services.llm_service import get_llm_service
+from .services.profile_writer import ProfileWriter
+from .services.summary_compaction import build_summary_compactor
+from .services.user_service import get_user_service
+from .services.retrieval_client import RetrievalClient
 from .core.config import settings
+from .core.startup import StartupProgress
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Handle startup and shutdown events.
     """
     logger.info("Starting up Greenstein AI Backend...")
-    
-    # Initialize and store expensive components in app.state
-    logger.info("Initializing Sentence Transformer model...")
-    app.state.rag_model = SentenceTransformer(settings.EMBEDDING_MODEL)
-    logger.info("Model initialized.")
-    
-    logger.info("Initializing ChromaDB client...")
-    app.state.chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
-    app.state.rag_collection = app.state.chroma_client.get_or_create_collection(name=settings.COLLECTION_NAME)
-    logger.info("ChromaDB client initialized.")
+    app.state.startup = StartupProgress(started=_PROCESS_STARTED)
+    app.state.startup.record("imports", time.perf_counter() - _PROCESS_STARTED)
+
+    # With a retrieval server, every worker shares its models, ChromaDB and indexes
+    # instead of loading its own copy; run it first with `python -m app.retrieval_server`.
+    app.state.retrieval_client = None
+    if settings.RETRIEVAL_SERVER_SOCKET:
+        app.state.retrieval_client = RetrievalClient(
+            settings.RETRIEVAL_SERVER_SOCKET, timeout=settings.RETRIEVAL_SERVER_TIMEOUT_SECONDS
+        )
+        logger.info(f"Using the retrieval server at '{settings.RETRIEVAL_SERVER_SOCKET}'.")
+    else:
+        start_components(app.state)
 
     # NOTE: For production, database initialization should be handled by a migration
-    # tool like Alembic. This is included for convenience in development.
-    init_db()
-    logger.info("Database initialized.")
+    # tool like Alembic. This is included for convenience in development. The retrieval
+    # server initializes it when there is one; without one, run a single worker.
+    if not app.state.retrieval_client:
+        with app.state.startup.step("database"):
+            init_db()
+        logger.info("Database initialized.")
+
+    # Interaction logs from this worker's concurrent chats are written in batches by one writer task
+    app.state.profile_writer = None
+    if settings.PROFILE_WRITER_ENABLED:
+        app.state.profile_writer = ProfileWriter(
+            AsyncSessionLocal,
+            flush_interval_ms=settings.PROFILE_WRITER_FLUSH_MS,
+            max_batch_size=settings.PROFILE_WRITER_MAX_BATCH_SIZE,
+        )
+        app.state.profile_writer.start()
+
+    # Older turns are folded into the users' summaries in the background, debounced per
+    # user; by the retrieval server when there is one, so workers share one compactor
+    app.state.summary_compactor = None
+    if not app.state.retrieval_client:
+        app.state.summary_compactor = build_summary_compactor(
+            get_user_service(get_llm_service()), AsyncSessionLocal, profile_writer=app.state.profile_writer
+        )
+        app.state.summary_compactor.start()
+
+    # Models and indexes load in the background so the server answers /health at once;
+    # /ready turns 200 once they are loaded and warm.
+    if app.state.retrieval_client:
+        app.state.loading_task = asyncio.create_task(app.state.retrieval_client.wait_until_ready(app.state.startup))
+    else:
+        app.state.loading_task = asyncio.create_task(load_components(app.state))
+    if not settings.STARTUP_BACKGROUND_LOADING:
+        await app.state.loading_task
 
     yield
     
     logger.info("Shutting down Greenstein AI Backend...")
+    if not app.state.loading_task.done():
+        app.state.loading_task.cancel()
+        await asyncio.gather(app.state.loading_task, return_exceptions=True)
+    if app.state.retrieval_client:
+        await app.state.retrieval_client.close()
+    else:
+        await stop_components(app.state)
+    # Stopped first: a compaction in flight may still queue a write
+    if app.state.summary_compactor:
+        await app.state.summary_compactor.stop()
+    if app.state.profile_writer:
+        await app.state.profile_writer.stop()
+    await async_engine.dispose()
 
 app = FastAPI(title="Greenstein AI Backend", lifespan=lifespan)
 
@@ -46,5 +107,34 @@ app.include_router(ingest.router, prefix="/api/v1/ingest", tags=["v1", "Ingestio
 
 @app.get("/health", tags=["Monitoring"])
 async def health_check():
+    """Liveness: the process is up and serving requests, whether or not the models are loaded yet."""
     return {"status": "ok"}
 
+@app.get("/ready", tags=["Monitoring"])
+async def readiness_check():
+    """Readiness: 200 once the models and indexes (or the retrieval server) are loaded and warmed up, 503 until then."""
+    startup: StartupProgress = app.state.startup
+    return JSONResponse(status_code=200 if startup.ready else 503, content=startup.to_dict())
+
+@app.get("/metrics", tags=["Monitoring"])
+async def metrics():
+    """Reports runtime statistics of the caches and indexes, in-process or in the retrieval server."""
+    if not app.state.startup.ready:
+        return JSONResponse(status_code=503, content={"startup": app.state.startup.to_dict()})
+    profile_cache = get_user_service(get_llm_service()).profile_cache
+    if app.state.retrieval_client:
+        try:
+            components = {"retrieval_server": await app.state.retrieval_client.metrics()}
+        except RAGServiceError as e:
+            components = {"retrieval_server": {"error": str(e)}}
+    else:
+        components = component_metrics(app.state)
+    return {
+        "startup": app.state.startup.to_dict(),
+        **components,
+        "llm_cache": get_llm_service().cache_stats(),
+        "llm_usage": get_llm_service().usage_stats(),
+        "profile_writer": app.state.profile_writer.stats() if app.state.profile_writer else None,
+        "profile_cache": profile_cache.stats() if profile_cache else None,
+        "summary_compaction": app.state.summary_compactor.stats() if app.state.summary_compactor else None,
+    }
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, func
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, func
+from sqlalchemy.orm import relationship
 from .base import Base
 
 class Document(Base):
@@ -7,4 +8,27 @@ class Document(Base):
     id = Column(Integer, primary_key=True, index=True)
     file_name = Column(String, unique=True, index=True, nullable=False)
     source = Column(String, nullable=False)
+    # SHA-256 of the raw file content; NULL for documents ingested before hashing was introduced
+    content_hash = Column(String(64), index=True, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    chunks = relationship(
+        "DocumentChunk", back_populates="document", cascade="all, delete-orphan", order_by="DocumentChunk.position"
+    )
+
+
+class DocumentChunk(Base):
+    """One chunk of a document as stored in the vector store and keyword index."""
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    # The id under which the chunk is stored in ChromaDB and the keyword index
+    chunk_id = Column(String, unique=True, nullable=False)
+    # SHA-256 of the chunk text, used to skip unchanged chunks and reuse embeddings of identical ones
+    content_hash = Column(String(64), index=True, nullable=False)
+    position = Column(Integer, nullable=False)
+    # 1-based page number for paginated formats such as PDF
+    page = Column(Integer, nullable=True)
+
+    document = relationship("Document", back_populates="chunks")
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text, func
+
+from .base import Base
+
+
+class Interaction(Base):
+    """One turn of a user's conversation with the assistant. Rows are only ever appended."""
+    __tablename__ = "interactions"
+    # Serves "the last N turns of a user" without sorting their whole history
+    __table_args__ = (Index("ix_interactions_user_id_created_at", "user_id", "created_at"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    role = Column(String(16), nullable=False)  # "user" or "assistant"
+    text = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=False)
@@ -14,8 +14,10 @@ class User(Base):
     # Use MutableList to ensure changes to the list are tracked by SQLAlchemy
     interests = Column(MutableList.as_mutable(JSON), default=lambda: [])  
 
-    # Storing a summary of past interactions as text
+    # Rolling summary of past interactions; the turns themselves are in the interactions table
     interaction_summary = Column(Text, nullable=True, default='')
+    # The last interaction folded into the summary; later ones are used verbatim
+    summarized_interaction_id = Column(Integer, nullable=True)
 
     # Add created_at and updated_at timestamps
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -0,0 +1,159 @@
+import time
+
+# Taken before the imports below, so the startup breakdown includes them
+_PROCESS_STARTED = time.perf_counter()
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import List
+
+import numpy as np
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from .components import component_metrics, load_components, start_components, stop_components
+from .core.config import settings
+from .core.startup import StartupProgress, require_ready
+from .db.session import AsyncSessionLocal, async_engine, init_db
+from .services.ingestion_jobs import IngestionJobQueue, IngestionQueueFullError
+from .services.llm_service import PromptStrategy, get_llm_service
+from .services.rag_service import RAGService, create_rag_service
+from .services.summary_compaction import build_summary_compactor
+from .services.user_service import get_user_service
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One process holds the embedding model, re-ranker, ChromaDB client, indexes, answer cache
+# and ingestion queue, and serves them over a Unix socket to any number of API workers
+# (`uvicorn app.main:app --workers N` with RETRIEVAL_SERVER_SOCKET set). The model weights
+# are loaded once, and ChromaDB and the indexes have a single writer. It also creates the
+# database tables and runs summary compaction for all workers.
+# Run with: python -m app.retrieval_server
+
+class RetrieveRequest(BaseModel):
+    query: str
+    strategy: PromptStrategy
+    user_id: int | None = None
+
+class StoreAnswerRequest(BaseModel):
+    query_embedding: List[float]
+    strategy: PromptStrategy
+    answer: str
+    user_id: int | None = None
+    cache_generation: int | None = None
+
+class IngestionRequest(BaseModel):
+    file_name: str
+    path: str
+    content_hash: str
+    priority: int = 0
+
+class CompactionRequest(BaseModel):
+    telegram_id: int
+    unsummarized_tokens: int
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Starting up Greenstein retrieval server...")
+    app.state.startup = StartupProgress(started=_PROCESS_STARTED)
+    app.state.startup.record("imports", time.perf_counter() - _PROCESS_STARTED)
+    start_components(app.state)
+    # Ingestion jobs record documents in the database. Run here, before the socket
+    # listens, so API workers never race to create the tables or seed them.
+    with app.state.startup.step("database"):
+        init_db()
+    # One compactor for every worker, so a user's requests are debounced and compacted once
+    app.state.summary_compactor = build_summary_compactor(get_user_service(get_llm_service()), AsyncSessionLocal)
+    app.state.summary_compactor.start()
+    app.state.loading_task = asyncio.create_task(load_components(app.state))
+
+    yield
+
+    logger.info("Shutting down Greenstein retrieval server...")
+    if not app.state.loading_task.done():
+        app.state.loading_task.cancel()
+        await asyncio.gather(app.state.loading_task, return_exceptions=True)
+    await stop_components(app.state)
+    await app.state.summary_compactor.stop()
+    await async_engine.dispose()
+
+app = FastAPI(title="Greenstein Retrieval Server", lifespan=lifespan)
+
+def get_local_rag_service(request: Request) -> RAGService:
+    require_ready(request)
+    return create_rag_service(request.app.state, get_llm_service(), get_user_service(get_llm_service()))
+
+def get_ingestion_jobs(request: Request) -> IngestionJobQueue:
+    require_ready(request)
+    return request.app.state.ingestion_jobs
+
+@app.post("/retrieve")
+async def retrieve(body: RetrieveRequest, rag_service: RAGService = Depends(get_local_rag_service)):
+    """Runs the answer cache lookup and hybrid retrieval for one query."""
+    retrieval = await rag_service.retrieve(body.query, body.strategy, body.user_id)
+    query_embedding = retrieval.query_embedding
+    return {
+        "documents": retrieval.documents,
+        "answer": retrieval.answer,
+        "query_embedding": np.asarray(query_embedding, dtype=np.float32).tolist() if query_embedding is not None else None,
+        "cache_generation": retrieval.cache_generation,
+    }
+
+@app.post("/answers", status_code=204)
+async def store_answer(body: StoreAnswerRequest, rag_service: RAGService = Depends(get_local_rag_service)):
+    """Caches an answer an API worker generated from a previous retrieval."""
+    await rag_service.store_answer(body.query_embedding, body.strategy, body.answer, body.user_id, body.cache_generation)
+
+@app.post("/ingest/jobs", status_code=202)
+async def submit_ingestion_job(body: IngestionRequest, ingestion_jobs: IngestionJobQueue = Depends(get_ingestion_jobs)):
+    """Queues a document an API worker spooled to disk; the queue takes ownership of the file."""
+    try:
+        return ingestion_jobs.submit(body.file_name, body.path, body.content_hash, priority=body.priority).to_dict()
+    except IngestionQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.get("/ingest/jobs/{job_id}")
+async def get_ingestion_job(job_id: str, ingestion_jobs: IngestionJobQueue = Depends(get_ingestion_jobs)):
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found.")
+    return job.to_dict()
+
+@app.post("/compactions", status_code=204)
+async def request_compaction(body: CompactionRequest):
+    """Schedules the summary compaction an API worker asked for after logging an interaction."""
+    app.state.summary_compactor.request(body.telegram_id, body.unsummarized_tokens)
+
+@app.get("/ready")
+async def readiness_check():
+    startup: StartupProgress = app.state.startup
+    return JSONResponse(status_code=200 if startup.ready else 503, content=startup.to_dict())
+
+@app.get("/metrics")
+async def metrics():
+    if not app.state.startup.ready:
+        return JSONResponse(status_code=503, content={"startup": app.state.startup.to_dict()})
+    return {
+        "startup": app.state.startup.to_dict(),
+        **component_metrics(app.state),
+        "llm_usage": get_llm_service().usage_stats(),
+        "summary_compaction": app.state.summary_compactor.stats(),
+    }
+
+def main():
+    import uvicorn
+
+    socket_path = settings.RETRIEVAL_SERVER_SOCKET
+    if not socket_path:
+        raise SystemExit("Set RETRIEVAL_SERVER_SOCKET to the Unix socket the retrieval server listens on.")
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # Left behind by a previous run
+    uvicorn.run(app, uds=socket_path, workers=1)
+
+if __name__ == "__main__":
+    main()
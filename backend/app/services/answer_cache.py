@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .llm_service import PromptStrategy
+
+logger = logging.getLogger(__name__)
+
+# Strategies whose answers depend on the asking user and must never be served to anyone else.
+PER_USER_STRATEGIES = {PromptStrategy.PERSONALIZE_RESPONSE}
+
+Scope = Tuple[PromptStrategy, int | None]
+
+
+@dataclass
+class _CacheEntry:
+    scope: Scope
+    vector: np.ndarray
+    answer: str
+    expires_at: float
+
+
+class _ScopeIndex:
+    """The normalized query embeddings of all cached answers within one scope."""
+
+    def __init__(self, dim: int):
+        self.keys: List[int] = []
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+    def add(self, key: int, vector: np.ndarray):
+        self.keys.append(key)
+        self.vectors = np.vstack([self.vectors, vector[np.newaxis, :]])
+
+    def remove(self, key: int):
+        pos = self.keys.index(key)
+        del self.keys[pos]
+        self.vectors = np.delete(self.vectors, pos, axis=0)
+
+    def matches(self, vector: np.ndarray, threshold: float) -> List[Tuple[int, float]]:
+        """The (key, similarity) of every cached query at least `threshold` similar, nearest first."""
+        if not self.keys:
+            return []
+        similarities = self.vectors @ vector
+        rows = np.flatnonzero(similarities >= threshold)
+        rows = rows[np.argsort(-similarities[rows], kind="stable")]
+        return [(self.keys[row], float(similarities[row])) for row in rows]
+
+
+class SemanticAnswerCache:
+    """
+    Caches final RAG answers keyed by the query embedding.
+
+    A lookup returns the answer of the most similar unexpired cached query within the
+    same scope whose cosine similarity clears the threshold; expired matches it passes
+    over are evicted. Scopes are per prompt strategy, and
+    additionally per user for personalized strategies, so personalized answers never
+    leak across users. Entries expire after a TTL, the cache is bounded with LRU
+    eviction, and `invalidate` drops everything when the knowledge base changes.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        similarity_threshold: float,
+        cache_personalized: bool = True,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.cache_personalized = cache_personalized
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._scopes: Dict[Scope, _ScopeIndex] = {}
+        self._next_key = 0
+        # Incremented on every invalidation so answers computed against an older
+        # knowledge base can be recognised and dropped instead of being stored.
+        self.generation = 0
+        self._metrics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def _scope(self, strategy: PromptStrategy, user_id: int | None) -> Scope | None:
+        """Returns the scope an answer belongs to, or None if it must not be cached."""
+        if strategy in PER_USER_STRATEGIES:
+            if not self.cache_personalized or user_id is None:
+                return None
+            return (strategy, user_id)
+        return (strategy, None)
+
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: Any, strategy: PromptStrategy, user_id: int | None = None) -> str | None:
+        """Returns a cached answer for a semantically equivalent query, if any."""
+        scope = self._scope(strategy, user_id)
+        if scope is None:
+            return None
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            index = self._scopes.get(scope)
+            matches = index.matches(vector, self.similarity_threshold) if index else []
+            now = time.monotonic()
+            for key, similarity in matches:
+                entry = self._entries[key]
+                if entry.expires_at <= now:
+                    self._evict(key)
+                    self._metrics["expirations"] += 1
+                    continue
+                self._entries.move_to_end(key)
+                self._metrics["hits"] += 1
+                logger.debug(f"Answer cache hit in scope {scope} (similarity {similarity:.3f}).")
+                return entry.answer
+            self._metrics["misses"] += 1
+            return None
+
+    def store(
+        self,
+        embedding: Any,
+        strategy: PromptStrategy,
+        answer: str,
+        user_id: int | None = None,
+        generation: int | None = None,
+    ):
+        """
+        Caches an answer for the given query embedding. If `generation` is given and the
+        cache has been invalidated since it was read, the answer is stale and is dropped.
+        """
+        scope = self._scope(strategy, user_id)
+        if scope is None or self.max_entries <= 0:
+            return
+        vector = self._normalize(embedding)
+
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = _CacheEntry(scope, vector, answer, time.monotonic() + self.ttl_seconds)
+            index = self._scopes.get(scope)
+            if index is None:
+                index = self._scopes[scope] = _ScopeIndex(vector.shape[0])
+            index.add(key, vector)
+            self._metrics["stores"] += 1
+
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._evict(oldest_key)
+                self._metrics["evictions"] += 1
+
+    def _evict(self, key: int):
+        entry = self._entries.pop(key)
+        index = self._scopes[entry.scope]
+        index.remove(key)
+        if not index.keys:
+            del self._scopes[entry.scope]
+
+    def invalidate(self):
+        """Drops every cached answer, e.g. after the knowledge base has changed."""
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+            self.generation += 1
+            self._metrics["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._metrics["hits"] + self._metrics["misses"]
+            return {
+                **self._metrics,
+                "entries": len(self._entries),
+                "scopes": len(self._scopes),
+                "hit_ratio": self._metrics["hits"] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,189 @@
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of chunks fetched per page when rebuilding the store from the collection.
+REBUILD_PAGE_SIZE = 1000
+
+# Keeps `IN (...)` lookups below SQLite's bound-parameter limit
+_IN_CLAUSE_BATCH = 500
+
+
+class ChunkStore:
+    """
+    Chunk texts keyed by chunk id, so the query path fetches exactly the chunks it
+    passes on instead of going back to ChromaDB.
+
+    Texts live in a SQLite table whose primary key is the chunk id, so a lookup is a
+    B-tree probe per id. It is written at ingest time alongside ChromaDB and the keyword
+    index. Frequently retrieved chunks are kept in an in-memory LRU (`hot_cache_size`
+    entries); chunk ids are derived from chunk content, so a cached text never goes stale.
+
+    With the flat vector store, the table also holds each chunk's exact float32 embedding,
+    which ChromaDB then does not keep: the flat index re-scores and rebuilds from here.
+    """
+
+    def __init__(self, path: str, hot_cache_size: int = 2048):
+        self.path = path
+        self.hot_cache_size = hot_cache_size
+        self._lock = threading.Lock()
+        self._hot: "OrderedDict[str, str]" = OrderedDict()
+        self._metrics = {"lookups": 0, "hot_hits": 0, "disk_hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, text TEXT NOT NULL, embedding BLOB) WITHOUT ROWID"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "embedding" not in columns:
+            # Stores created before embeddings were kept here
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN embedding BLOB")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _remember(self, chunk_id: str, text: str):
+        if self.hot_cache_size <= 0:
+            return
+        self._hot[chunk_id] = text
+        self._hot.move_to_end(chunk_id)
+        while len(self._hot) > self.hot_cache_size:
+            self._hot.popitem(last=False)
+
+    def add_chunks(
+        self, chunk_ids: Sequence[str], texts: Sequence[str], embeddings: Sequence[Sequence[float]] | None = None
+    ):
+        """
+        Stores (or replaces) the texts of the given chunks, and their embeddings if given.
+        Without `embeddings`, the embedding already stored for a chunk is kept.
+        """
+        with self._lock:
+            if embeddings is None:
+                self._conn.executemany(
+                    "INSERT INTO chunks (chunk_id, text) VALUES (?, ?) ON CONFLICT (chunk_id) DO UPDATE SET text = excluded.text",
+                    zip(chunk_ids, texts),
+                )
+            else:
+                blobs = (np.asarray(vector, dtype=np.float32).tobytes() for vector in embeddings)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (chunk_id, text, embedding) VALUES (?, ?, ?)", zip(chunk_ids, texts, blobs)
+                )
+            self._conn.commit()
+
+    def remove_chunks(self, chunk_ids: Iterable[str]):
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", ((chunk_id,) for chunk_id in chunk_ids))
+            self._conn.commit()
+            for chunk_id in chunk_ids:
+                self._hot.pop(chunk_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+            self._hot.clear()
+
+    def get_chunks(self, chunk_ids: Sequence[str]) -> Dict[str, str]:
+        """
+        Returns the texts of the given chunks, keyed by chunk id. Ids that are not stored
+        are left out. Blocking; call from a worker thread.
+        """
+        found: Dict[str, str] = {}
+        with self._lock:
+            self._metrics["lookups"] += 1
+            missing: List[str] = []
+            for chunk_id in chunk_ids:
+                text = self._hot.get(chunk_id)
+                if text is None:
+                    missing.append(chunk_id)
+                else:
+                    self._hot.move_to_end(chunk_id)
+                    found[chunk_id] = text
+                    self._metrics["hot_hits"] += 1
+
+            for start in range(0, len(missing), _IN_CLAUSE_BATCH):
+                batch = missing[start:start + _IN_CLAUSE_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id, text FROM chunks WHERE chunk_id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                for chunk_id, text in rows:
+                    found[chunk_id] = text
+                    self._remember(chunk_id, text)
+                self._metrics["disk_hits"] += len(rows)
+                self._metrics["misses"] += len(batch) - len(rows)
+        return found
+
+    def get_embeddings(self, chunk_ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        Returns the stored float32 embeddings of the given chunks, keyed by chunk id. Ids
+        without one are left out. Always read from disk; blocking.
+        """
+        found: Dict[str, np.ndarray] = {}
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            for start in range(0, len(chunk_ids), _IN_CLAUSE_BATCH):
+                batch = chunk_ids[start:start + _IN_CLAUSE_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT chunk_id, embedding FROM chunks "
+                    f"WHERE embedding IS NOT NULL AND chunk_id IN ({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                found.update((chunk_id, np.frombuffer(blob, dtype=np.float32)) for chunk_id, blob in rows)
+        return found
+
+    def iter_embeddings(self, page_size: int = REBUILD_PAGE_SIZE) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """Yields the ids and stacked embeddings of every chunk that has one, a page at a time."""
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT chunk_id, embedding FROM chunks WHERE embedding IS NOT NULL AND chunk_id > ? "
+                    "ORDER BY chunk_id LIMIT ?",
+                    (last_id, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [chunk_id for chunk_id, _ in rows], np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+
+    def chunk_ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks")}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, "hot_entries": len(self._hot)}
+
+
+def load_chunk_store(path: str, collection, hot_cache_size: int = 2048) -> ChunkStore:
+    """
+    Opens the chunk store, syncing it with the ChromaDB collection when it is missing or
+    out of sync with the collection. Syncing keeps the stored embeddings: ingestion
+    writes a chunk here before ChromaDB and deletes it after, so the store can only hold
+    extra chunks, which are dropped.
+    """
+    store = ChunkStore(path, hot_cache_size=hot_cache_size)
+    collection_size = collection.count()
+    if len(store) == collection_size:
+        logger.info(f"Loaded chunk store with {collection_size} chunks from '{path}'.")
+        return store
+
+    logger.info(f"Syncing chunk store with {collection_size} chunks in the collection...")
+    collection_ids: Set[str] = set()
+    for offset in range(0, collection_size, REBUILD_PAGE_SIZE):
+        page = collection.get(include=["documents"], limit=REBUILD_PAGE_SIZE, offset=offset)
+        store.add_chunks(page["ids"], page["documents"])
+        collection_ids.update(page["ids"])
+    store.remove_chunks(store.chunk_ids() - collection_ids)
+    logger.info(f"Chunk store synced with {len(store)} chunks.")
+    return store
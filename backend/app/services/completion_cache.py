@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Tuple, Type
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Expired rows of the on-disk tier are deleted by the first write after this interval
+_PURGE_INTERVAL_SECONDS = 300.0
+
+
+def make_cache_key(model: str, system_prompt: str, user_prompt: str, response_model: Type[BaseModel] | None) -> str:
+    """Hashes the fully rendered request, including the response schema for structured calls."""
+    payload = {
+        "model": model,
+        "system": system_prompt,
+        "user": user_prompt,
+        "response_model": None,
+    }
+    if response_model:
+        payload["response_model"] = {
+            "name": f"{response_model.__module__}.{response_model.__qualname__}",
+            "schema": response_model.model_json_schema(),
+        }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def serialize_response(response: str | BaseModel) -> str:
+    """Serializes a plain-text or `instructor` structured response for storage."""
+    if isinstance(response, BaseModel):
+        return json.dumps({"type": "model", "content": response.model_dump_json()})
+    return json.dumps({"type": "text", "content": response})
+
+
+def deserialize_response(value: str, response_model: Type[BaseModel] | None) -> str | BaseModel:
+    """Rehydrates a stored response into a string or an instance of `response_model`."""
+    data = json.loads(value)
+    if data["type"] == "model":
+        if response_model is None:
+            raise ValueError("A structured response was cached for an unstructured request.")
+        return response_model.model_validate_json(data["content"])
+    return data["content"]
+
+
+class CompletionCache(ABC):
+    """Abstract base class for a tier of the LLM completion cache."""
+
+    @abstractmethod
+    async def get_entry(self, key: str) -> Tuple[str, float] | None:
+        """Returns the serialized response stored under `key` and the seconds it has left, if any."""
+        pass
+
+    async def get(self, key: str) -> str | None:
+        """Returns the serialized response stored under `key`, if any."""
+        entry = await self.get_entry(key)
+        return entry[0] if entry else None
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl_seconds: float | None = None):
+        """Stores a serialized response under `key`, for `ttl_seconds` or the tier's TTL."""
+        pass
+
+
+class InMemoryCompletionCache(CompletionCache):
+    """An in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    async def get_entry(self, key: str) -> Tuple[str, float] | None:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value, remaining
+
+    async def set(self, key: str, value: str, ttl_seconds: float | None = None):
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        self._entries[key] = (value, time.monotonic() + ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SQLiteCompletionCache(CompletionCache):
+    """An on-disk cache tier backed by a SQLite file, shared across restarts and workers."""
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_completions_expires_at ON completions (expires_at)")
+        self._conn.commit()
+        self._purged_at = 0.0
+        with self._lock:
+            self._purge_expired(time.time())
+
+    def _purge_expired(self, now: float):
+        """Deletes expired rows; they are never read again. Called with the lock held."""
+        deleted = self._conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,)).rowcount
+        self._conn.commit()
+        self._purged_at = now
+        if deleted:
+            logger.debug(f"Deleted {deleted} expired completions from the on-disk cache.")
+
+    def _get_entry(self, key: str) -> Tuple[str, float] | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM completions WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return (row[0], row[1] - now) if row else None
+
+    def _set(self, key: str, value: str, ttl_seconds: float | None):
+        now = time.time()
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl_seconds),
+            )
+            self._conn.commit()
+            if now - self._purged_at >= _PURGE_INTERVAL_SECONDS:
+                self._purge_expired(now)
+
+    async def get_entry(self, key: str) -> Tuple[str, float] | None:
+        return await run_in_threadpool(self._get_entry, key)
+
+    async def set(self, key: str, value: str, ttl_seconds: float | None = None):
+        await run_in_threadpool(self._set, key, value, ttl_seconds)
+
+
+class TieredCompletionCache(CompletionCache):
+    """
+    Chains cache tiers from fastest to slowest, promoting hits into the faster tiers.
+    A promoted entry keeps the expiry it had, rather than starting a new TTL.
+    """
+
+    def __init__(self, tiers: List[CompletionCache]):
+        self.tiers = tiers
+
+    async def get_entry(self, key: str) -> Tuple[str, float] | None:
+        for i, tier in enumerate(self.tiers):
+            entry = await tier.get_entry(key)
+            if entry is not None:
+                value, remaining = entry
+                for faster_tier in self.tiers[:i]:
+                    await faster_tier.set(key, value, ttl_seconds=remaining)
+                return entry
+        return None
+
+    async def set(self, key: str, value: str, ttl_seconds: float | None = None):
+        for tier in self.tiers:
+            await tier.set(key, value, ttl_seconds=ttl_seconds)
+
+
+def build_completion_cache() -> CompletionCache | None:
+    """Builds the completion cache described by the application settings."""
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    tiers: List[CompletionCache] = [
+        InMemoryCompletionCache(settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_TTL_SECONDS)
+    ]
+    if settings.LLM_CACHE_DB_PATH:
+        tiers.append(SQLiteCompletionCache(settings.LLM_CACHE_DB_PATH, settings.LLM_CACHE_TTL_SECONDS))
+        logger.info(f"LLM completion cache persisted to '{settings.LLM_CACHE_DB_PATH}'.")
+    return tiers[0] if len(tiers) == 1 else TieredCompletionCache(tiers)
@@ -0,0 +1,141 @@
+import codecs
+import hashlib
+import json
+import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, List, Tuple
+
+from ..core.exceptions import RAGServiceError
+
+if TYPE_CHECKING:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+logger = logging.getLogger(__name__)
+
+# Shared by the API ingestion path and the bulk ingestion script so chunk ids line up.
+SUPPORTED_EXTENSIONS = {".txt", ".md", ".pdf"}
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Text files are split in segments of about this many characters, broken at line ends,
+# so they are never held in memory whole. PDFs are split page by page.
+TEXT_SEGMENT_CHARS = 64 * 1024
+READ_BLOCK_BYTES = 1024 * 1024
+
+# A unit of extracted text: (page number or None for plain text, text)
+Page = Tuple[int | None, str]
+
+
+@lru_cache()
+def get_text_splitter() -> "RecursiveCharacterTextSplitter":
+    # Imported on first use rather than at startup; langchain is slow to import
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def iter_pdf_pages(path: str) -> Iterator[Page]:
+    """Yields the text of a PDF one page at a time, with 1-based page numbers."""
+    import pypdf
+
+    try:
+        pdf_reader = pypdf.PdfReader(path)
+        for number, page in enumerate(pdf_reader.pages, start=1):
+            text = page.extract_text()
+            if text:
+                yield number, text
+    except pypdf.errors.PdfReadError as e:
+        logger.error(f"Failed to read PDF: {e}")
+        raise RAGServiceError("Could not process PDF file. It may be corrupt or unsupported.")
+
+
+def _detect_text_encoding(path: str) -> str:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            while block := f.read(READ_BLOCK_BYTES):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def iter_text_segments(path: str, file_name: str) -> Iterator[Page]:
+    """Yields a text file in segments of about `TEXT_SEGMENT_CHARS`, broken at line ends."""
+    encoding = _detect_text_encoding(path)
+    if encoding != "utf-8":
+        logger.warning(f"UTF-8 decoding failed for {file_name}, trying latin-1.")
+    segment: List[str] = []
+    size = 0
+    with open(path, "r", encoding=encoding, errors="ignore") as f:
+        for line in f:
+            segment.append(line)
+            size += len(line)
+            if size >= TEXT_SEGMENT_CHARS:
+                yield None, "".join(segment)
+                segment, size = [], 0
+    if segment:
+        yield None, "".join(segment)
+
+
+def iter_pages(path: str, file_name: str) -> Iterator[Page]:
+    """Yields the extracted text of a supported document (.pdf, .txt, .md) incrementally."""
+    if file_name.endswith(".pdf"):
+        return iter_pdf_pages(path)
+    return iter_text_segments(path, file_name)
+
+
+def iter_chunks(pages: Iterable[Page]) -> Iterator[Tuple[str, int | None]]:
+    """Splits pages into chunks as they arrive, tagging each chunk with its page number."""
+    splitter = get_text_splitter()
+    for page_number, text in pages:
+        if not text.strip():
+            continue
+        for chunk in splitter.split_text(text):
+            yield chunk, page_number
+
+
+def spool_pages(path: str, file_name: str, spool_path: str) -> int:
+    """
+    Extracts a document page by page into a JSON-lines spool file and returns the number
+    of pages written. Runs in a worker process, so large PDFs never block the event loop's
+    threadpool and only one page is held in memory at a time.
+    """
+    count = 0
+    with open(spool_path, "w", encoding="utf-8") as spool:
+        for page_number, text in iter_pages(path, file_name):
+            spool.write(json.dumps([page_number, text]) + "\n")
+            count += 1
+    return count
+
+
+def read_spooled_pages(spool_path: str) -> Iterator[Page]:
+    """Reads back the pages written by `spool_pages`, one at a time."""
+    with open(spool_path, "r", encoding="utf-8") as spool:
+        for line in spool:
+            page_number, text = json.loads(line)
+            yield page_number, text
+
+
+def hash_content(content: bytes | str) -> str:
+    """Returns the SHA-256 hex digest of a file's bytes or a chunk's text."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_file(f: BinaryIO, copy_to: BinaryIO | None = None) -> str:
+    """Returns the SHA-256 hex digest of a binary file object, read in blocks and optionally copied to `copy_to`."""
+    digest = hashlib.sha256()
+    while block := f.read(READ_BLOCK_BYTES):
+        digest.update(block)
+        if copy_to is not None:
+            copy_to.write(block)
+    if copy_to is not None:
+        copy_to.flush()
+    return digest.hexdigest()
+
+
+def make_chunk_id(file_name: str, chunk_hash: str) -> str:
+    """Chunk ids are derived from the chunk content, so an unchanged chunk keeps its id across versions."""
+    return f"{file_name}_{chunk_hash[:16]}"
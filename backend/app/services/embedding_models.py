@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model.int8.onnx"
+ONNX_CONFIG_FILE = "embedding_config.json"
+
+
+def onnx_model_dir(model_name: str, base_dir: str | None = None) -> str:
+    """Where the ONNX export of `model_name` lives."""
+    return os.path.join(base_dir or settings.EMBEDDING_ONNX_DIR, model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name: str, output_dir: str, quantize: bool = False) -> str:
+    """
+    Exports the transformer of a SentenceTransformer model to ONNX, together with its
+    tokenizer and pooling configuration, and optionally an int8 dynamically quantized
+    copy. Needs PyTorch; only runs once per model. Returns `output_dir`.
+    """
+    # Only needed to export, so serving an exported model never imports them
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    model = SentenceTransformer(model_name, device="cpu")
+    pooling = next((module for module in model if isinstance(module, Pooling)), None)
+    if pooling is not None and pooling.pooling_mode_mean_tokens:
+        pooling_mode = "mean"
+    elif pooling is not None and pooling.pooling_mode_cls_token:
+        pooling_mode = "cls"
+    else:
+        raise ValueError(f"'{model_name}' does not use mean or CLS pooling, which the ONNX backend supports.")
+
+    transformer = model[0]
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["An example sentence to trace the model with."], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in [*input_names, "token_embeddings"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(transformer.auto_model.eval()),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(output_dir)
+    config = {
+        "model_name": model_name,
+        "pooling": pooling_mode,
+        "normalize": any(isinstance(module, Normalize) for module in model),
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    if quantize:
+        quantize_onnx_model(output_dir)
+    logger.info(f"Exported '{model_name}' to ONNX in '{output_dir}'.")
+    return output_dir
+
+
+def quantize_onnx_model(model_dir: str):
+    """Writes an int8 dynamically quantized copy of an exported model (weights int8, activations quantized at run time)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        os.path.join(model_dir, ONNX_MODEL_FILE),
+        os.path.join(model_dir, ONNX_QUANTIZED_MODEL_FILE),
+        weight_type=QuantType.QInt8,
+    )
+
+
+class OnnxSentenceEncoder:
+    """
+    Runs an exported SentenceTransformer model with ONNX Runtime on CPU.
+
+    A drop-in replacement for `SentenceTransformer.encode` as used by the embedding
+    service: texts are tokenized, sorted by length to minimise padding, run through the
+    transformer, then pooled and normalized the same way the original model does.
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = False, intra_op_threads: int = 0):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE), encoding="utf-8") as f:
+            self.config: Dict[str, Any] = json.load(f)
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.max_seq_length = self.config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, ONNX_QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def _pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.config["pooling"] == "cls":
+            embeddings = token_embeddings[:, 0]
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+    def encode(self, sentences: str | Sequence[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """Embeds the sentences; returns a float32 array, or a single vector for a single string."""
+        single = isinstance(sentences, str)
+        texts: List[str] = [sentences] if single else list(sentences)
+        embeddings = np.empty((len(texts), self.config["dimension"]), dtype=np.float32)
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[row] for row in rows],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self._input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            embeddings[rows] = self._pool(token_embeddings, encoded["attention_mask"])
+        return embeddings[0] if single else embeddings
+
+
+def load_embedding_model(model_name: str | None = None):
+    """
+    Loads the embedding model for the configured backend: PyTorch SentenceTransformer, or
+    its ONNX Runtime export (exported on first use, optionally int8 quantized).
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL
+    if settings.EMBEDDING_BACKEND == "torch":
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name)
+    if settings.EMBEDDING_BACKEND != "onnx":
+        raise ValueError(f"Unknown embedding backend '{settings.EMBEDDING_BACKEND}'. Use 'torch' or 'onnx'.")
+
+    model_dir = onnx_model_dir(model_name)
+    if not os.path.exists(os.path.join(model_dir, ONNX_CONFIG_FILE)):
+        logger.info(f"No ONNX export of '{model_name}' found; exporting it to '{model_dir}'...")
+        export_onnx_model(model_name, model_dir, quantize=settings.EMBEDDING_ONNX_QUANTIZE)
+    elif settings.EMBEDDING_ONNX_QUANTIZE and not os.path.exists(os.path.join(model_dir, ONNX_QUANTIZED_MODEL_FILE)):
+        quantize_onnx_model(model_dir)
+    return OnnxSentenceEncoder(
+        model_dir, quantized=settings.EMBEDDING_ONNX_QUANTIZE, intra_op_threads=settings.EMBEDDING_ONNX_THREADS
+    )
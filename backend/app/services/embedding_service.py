@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _EmbeddingRequest:
+    texts: Sequence[str]
+    future: asyncio.Future
+
+
+class QueryEmbeddingCache:
+    """
+    A bounded LRU cache of query embeddings keyed by normalized query text.
+
+    Vectors live in one preallocated float32 array (allocated on first use, once the
+    embedding dimension is known), with an ordered text -> row index for LRU eviction.
+    It lives in memory next to the model it caches and is created with it, so it never
+    holds vectors of another model, backend or quantization.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._vectors: np.ndarray | None = None
+        self._rows: "OrderedDict[str, int]" = OrderedDict()
+        self._free_rows: List[int] = []
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Case-folds, collapses whitespace and drops trailing punctuation, so near-identical queries share a key."""
+        return " ".join(text.casefold().split()).rstrip("?!. ")
+
+    def _clear(self):
+        self._vectors = None
+        self._rows.clear()
+        self._free_rows = []
+
+    def get(self, text: str) -> np.ndarray | None:
+        key = self.normalize(text)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                self._misses += 1
+                return None
+            self._rows.move_to_end(key)
+            self._hits += 1
+            return self._vectors[row].copy()
+
+    def put(self, text: str, vector: np.ndarray):
+        if self.capacity <= 0:
+            return
+        key = self.normalize(text)
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._clear()
+                self._vectors = np.empty((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._free_rows = list(range(self.capacity - 1, -1, -1))
+
+            row = self._rows.get(key)
+            if row is None:
+                if not self._free_rows:
+                    _, evicted_row = self._rows.popitem(last=False)
+                    self._free_rows.append(evicted_row)
+                row = self._free_rows.pop()
+            self._rows[key] = row
+            self._rows.move_to_end(key)
+            self._vectors[row] = vector
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._rows),
+                "capacity": self.capacity,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "memory_bytes": self._vectors.nbytes if self._vectors is not None else 0,
+            }
+
+
+class EmbeddingService:
+    """
+    Shares one embedding model between the query and ingestion paths.
+
+    Concurrent query embeddings are coalesced by a micro-batcher: requests are queued,
+    and a single worker collects them for up to `max_wait_ms` or `max_batch_size` texts
+    and runs one `encode` call for the whole batch. Ingestion embeds in large batches of
+    `ingest_batch_size`. Only one forward pass runs at a time, so queries and ingestion
+    never fight over CPU cores, and ingestion yields to queued queries between batches.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        ingest_batch_size: int = 256,
+        query_cache: QueryEmbeddingCache | None = None,
+    ):
+        self.model = model
+        self.query_cache = query_cache
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.ingest_batch_size = ingest_batch_size
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._encode_lock: asyncio.Lock | None = None
+        self._metrics = {
+            "batches": 0,
+            "batched_texts": 0,
+            "ingest_batches": 0,
+            "ingest_texts": 0,
+            "max_queue_depth": 0,
+            "encode_seconds": 0.0,
+        }
+
+    def start(self):
+        """Starts the batching worker. Must be called from a running event loop."""
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._encode_lock = asyncio.Lock()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Embedding micro-batcher started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:g})."
+        )
+
+    async def stop(self):
+        """Stops the batching worker and fails any requests still waiting in the queue."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            request = self._queue.get_nowait()
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Embedding service is shutting down."))
+        self._worker = None
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Synchronously embeds texts in large batches, e.g. from offline ingestion scripts."""
+        return self.model.encode(list(texts), batch_size=self.ingest_batch_size)
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embeds a few texts (typically one query) through the micro-batcher."""
+        if self._worker is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_EmbeddingRequest(texts=list(texts), future=future))
+        self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self._queue.qsize())
+        return await future
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        """Embeds a single query, serving repeated queries from the query embedding cache."""
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached[np.newaxis, :]
+        embedding = await self.embed([query])
+        if self.query_cache is not None:
+            self.query_cache.put(query, embedding[0])
+        return embedding
+
+    async def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        """Embeds many texts for ingestion in batches of `ingest_batch_size`."""
+        if self._worker is None:
+            self.start()
+        texts = list(texts)
+        batches = []
+        for start in range(0, len(texts), self.ingest_batch_size):
+            batch = texts[start:start + self.ingest_batch_size]
+            # Re-acquire per batch so queued query batches can run in between
+            async with self._encode_lock:
+                batches.append(await self._encode(batch))
+            self._metrics["ingest_batches"] += 1
+            self._metrics["ingest_texts"] += len(batch)
+        return np.concatenate(batches) if batches else np.empty((0, 0), dtype=np.float32)
+
+    async def _encode(self, texts: List[str]) -> np.ndarray:
+        started = time.perf_counter()
+        embeddings = await run_in_threadpool(self.model.encode, texts, batch_size=len(texts))
+        self._metrics["encode_seconds"] += time.perf_counter() - started
+        return np.asarray(embeddings)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            num_texts = len(batch[0].texts)
+            deadline = loop.time() + self.max_wait
+            while num_texts < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                num_texts += len(request.texts)
+
+            texts = [text for request in batch for text in request.texts]
+            try:
+                async with self._encode_lock:
+                    embeddings = await self._encode(texts)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} texts failed: {e}", exc_info=True)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            self._metrics["batches"] += 1
+            self._metrics["batched_texts"] += len(texts)
+            offset = 0
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_result(embeddings[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self._metrics["batches"]
+        return {
+            **self._metrics,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "avg_batch_size": self._metrics["batched_texts"] / batches if batches else 0.0,
+            "query_cache": self.query_cache.stats() if self.query_cache else None,
+        }
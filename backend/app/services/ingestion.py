@@ -0,0 +1,241 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from ..models.document import Document, DocumentChunk
+from .document_processing import hash_content, make_chunk_id
+from .vector_store import PLACEHOLDER_EMBEDDING
+
+logger = logging.getLogger(__name__)
+
+# Keeps `IN (...)` lookups below SQLite's bound-parameter limit
+_IN_CLAUSE_BATCH = 500
+
+
+@dataclass
+class IngestionPlan:
+    """
+    The delta between the stored chunks of a document and (part of) a new version of it.
+
+    Chunk ids are derived from the chunk content, so chunks that did not change keep their
+    id and are left alone. Only `new_chunks` are written to the stores, and of those only
+    the ones without an identical chunk already in the knowledge base need embedding.
+    """
+    file_name: str
+    content_hash: str
+    chunk_ids: List[str]
+    chunk_hashes: List[str]
+    chunk_pages: List[int | None]
+    new_chunks: Dict[str, str] = field(default_factory=dict)  # chunk id -> text, for chunks not yet in the stores
+    reused_embeddings: Dict[str, List[float]] = field(default_factory=dict)  # chunk id -> embedding of an identical stored chunk
+    stale_ids: List[str] = field(default_factory=list)  # chunk ids of the previous version that no longer exist
+
+    @property
+    def to_embed(self) -> Dict[str, str]:
+        """The new chunks that have to go through the embedding model."""
+        return {chunk_id: text for chunk_id, text in self.new_chunks.items() if chunk_id not in self.reused_embeddings}
+
+    @property
+    def changes_stores(self) -> bool:
+        return bool(self.new_chunks or self.stale_ids)
+
+
+@dataclass
+class IngestionProgress:
+    """Progress counters of one document ingestion, updated as it runs."""
+    stage: str = "queued"
+    pages: int = 0
+    chunks: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    chunks_removed: int = 0
+
+
+def _batched(values: Sequence, size: int = _IN_CLAUSE_BATCH) -> Iterable[Sequence]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def is_document_current(db: Session, file_name: str, content_hash: str) -> bool:
+    """Returns True if the document was already ingested with exactly this content."""
+    stored_hash = db.query(Document.content_hash).filter(Document.file_name == file_name).scalar()
+    return stored_hash is not None and stored_hash == content_hash
+
+
+class DocumentIngestion:
+    """
+    Plans the ingestion of one document version whose chunks arrive in batches, so a
+    large document can be embedded and written incrementally. `plan_batch` returns the
+    delta for each batch of chunks; `finish` returns the chunks that disappeared and the
+    complete chunk list to record once every batch has been applied.
+    """
+
+    def __init__(self, db: Session, collection, vector_store, file_name: str, content_hash: str):
+        self.db = db
+        self.collection = collection
+        self.vector_store = vector_store
+        self.file_name = file_name
+        self.content_hash = content_hash
+        self.stored_ids = self._stored_chunk_ids()
+        self.chunk_ids: List[str] = []
+        self.chunk_hashes: List[str] = []
+        self.chunk_pages: List[int | None] = []
+        self.written_ids: List[str] = []
+        self._seen_hashes: Set[str] = set()
+
+    def _stored_chunk_ids(self) -> Set[str]:
+        document = self.db.query(Document).filter(Document.file_name == self.file_name).first()
+        if document is None:
+            return set()
+        if document.chunks:
+            return {chunk.chunk_id for chunk in document.chunks}
+        # Ingested before chunks were tracked, under positional `{file_name}_{i}` ids
+        return set(self.collection.get(where={"source": self.file_name}, include=[])["ids"])
+
+    def plan_batch(self, chunks: Sequence[Tuple[str, int | None]]) -> IngestionPlan:
+        """Returns the delta for a batch of (text, page number) chunks, in document order."""
+        plan = IngestionPlan(self.file_name, self.content_hash, [], [], [])
+        hash_by_id: Dict[str, str] = {}
+        for text, page in chunks:
+            chunk_hash = hash_content(text)
+            if chunk_hash in self._seen_hashes:
+                # Identical chunks within one document collapse into one
+                continue
+            self._seen_hashes.add(chunk_hash)
+            chunk_id = make_chunk_id(self.file_name, chunk_hash)
+            plan.chunk_ids.append(chunk_id)
+            plan.chunk_hashes.append(chunk_hash)
+            plan.chunk_pages.append(page)
+            if chunk_id not in self.stored_ids:
+                plan.new_chunks[chunk_id] = text
+                hash_by_id[chunk_id] = chunk_hash
+
+        self.chunk_ids.extend(plan.chunk_ids)
+        self.chunk_hashes.extend(plan.chunk_hashes)
+        self.chunk_pages.extend(plan.chunk_pages)
+        self.written_ids.extend(plan.new_chunks)
+        plan.reused_embeddings = self._reusable_embeddings(hash_by_id)
+        return plan
+
+    def _reusable_embeddings(self, hash_by_id: Dict[str, str]) -> Dict[str, List[float]]:
+        """Looks up the embeddings of identical chunks already stored for other documents."""
+        if not hash_by_id:
+            return {}
+        donor_by_hash: Dict[str, str] = {}
+        for batch in _batched(list(set(hash_by_id.values()))):
+            rows = self.db.query(DocumentChunk.content_hash, DocumentChunk.chunk_id).filter(
+                DocumentChunk.content_hash.in_(batch)
+            )
+            for chunk_hash, chunk_id in rows:
+                donor_by_hash.setdefault(chunk_hash, chunk_id)
+        if not donor_by_hash:
+            return {}
+
+        donor_embeddings = {}
+        for batch in _batched(list(donor_by_hash.values())):
+            donor_embeddings.update(self.vector_store.embeddings(batch))
+        reused = {}
+        for chunk_id, chunk_hash in hash_by_id.items():
+            donor = donor_by_hash.get(chunk_hash)
+            if donor in donor_embeddings:
+                reused[chunk_id] = [float(x) for x in donor_embeddings[donor]]
+        return reused
+
+    def finish(self) -> IngestionPlan:
+        """Returns the whole-document plan: every chunk of the new version plus the stale ids to delete."""
+        return IngestionPlan(
+            file_name=self.file_name,
+            content_hash=self.content_hash,
+            chunk_ids=list(self.chunk_ids),
+            chunk_hashes=list(self.chunk_hashes),
+            chunk_pages=list(self.chunk_pages),
+            stale_ids=sorted(self.stored_ids - set(self.chunk_ids)),
+        )
+
+    def rollback(self) -> IngestionPlan:
+        """Returns a plan deleting the chunks written so far, for when ingestion fails halfway."""
+        return IngestionPlan(self.file_name, self.content_hash, [], [], [], stale_ids=list(self.written_ids))
+
+
+def plan_ingestion(
+    db: Session, collection, vector_store, file_name: str, content_hash: str, chunks: Sequence[Tuple[str, int | None]]
+) -> IngestionPlan:
+    """Plans the ingestion of a whole document whose (text, page number) chunks are all in memory."""
+    ingestion = DocumentIngestion(db, collection, vector_store, file_name, content_hash)
+    plan = ingestion.plan_batch(chunks)
+    plan.stale_ids = ingestion.finish().stale_ids
+    return plan
+
+
+def apply_ingestion_plans(
+    collection,
+    keyword_index,
+    chunk_store,
+    vector_store,
+    plans: Sequence[IngestionPlan],
+    embeddings: Dict[str, Sequence[float]],
+):
+    """
+    Writes new chunks to the chunk store, ChromaDB, the keyword index and the vector store
+    and deletes stale ones. The chunk store is written first and cleaned last, so it
+    always covers the collection; with the flat backend it keeps the exact embeddings.
+    `embeddings` must hold a vector for every chunk id in each plan's `to_embed`.
+    """
+    ids, documents, vectors, metadatas = [], [], [], []
+    for plan in plans:
+        page_by_id = dict(zip(plan.chunk_ids, plan.chunk_pages))
+        for chunk_id, text in plan.new_chunks.items():
+            ids.append(chunk_id)
+            documents.append(text)
+            vectors.append(plan.reused_embeddings[chunk_id] if chunk_id in plan.reused_embeddings else embeddings[chunk_id])
+            metadata = {"source": plan.file_name}
+            if page_by_id.get(chunk_id) is not None:
+                metadata["page"] = page_by_id[chunk_id]
+            metadatas.append(metadata)
+    if ids:
+        if vector_store.embeddings_in_chunk_store:
+            chunk_store.add_chunks(ids, documents, vectors)
+            collection.upsert(ids=ids, embeddings=[PLACEHOLDER_EMBEDDING] * len(ids), documents=documents, metadatas=metadatas)
+        else:
+            chunk_store.add_chunks(ids, documents)
+            collection.upsert(ids=ids, embeddings=vectors, documents=documents, metadatas=metadatas)
+        keyword_index.add_documents(ids, documents)
+        vector_store.add(ids, vectors)
+
+    stale_ids = [chunk_id for plan in plans for chunk_id in plan.stale_ids]
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+        keyword_index.remove_documents(stale_ids)
+        chunk_store.remove_chunks(stale_ids)
+        vector_store.remove(stale_ids)
+
+
+def record_ingestion(db: Session, plans: Sequence[IngestionPlan], source: str = "local"):
+    """
+    Stores the document and chunk hashes once the chunks themselves are in the stores.
+    Each plan must cover a whole document (see `DocumentIngestion.finish`).
+    """
+    try:
+        for plan in plans:
+            document = db.query(Document).filter(Document.file_name == plan.file_name).first()
+            if document is None:
+                document = Document(file_name=plan.file_name, source=source)
+                db.add(document)
+            document.content_hash = plan.content_hash
+
+            # Update rows in place: replacing them would briefly duplicate the unique chunk ids
+            existing = {chunk.chunk_id: chunk for chunk in document.chunks}
+            chunks = []
+            for position, (chunk_id, chunk_hash, page) in enumerate(zip(plan.chunk_ids, plan.chunk_hashes, plan.chunk_pages)):
+                chunk = existing.get(chunk_id) or DocumentChunk(chunk_id=chunk_id, content_hash=chunk_hash)
+                chunk.position = position
+                chunk.page = page
+                chunks.append(chunk)
+            document.chunks = chunks
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        raise
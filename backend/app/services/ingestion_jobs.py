@@ -0,0 +1,174 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import Any, Callable, Dict, List
+
+from fastapi import HTTPException
+
+from ..db.session import SessionLocal
+from .ingestion import IngestionProgress
+from .rag_service import RAGService
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+@dataclass
+class IngestionJob:
+    """A document waiting for or undergoing ingestion. `path` is the spooled upload, deleted once the job ends."""
+    id: str
+    file_name: str
+    path: str
+    content_hash: str
+    priority: int = 0
+    status: JobStatus = JobStatus.QUEUED
+    progress: IngestionProgress = field(default_factory=IngestionProgress)
+    error: str | None = None
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "file_name": self.file_name,
+            "status": self.status.value,
+            "priority": self.priority,
+            "progress": asdict(self.progress),
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionQueueFullError(Exception):
+    """Raised when a job is submitted while the ingestion queue is at capacity."""
+    pass
+
+
+class IngestionJobQueue:
+    """
+    Runs document ingestion in the background, off the request path.
+
+    Jobs are served highest `priority` first (FIFO within a priority) by a fixed number of
+    workers, so ingestion concurrency is bounded independently of chat traffic. Jobs for
+    the same file never run concurrently. Finished jobs are kept for status queries up to
+    `max_finished_jobs`.
+    """
+
+    def __init__(
+        self,
+        rag_service_factory: Callable[[], RAGService],
+        concurrency: int = 1,
+        max_queued_jobs: int = 100,
+        max_finished_jobs: int = 1000,
+    ):
+        self.rag_service_factory = rag_service_factory
+        self.concurrency = concurrency
+        self.max_queued_jobs = max_queued_jobs
+        self.max_finished_jobs = max_finished_jobs
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: asyncio.PriorityQueue | None = None
+        self._workers: List[asyncio.Task] = []
+        self._file_locks: Dict[str, asyncio.Lock] = {}
+        self._sequence = itertools.count()
+
+    def start(self):
+        """Starts the ingestion workers. Must be called from a running event loop."""
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        logger.info(f"Ingestion job queue started with {self.concurrency} worker(s).")
+
+    async def stop(self):
+        """Stops the workers and fails any jobs that have not finished."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job in self._jobs.values():
+            if job.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+                self._finish(job, JobStatus.FAILED, "The server shut down before the job finished.")
+
+    def submit(self, file_name: str, path: str, content_hash: str, priority: int = 0) -> IngestionJob:
+        """Queues a spooled document for ingestion. The queue takes ownership of the file at `path`."""
+        if self._queue is None:
+            self.start()
+        queued = sum(1 for job in self._jobs.values() if job.status == JobStatus.QUEUED)
+        if queued >= self.max_queued_jobs:
+            raise IngestionQueueFullError(f"The ingestion queue is full ({queued} jobs waiting).")
+
+        job = IngestionJob(id=uuid.uuid4().hex, file_name=file_name, path=path, content_hash=content_hash, priority=priority)
+        self._jobs[job.id] = job
+        self._queue.put_nowait((-priority, next(self._sequence), job.id))
+        logger.info(f"Queued ingestion job {job.id} for '{file_name}' (priority {priority}).")
+        return job
+
+    def get(self, job_id: str) -> IngestionJob | None:
+        return self._jobs.get(job_id)
+
+    async def _run(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JobStatus.QUEUED:
+                continue
+            lock = self._file_locks.setdefault(job.file_name, asyncio.Lock())
+            async with lock:
+                await self._process(job)
+            if not lock.locked():
+                self._file_locks.pop(job.file_name, None)
+
+    async def _process(self, job: IngestionJob):
+        job.status = JobStatus.RUNNING
+        job.started_at = time.time()
+        db = SessionLocal()
+        try:
+            await self.rag_service_factory().ingest_document(
+                db, job.file_name, job.path, job.content_hash, progress=job.progress
+            )
+            self._finish(job, JobStatus.SUCCEEDED)
+        except HTTPException as e:
+            self._finish(job, JobStatus.FAILED, str(e.detail))
+        except asyncio.CancelledError:
+            self._finish(job, JobStatus.FAILED, "The job was cancelled.")
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {e}", exc_info=True)
+            self._finish(job, JobStatus.FAILED, "An unexpected server error occurred.")
+        finally:
+            db.close()
+
+    def _finish(self, job: IngestionJob, status: JobStatus, error: str | None = None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+        logger.info(f"Ingestion job {job.id} for '{job.file_name}' {status.value}.")
+
+        finished = [job_id for job_id, j in self._jobs.items() if j.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status.value: 0 for status in JobStatus}
+        for job in self._jobs.values():
+            counts[job.status.value] += 1
+        return {"workers": len(self._workers), **counts}
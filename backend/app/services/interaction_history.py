@@ -0,0 +1,103 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.interaction import Interaction
+from ..models.user import User
+
+USER_ROLE = "user"
+ASSISTANT_ROLE = "assistant"
+
+_ROLE_LABELS = {USER_ROLE: "User", ASSISTANT_ROLE: "AI"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximates the token count of `text` for budgeting (about four characters per token for English)."""
+    return max(1, math.ceil(len(text) / 4))
+
+
+@dataclass(frozen=True)
+class Turn:
+    """One message of a conversation, as stored in the interactions table."""
+    role: str
+    text: str
+    token_count: int
+    id: int | None = None  # Unset until the turn is persisted
+
+    @classmethod
+    def create(cls, role: str, text: str) -> "Turn":
+        return cls(role=role, text=text, token_count=estimate_tokens(text))
+
+    @classmethod
+    def from_interaction(cls, interaction: Interaction) -> "Turn":
+        return cls(role=interaction.role, text=interaction.text, token_count=interaction.token_count, id=interaction.id)
+
+    def render(self) -> str:
+        return f"{_ROLE_LABELS.get(self.role, self.role)}: {self.text}"
+
+
+def render_turns(turns: Iterable[Turn]) -> str:
+    return "\n".join(turn.render() for turn in turns)
+
+
+def build_personalization_context(summary: str, recent_turns: Sequence[Turn], token_budget: int) -> str:
+    """
+    The interaction history that personalizes an answer: the rolling summary, then as
+    many of the most recent turns as fit in `token_budget` alongside it, oldest first.
+    """
+    summary = summary.strip()
+    remaining = token_budget - (estimate_tokens(summary) if summary else 0)
+    if remaining < 0:
+        # Only a summary written before compaction bounded it can outgrow the budget
+        summary = summary[:token_budget * 4]
+        remaining = 0
+    included: List[Turn] = []
+    for turn in reversed(recent_turns):
+        if turn.token_count > remaining:
+            break
+        included.append(turn)
+        remaining -= turn.token_count
+    sections = []
+    if summary:
+        sections.append(summary)
+    if included:
+        sections.append(f"Recent conversation:\n{render_turns(reversed(included))}")
+    return "\n\n".join(sections) or "No previous interactions."
+
+
+async def load_recent_turns(db: AsyncSession, user: User, limit: int) -> List[Turn]:
+    """The last `limit` turns of a user not yet folded into their summary, oldest first."""
+    query = (
+        select(Interaction)
+        .where(Interaction.user_id == user.id, Interaction.id > (user.summarized_interaction_id or 0))
+        .order_by(Interaction.created_at.desc(), Interaction.id.desc())
+        .limit(limit)
+    )
+    return [Turn.from_interaction(interaction) for interaction in reversed((await db.scalars(query)).all())]
+
+
+async def load_unsummarized_turns(db: AsyncSession, user: User) -> List[Turn]:
+    """All turns of a user not yet folded into their summary, oldest first."""
+    query = (
+        select(Interaction)
+        .where(Interaction.user_id == user.id, Interaction.id > (user.summarized_interaction_id or 0))
+        .order_by(Interaction.created_at, Interaction.id)
+    )
+    return [Turn.from_interaction(interaction) for interaction in (await db.scalars(query)).all()]
+
+
+async def unsummarized_tokens(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, int]:
+    """Tokens in the turns not yet folded into the summary, per user id."""
+    query = (
+        select(User.id, func.coalesce(func.sum(Interaction.token_count), 0))
+        .outerjoin(
+            Interaction,
+            (Interaction.user_id == User.id) & (Interaction.id > func.coalesce(User.summarized_interaction_id, 0)),
+        )
+        .where(User.id.in_(list(user_ids)))
+        .group_by(User.id)
+    )
+    return {user_id: int(tokens) for user_id, tokens in (await db.execute(query)).all()}
@@ -0,0 +1,400 @@
+import logging
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate
+from typing import Callable, Dict, FrozenSet, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the on-disk layout changes; stale files are rebuilt from ChromaDB.
+INDEX_FORMAT_VERSION = 3
+
+# Number of chunks fetched per page when rebuilding the index from the collection.
+REBUILD_PAGE_SIZE = 1000
+
+
+ENGLISH_STOP_WORDS: FrozenSet[str] = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you
+your yours yourself yourselves
+""".split())
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_SUFFIX_RULES = (("ies", "y"), ("sses", "ss"), ("ingly", ""), ("ing", ""), ("edly", ""), ("ed", ""), ("ly", ""))
+_MIN_STEM_LENGTH = 3
+
+
+def light_stem(token: str) -> str:
+    """
+    A light English suffix stripper: plurals, -ing, -ed and -ly, collapsing the doubled
+    consonant they leave behind (running -> run). It only has to be consistent, since the
+    same stemmer is applied to indexed chunks and to queries.
+    """
+    if len(token) <= _MIN_STEM_LENGTH or not token.isalpha():
+        return token
+    for suffix, replacement in _SUFFIX_RULES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM_LENGTH:
+            stem = token[:-len(suffix)] + replacement
+            if not replacement and len(stem) > _MIN_STEM_LENGTH and stem[-1] == stem[-2] and stem[-1] not in "lsz":
+                stem = stem[:-1]
+            return stem
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+class Tokenizer:
+    """
+    Splits text into index terms: lowercased word characters, minus stop words, optionally stemmed.
+    The same tokenizer must be used for indexing and querying; `signature` identifies its
+    configuration so a persisted index built with a different one is rebuilt.
+    """
+
+    def __init__(
+        self,
+        stop_words: Iterable[str] = (),
+        stemmer: Callable[[str], str] | None = None,
+        stemmer_name: str | None = None,
+    ):
+        self.stop_words = frozenset(stop_words)
+        self.stemmer = stemmer
+        self.signature = (
+            "word-lower",
+            tuple(sorted(self.stop_words)),
+            stemmer_name or (stemmer.__name__ if stemmer else None),
+        )
+
+    def tokenize(self, text: str) -> List[str]:
+        tokens = [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in self.stop_words]
+        if self.stemmer:
+            tokens = [self.stemmer(token) for token in tokens]
+        return tokens
+
+
+def build_tokenizer(stop_words: bool = True, stemming: bool = True) -> Tokenizer:
+    """Builds the default English tokenizer."""
+    return Tokenizer(
+        stop_words=ENGLISH_STOP_WORDS if stop_words else (),
+        stemmer=light_stem if stemming else None,
+    )
+
+
+class PostingList:
+    """
+    The chunks containing one term, as parallel arrays sorted by internal document number.
+
+    `max_tf` and `min_length` are maintained on insert and give a score upper bound for
+    the term that is valid for every posting (BM25 grows with tf and shrinks with length).
+    They are never tightened on removal, which keeps them conservative but still correct.
+    """
+
+    __slots__ = ("docnos", "tfs", "max_tf", "min_length")
+
+    def __init__(self):
+        self.docnos = array("I")
+        self.tfs = array("I")
+        self.max_tf = 0
+        self.min_length = 0
+
+    def __len__(self) -> int:
+        return len(self.docnos)
+
+    def append(self, docno: int, tf: int, doc_length: int):
+        # Document numbers are handed out in increasing order, so appending keeps the list sorted.
+        self.docnos.append(docno)
+        self.tfs.append(tf)
+        self.max_tf = max(self.max_tf, tf)
+        self.min_length = doc_length if len(self.docnos) == 1 else min(self.min_length, doc_length)
+
+    def remove(self, docno: int):
+        pos = bisect_left(self.docnos, docno)
+        if pos < len(self.docnos) and self.docnos[pos] == docno:
+            del self.docnos[pos]
+            del self.tfs[pos]
+
+    def __getstate__(self):
+        return (self.docnos, self.tfs, self.max_tf, self.min_length)
+
+    def __setstate__(self, state):
+        self.docnos, self.tfs, self.max_tf, self.min_length = state
+
+
+class _TermCursor:
+    """Iteration state for one query term during a MaxScore traversal."""
+
+    __slots__ = ("postings", "weight", "upper_bound", "pos")
+
+    def __init__(self, postings: PostingList, weight: float, upper_bound: float):
+        self.postings = postings
+        self.weight = weight
+        self.upper_bound = upper_bound
+        self.pos = 0
+
+    def current(self) -> int | None:
+        if self.pos < len(self.postings.docnos):
+            return self.postings.docnos[self.pos]
+        return None
+
+    def seek(self, docno: int) -> int | None:
+        """Advances to the first posting >= docno and returns its document number."""
+        self.pos = bisect_left(self.postings.docnos, docno, self.pos)
+        return self.current()
+
+
+class BM25Index:
+    """
+    A persistent, incrementally maintained BM25 inverted index over the chunks in ChromaDB.
+
+    Chunks are tokenized once, when they are upserted, so a query only tokenizes itself
+    and walks the posting lists of its own terms. Terms are interned in a vocabulary and
+    addressed by integer term id everywhere else. Top-k retrieval uses MaxScore dynamic
+    pruning: documents that cannot enter the current top-k heap are skipped without
+    being scored.
+    """
+
+    def __init__(self, path: str | None = None, k1: float = 1.5, b: float = 0.75, tokenizer: Tokenizer | None = None):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer or build_tokenizer()
+        self._lock = threading.RLock()
+        # term -> term id; ids are never reused, so postings and chunk term arrays stay valid.
+        # A term is dropped once no chunk contains it.
+        self._vocabulary: Dict[str, int] = {}
+        self._terms: Dict[int, str] = {}
+        self._next_term_id = 0
+        self._postings: Dict[int, PostingList] = {}
+        # Chunks are addressed internally by increasing document numbers so postings stay sorted.
+        self._next_docno = 0
+        self._docnos: Dict[str, int] = {}
+        self._chunk_ids: Dict[int, str] = {}
+        # docno -> number of tokens, and the distinct term ids needed to remove it again
+        self._doc_lengths: Dict[int, int] = {}
+        self._doc_terms: Dict[int, array] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"chunks": len(self._doc_lengths), "terms": len(self._postings), "vocabulary": len(self._vocabulary)}
+
+    def _term_id(self, term: str) -> int:
+        term_id = self._vocabulary.get(term)
+        if term_id is None:
+            term_id = self._vocabulary[term] = self._next_term_id
+            self._terms[term_id] = term
+            self._next_term_id += 1
+        return term_id
+
+    def add_documents(self, ids: Sequence[str], documents: Sequence[str]):
+        """Adds chunks to the index, replacing any chunk that already uses the same id."""
+        with self._lock:
+            for chunk_id, text in zip(ids, documents):
+                self._remove(chunk_id)
+                tokens = self.tokenizer.tokenize(text)
+                term_freqs = Counter(self._term_id(token) for token in tokens)
+                docno = self._next_docno
+                self._next_docno += 1
+                for term_id, tf in term_freqs.items():
+                    postings = self._postings.get(term_id)
+                    if postings is None:
+                        postings = self._postings[term_id] = PostingList()
+                    postings.append(docno, tf, len(tokens))
+                self._docnos[chunk_id] = docno
+                self._chunk_ids[docno] = chunk_id
+                self._doc_lengths[docno] = len(tokens)
+                self._doc_terms[docno] = array("I", term_freqs)
+                self._total_length += len(tokens)
+
+    def remove_documents(self, ids: Sequence[str]):
+        """Removes chunks from the index. Unknown ids are ignored."""
+        with self._lock:
+            for chunk_id in ids:
+                self._remove(chunk_id)
+
+    def _remove(self, chunk_id: str):
+        docno = self._docnos.pop(chunk_id, None)
+        if docno is None:
+            return
+        for term_id in self._doc_terms.pop(docno):
+            postings = self._postings.get(term_id)
+            if postings is None:
+                continue
+            postings.remove(docno)
+            if not postings:
+                del self._postings[term_id]
+                del self._vocabulary[self._terms.pop(term_id)]
+        del self._chunk_ids[docno]
+        self._total_length -= self._doc_lengths.pop(docno)
+
+    def _term_score(self, tf: int, doc_length: int, avg_doc_length: float) -> float:
+        norm = self.k1 * (1 - self.b + self.b * doc_length / avg_doc_length)
+        return tf * (self.k1 + 1) / (tf + norm)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """Returns up to `top_k` (chunk_id, score) pairs, best first."""
+        query_terms = Counter(self.tokenizer.tokenize(query))
+        with self._lock:
+            num_docs = len(self._doc_lengths)
+            if not num_docs or top_k <= 0:
+                return []
+            avg_doc_length = self._total_length / num_docs
+
+            cursors: List[_TermCursor] = []
+            for term, query_tf in query_terms.items():
+                term_id = self._vocabulary.get(term)
+                postings = self._postings.get(term_id) if term_id is not None else None
+                if not postings:
+                    continue
+                # Non-negative BM25 idf, so the index never needs corpus-wide idf averaging
+                doc_freq = len(postings)
+                weight = query_tf * math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+                upper_bound = weight * self._term_score(postings.max_tf, postings.min_length, avg_doc_length)
+                cursors.append(_TermCursor(postings, weight, upper_bound))
+            if not cursors:
+                return []
+
+            heap = self._max_score(cursors, top_k, avg_doc_length)
+            return [(self._chunk_ids[docno], score) for score, docno in sorted(heap, reverse=True)]
+
+    def _max_score(self, cursors: List[_TermCursor], top_k: int, avg_doc_length: float) -> List[Tuple[float, int]]:
+        """
+        MaxScore document-at-a-time traversal.
+
+        Terms are ordered by upper bound. The lowest-bound terms whose bounds sum to no more
+        than the current heap threshold are "non-essential": a document matching only those
+        can never enter the top-k, so candidates are drawn from the essential terms alone and
+        non-essential terms are probed (and abandoned early) only for those candidates.
+        """
+        cursors.sort(key=lambda c: c.upper_bound)
+        prefix_bounds = list(accumulate(c.upper_bound for c in cursors))
+        heap: List[Tuple[float, int]] = []
+        threshold = 0.0
+        first_essential = 0
+
+        while True:
+            candidate = None
+            for cursor in cursors[first_essential:]:
+                docno = cursor.current()
+                if docno is not None and (candidate is None or docno < candidate):
+                    candidate = docno
+            if candidate is None:
+                break
+
+            doc_length = self._doc_lengths[candidate]
+            score = 0.0
+            for cursor in cursors[first_essential:]:
+                if cursor.current() == candidate:
+                    score += cursor.weight * self._term_score(cursor.postings.tfs[cursor.pos], doc_length, avg_doc_length)
+                    cursor.pos += 1
+
+            for i in range(first_essential - 1, -1, -1):
+                if score + prefix_bounds[i] <= threshold:
+                    break
+                cursor = cursors[i]
+                if cursor.seek(candidate) == candidate:
+                    score += cursor.weight * self._term_score(cursor.postings.tfs[cursor.pos], doc_length, avg_doc_length)
+
+            if len(heap) < top_k:
+                heapq.heappush(heap, (score, candidate))
+            elif score > threshold:
+                heapq.heapreplace(heap, (score, candidate))
+            else:
+                continue
+
+            if len(heap) == top_k:
+                threshold = heap[0][0]
+                while first_essential < len(cursors) and prefix_bounds[first_essential] <= threshold:
+                    first_essential += 1
+        return heap
+
+    def save(self):
+        """Atomically writes the index to `self.path`."""
+        if not self.path:
+            return
+        with self._lock:
+            state = {
+                "version": INDEX_FORMAT_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "tokenizer": self.tokenizer.signature,
+                "vocabulary": self._vocabulary,
+                "next_term_id": self._next_term_id,
+                "next_docno": self._next_docno,
+                "postings": self._postings,
+                "chunk_ids": self._chunk_ids,
+                "doc_lengths": self._doc_lengths,
+                "doc_terms": self._doc_terms,
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, path: str, tokenizer: Tokenizer | None = None) -> "BM25Index | None":
+        """Loads a previously saved index, or returns None if it is missing, outdated or built with another tokenizer."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.warning(f"Could not read keyword index at '{path}': {e}")
+            return None
+        if state.get("version") != INDEX_FORMAT_VERSION:
+            logger.info(f"Keyword index at '{path}' uses an outdated format.")
+            return None
+        tokenizer = tokenizer or build_tokenizer()
+        if tuple(state.get("tokenizer", ())) != tokenizer.signature:
+            logger.info(f"Keyword index at '{path}' was built with a different tokenizer.")
+            return None
+
+        index = cls(path=path, k1=state["k1"], b=state["b"], tokenizer=tokenizer)
+        index._postings = state["postings"]
+        # Indexes saved before terms were dropped may still hold terms without postings
+        index._vocabulary = {term: term_id for term, term_id in state["vocabulary"].items() if term_id in index._postings}
+        index._terms = {term_id: term for term, term_id in index._vocabulary.items()}
+        index._next_term_id = state.get("next_term_id", len(state["vocabulary"]))
+        index._next_docno = state["next_docno"]
+        index._chunk_ids = state["chunk_ids"]
+        index._docnos = {chunk_id: docno for docno, chunk_id in index._chunk_ids.items()}
+        index._doc_lengths = state["doc_lengths"]
+        index._doc_terms = state["doc_terms"]
+        index._total_length = sum(index._doc_lengths.values())
+        return index
+
+
+def load_keyword_index(path: str, collection, tokenizer: Tokenizer | None = None) -> BM25Index:
+    """
+    Loads the persisted keyword index, rebuilding it from the ChromaDB collection
+    when it is missing, outdated, built with another tokenizer, or out of sync with the collection.
+    """
+    index = BM25Index.load(path, tokenizer)
+    collection_size = collection.count()
+    if index is not None and len(index) == collection_size:
+        logger.info(f"Loaded keyword index with {len(index)} chunks from '{path}'.")
+        return index
+
+    logger.info(f"Rebuilding keyword index from {collection_size} chunks in the collection...")
+    index = BM25Index(path=path, tokenizer=tokenizer)
+    for offset in range(0, collection_size, REBUILD_PAGE_SIZE):
+        page = collection.get(include=["documents"], limit=REBUILD_PAGE_SIZE, offset=offset)
+        index.add_documents(page["ids"], page["documents"])
+    index.save()
+    logger.info(f"Keyword index rebuilt with {len(index)} chunks.")
+    return index
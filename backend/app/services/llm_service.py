@@ -4,10 +4,17 @@ from openai import AsyncOpenAI, OpenAIError
 from pydantic import BaseModel
 from ..core.config import settings
 from enum import Enum
-from typing import Dict, Type, Union
+from typing import Any, AsyncIterator, Dict, Tuple, Type, Union
 from functools import lru_cache
 
 from ..core.exceptions import LLMServiceError
+from .completion_cache import (
+    CompletionCache,
+    build_completion_cache,
+    deserialize_response,
+    make_cache_key,
+    serialize_response,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +62,7 @@ PROMPT_TEMPLATES = {
         ),
         "user": (
             "Context:\n---\n{document_context}\n---\n\n"
-            "User Profile:\n- Interests: {user_interests}\n- Past Interactions Summary: {user_interaction_summary}\n\n"
+            "User Profile:\n- Interests: {user_interests}\n- Past Interactions:\n{user_interaction_history}\n\n"
             "Question: {user_query}"
         ),
     },
@@ -73,7 +80,10 @@ PROMPT_TEMPLATES = {
             "interaction history into a concise, third-person narrative summary. "
             "Focus on the key topics discussed and decisions made."
         ),
-        "user": "Please summarize the following interaction history:\n\n{interaction_history}",
+        "user": (
+            "Please summarize the following interaction history in at most {max_length} characters:\n\n"
+            "{interaction_history}"
+        ),
     },
     PromptStrategy.MASTER_AGENT_PLANNER: {
         "system": (
@@ -141,18 +151,46 @@ PROMPT_TEMPLATES = {
 }
 
 class LLMService:
-    def __init__(self, api_key: str, timeout: int):
+    def __init__(self, api_key: str, timeout: int, cache: CompletionCache | None = None):
         # Patch the client to add instructor's features
         self.client = instructor.patch(AsyncOpenAI(api_key=api_key, timeout=timeout))
+        # Unpatched client for token streaming, which never uses a response_model
+        self.stream_client = AsyncOpenAI(api_key=api_key, timeout=timeout)
+        self.cache = cache
+        # Per-strategy cache counters: {strategy: {"hits": n, "misses": n, "bypassed": n}}
+        self._cache_counters: Dict[PromptStrategy, Dict[str, int]] = {}
+        # Per-strategy token usage of the calls that reached the model
+        self._usage: Dict[PromptStrategy, Dict[str, int]] = {}
 
-    async def generate_response(
-        self,
-        strategy: PromptStrategy,
-        context: Dict[str, str],
-        model: str | None = None,
-        response_model: Type[BaseModel] = None,
-    ) -> Union[str, BaseModel]:
-        model = model or settings.LLM_MODEL
+    def _count(self, strategy: PromptStrategy, outcome: str):
+        counters = self._cache_counters.setdefault(strategy, {"hits": 0, "misses": 0, "bypassed": 0})
+        counters[outcome] += 1
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Returns completion cache hit ratios per prompt strategy."""
+        stats = {}
+        for strategy, counters in self._cache_counters.items():
+            lookups = counters["hits"] + counters["misses"]
+            stats[strategy.value] = {**counters, "hit_ratio": counters["hits"] / lookups if lookups else 0.0}
+        return {"enabled": self.cache is not None, "strategies": stats}
+
+    def _record_usage(self, strategy: PromptStrategy, usage: Any):
+        if usage is None:
+            return
+        counters = self._usage.setdefault(strategy, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        counters["calls"] += 1
+        counters["prompt_tokens"] += usage.prompt_tokens or 0
+        counters["completion_tokens"] += usage.completion_tokens or 0
+
+    def usage_stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns the tokens spent per prompt strategy (completion cache hits cost none)."""
+        return {
+            strategy.value: {**counters, "total_tokens": counters["prompt_tokens"] + counters["completion_tokens"]}
+            for strategy, counters in self._usage.items()
+        }
+
+    def _render_prompt(self, strategy: PromptStrategy, context: Dict[str, str]) -> Tuple[str, str]:
+        """Returns the (system, user) prompts for a strategy, filled in from `context`."""
         template = PROMPT_TEMPLATES.get(strategy)
         if not template:
             raise LLMServiceError("Invalid prompt strategy selected.")
@@ -169,9 +207,52 @@ class LLMService:
         logger.debug(f"Strategy: {strategy.name}")
         logger.debug(f"System Prompt: {system_prompt}")
         logger.debug(f"User Prompt: {user_prompt}")
+        return system_prompt, user_prompt
+
+    async def _cache_lookup(
+        self,
+        strategy: PromptStrategy,
+        use_cache: bool,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        response_model: Type[BaseModel] | None,
+    ) -> Tuple[str | None, str | None]:
+        """Returns (cache key, cached value); the key is None when the cache is not consulted."""
+        if self.cache is None:
+            return None, None
+        if not use_cache:
+            self._count(strategy, "bypassed")
+            return None, None
+        cache_key = make_cache_key(model, system_prompt, user_prompt, response_model)
+        cached = await self.cache.get(cache_key)
+        self._count(strategy, "hits" if cached is not None else "misses")
+        return cache_key, cached
+
+    async def generate_response(
+        self,
+        strategy: PromptStrategy,
+        context: Dict[str, str],
+        model: str | None = None,
+        response_model: Type[BaseModel] = None,
+        use_cache: bool = True,
+    ) -> Union[str, BaseModel]:
+        """
+        Renders the prompt for `strategy` and returns the model's answer.
+
+        Byte-identical requests are served from the completion cache unless `use_cache`
+        is False, which callers should pass when they rely on a fresh, non-deterministic answer.
+        """
+        model = model or settings.LLM_MODEL
+        system_prompt, user_prompt = self._render_prompt(strategy, context)
         if response_model:
             logger.debug(f"Response Model: {response_model.__name__}")
 
+        cache_key, cached = await self._cache_lookup(strategy, use_cache, model, system_prompt, user_prompt, response_model)
+        if cached is not None:
+            logger.debug("--- LLM Response (cached) ---")
+            return deserialize_response(cached, response_model)
+
         try:
             response_kwargs = {
                 "model": model,
@@ -184,6 +265,9 @@ class LLMService:
                 response_kwargs["response_model"] = response_model
 
             response = await self.client.chat.completions.create(**response_kwargs)
+            # instructor keeps the raw completion, and its usage, on structured responses
+            raw_response = getattr(response, "_raw_response", response) if response_model else response
+            self._record_usage(strategy, getattr(raw_response, "usage", None))
 
             logger.debug("--- LLM Response ---")
             if response_model:
@@ -191,15 +275,67 @@ class LLMService:
             else:
                 logger.debug(f"Raw Response (text): {response.choices[0].message.content.strip()}")
 
-            if response_model:
-                return response
-            else:
-                return response.choices[0].message.content.strip()
+            result = response if response_model else response.choices[0].message.content.strip()
+            if cache_key is not None:
+                await self.cache.set(cache_key, serialize_response(result))
+            return result
 
         except OpenAIError as e:
             logger.error(f"OpenAI API error: {e}")
             raise LLMServiceError(f"An error occurred with the AI service: {e}")
 
+    async def stream_response(
+        self,
+        strategy: PromptStrategy,
+        context: Dict[str, str],
+        model: str | None = None,
+        use_cache: bool = True,
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of `generate_response` for plain-text answers.
+
+        Yields the answer token by token as the model produces it. A completion cache
+        hit is yielded as a single piece, and a fully streamed answer is cached as usual.
+        """
+        model = model or settings.LLM_MODEL
+        system_prompt, user_prompt = self._render_prompt(strategy, context)
+
+        cache_key, cached = await self._cache_lookup(strategy, use_cache, model, system_prompt, user_prompt, None)
+        if cached is not None:
+            yield deserialize_response(cached, None)
+            return
+
+        parts = []
+        try:
+            stream = await self.stream_client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                # The final chunk carries no choices, only the usage of the whole stream
+                self._record_usage(strategy, getattr(chunk, "usage", None))
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except OpenAIError as e:
+            logger.error(f"OpenAI API error while streaming: {e}")
+            raise LLMServiceError(f"An error occurred with the AI service: {e}")
+
+        result = "".join(parts).strip()
+        logger.debug(f"Streamed Response (text): {result}")
+        if cache_key is not None:
+            await self.cache.set(cache_key, serialize_response(result))
+
 @lru_cache()
 def get_llm_service() -> LLMService:
-    return LLMService(api_key=settings.OPENAI_API_KEY, timeout=settings.LLM_TIMEOUT)
+    return LLMService(
+        api_key=settings.OPENAI_API_KEY,
+        timeout=settings.LLM_TIMEOUT,
+        cache=build_completion_cache(),
+    )
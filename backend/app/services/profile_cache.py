@@ -0,0 +1,137 @@
+import logging
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from ..models.user import User
+from .interaction_history import Turn
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class UserProfile:
+    """The parts of a user that personalize answers, detached from any database session."""
+    telegram_id: int
+    id: int
+    interests: List[str] = field(default_factory=list)
+    interaction_summary: str = ""
+    # The latest turns not folded into the summary, oldest first
+    recent_turns: Tuple[Turn, ...] = ()
+
+    @classmethod
+    def from_user(cls, user: User, recent_turns: Sequence[Turn] = ()) -> "UserProfile":
+        return cls(
+            telegram_id=user.telegram_id,
+            id=user.id,
+            interests=list(user.interests or []),
+            interaction_summary=user.interaction_summary or "",
+            recent_turns=tuple(recent_turns),
+        )
+
+
+@dataclass
+class _CacheEntry:
+    profile: UserProfile
+    expires_at: float
+
+
+class UserProfileCache:
+    """
+    A bounded LRU cache of user profiles keyed by Telegram id, so the chat path does not
+    read the database for active users.
+
+    Writes are applied here first and persisted behind, in batches, by the profile
+    writer. A user with writes still in flight is never evicted, and is not filled from
+    the database either, which would return a row that lacks them. Entries expire after
+    a TTL, which also bounds how stale a profile changed by another process can get.
+    Only used from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        # Writes applied to the cache but not yet persisted, per Telegram id
+        self._pending: Counter = Counter()
+        # Database reads in flight to fill the cache; a write meanwhile makes their row stale
+        self._fills: Dict[int, object] = {}
+        self._metrics = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0, "write_failures": 0}
+
+    def get(self, telegram_id: int) -> UserProfile | None:
+        entry = self._entries.get(telegram_id)
+        if entry is not None and entry.expires_at <= time.monotonic() and not self._pending[telegram_id]:
+            del self._entries[telegram_id]
+            self._metrics["expirations"] += 1
+            entry = None
+        if entry is None:
+            self._metrics["misses"] += 1
+            return None
+        self._entries.move_to_end(telegram_id)
+        self._metrics["hits"] += 1
+        return entry.profile
+
+    def start_fill(self, telegram_id: int) -> object:
+        """Call before reading a missing profile from the database; pass the token to `put`."""
+        token = self._fills[telegram_id] = object()
+        return token
+
+    def put(self, profile: UserProfile, fill_token: object):
+        """
+        Caches a profile read from the database, unless it was written since the read
+        began or writes for it are still in flight: the row read may lack them.
+        """
+        if self._fills.get(profile.telegram_id) is fill_token:
+            del self._fills[profile.telegram_id]
+        else:
+            return
+        if self.max_entries <= 0 or self._pending[profile.telegram_id]:
+            return
+        self._entries[profile.telegram_id] = _CacheEntry(profile, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(profile.telegram_id)
+        self._evict()
+
+    def _evict(self):
+        excess = len(self._entries) - self.max_entries
+        if excess <= 0:
+            return
+        for telegram_id in [key for key in self._entries if not self._pending[key]][:excess]:
+            del self._entries[telegram_id]
+            self._metrics["evictions"] += 1
+
+    def begin_write(self, telegram_id: int, transform: Callable[[UserProfile], UserProfile]):
+        """
+        Applies a write to the cached profile, if the user is cached, and pins the user
+        until `end_write` reports it persisted (or failed).
+        """
+        self._pending[telegram_id] += 1
+        self._fills.pop(telegram_id, None)
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            entry.profile = transform(entry.profile)
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+
+    def end_write(self, telegram_id: int, persisted: bool):
+        self._pending[telegram_id] -= 1
+        if self._pending[telegram_id] <= 0:
+            del self._pending[telegram_id]
+        if not persisted:
+            # The cached profile holds a write the database does not; reload it on next use
+            self._metrics["write_failures"] += 1
+            self._entries.pop(telegram_id, None)
+
+    def invalidate(self, telegram_id: int):
+        """Drops a user whose profile was changed in the database directly."""
+        self._fills.pop(telegram_id, None)
+        if self._entries.pop(telegram_id, None) is not None:
+            self._metrics["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._metrics["hits"] + self._metrics["misses"]
+        return {
+            **self._metrics,
+            "entries": len(self._entries),
+            "pending_writes": sum(self._pending.values()),
+            "hit_ratio": self._metrics["hits"] / lookups if lookups else 0.0,
+        }
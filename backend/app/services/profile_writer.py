@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.interaction import Interaction
+from ..models.user import User
+from .interaction_history import Turn, unsummarized_tokens
+
+logger = logging.getLogger(__name__)
+
+# A batch whose commit hits a lock timeout or a concurrently created user is retried this often
+_COMMIT_ATTEMPTS = 3
+
+# Queued by `stop`: everything before it is written, then the writer exits
+_STOP = None
+
+
+@dataclass
+class _ProfileWrite:
+    telegram_id: int
+    future: asyncio.Future
+    turns: Tuple[Turn, ...] = ()  # Appended to the interactions table
+    summary: str | None = None  # Replaces the summary, if it still covers up to `previous_through`
+    summarized_through: int | None = None
+    previous_through: int | None = None
+
+
+class ProfileWriter:
+    """
+    The single writer of user profile updates from the chat path.
+
+    Interaction logs queue up here instead of each opening its own write transaction;
+    one task drains the queue every `flush_interval_ms` and inserts the pending turns,
+    and applies any summary replacements, in a single transaction. With SQLite, which
+    allows one writer at a time, concurrent chats then never contend for the write lock
+    (readers are not blocked in WAL mode).
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        flush_interval_ms: float = 5.0,
+        max_batch_size: int = 256,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._metrics = {"transactions": 0, "writes": 0, "retries": 0, "failed_writes": 0, "max_queue_depth": 0}
+
+    def start(self):
+        """Starts the writer task. Must be called from a running event loop."""
+        if self._worker is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"User profile writer started (flush_interval_ms={self.flush_interval * 1000:g}, "
+            f"max_batch_size={self.max_batch_size})."
+        )
+
+    async def stop(self):
+        """Writes whatever is still queued, then stops the writer task."""
+        if self._worker is None:
+            return
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+
+    async def _submit(self, write: _ProfileWrite) -> int:
+        if self._worker is None:
+            self.start()
+        await self._queue.put(write)
+        self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], self._queue.qsize())
+        return await write.future
+
+    async def append_interactions(self, telegram_id: int, turns: Sequence[Turn]) -> int:
+        """
+        Appends turns to a user's interaction history, creating the user if needed.
+        Returns the tokens in the user's turns not yet folded into their summary.
+        """
+        future = asyncio.get_running_loop().create_future()
+        return await self._submit(_ProfileWrite(telegram_id, future, turns=tuple(turns)))
+
+    async def replace_summary(self, telegram_id: int, summary: str, summarized_through: int, previous_through: int | None) -> int:
+        """
+        Replaces a user's summary with one that covers their turns up to `summarized_through`,
+        unless it was replaced since it covered `previous_through`. Returns the tokens still unsummarized.
+        """
+        future = asyncio.get_running_loop().create_future()
+        return await self._submit(
+            _ProfileWrite(
+                telegram_id,
+                future,
+                summary=summary,
+                summarized_through=summarized_through,
+                previous_through=previous_through,
+            )
+        )
+
+    @staticmethod
+    def _apply(db: AsyncSession, user: User, write: _ProfileWrite):
+        for turn in write.turns:
+            db.add(Interaction(user_id=user.id, role=turn.role, text=turn.text, token_count=turn.token_count))
+        if write.summary is None:
+            return
+        if user.summarized_interaction_id != write.previous_through:
+            # Compacted concurrently by another process; its summary is kept
+            logger.debug(f"Interaction summary of user {write.telegram_id} changed while it was condensed.")
+            return
+        user.interaction_summary = write.summary
+        user.summarized_interaction_id = write.summarized_through
+
+    async def _write_batch(self, batch: List[_ProfileWrite]):
+        """
+        Applies the writes in order, in one transaction, and resolves each with the tokens
+        its user has unsummarized once the batch is written.
+        """
+        telegram_ids = {write.telegram_id for write in batch}
+        for attempt in range(1, _COMMIT_ATTEMPTS + 1):
+            try:
+                async with self.session_factory() as db:
+                    users = {
+                        user.telegram_id: user
+                        for user in await db.scalars(select(User).where(User.telegram_id.in_(telegram_ids)))
+                    }
+                    missing = telegram_ids - users.keys()
+                    if missing:
+                        for telegram_id in missing:
+                            users[telegram_id] = User(telegram_id=telegram_id, interests=[], interaction_summary="")
+                            db.add(users[telegram_id])
+                        await db.flush()  # Assigns the ids the turns refer to
+                    for write in batch:
+                        self._apply(db, users[write.telegram_id], write)
+                    await db.flush()
+                    tokens = await unsummarized_tokens(db, [user.id for user in users.values()])
+                    results = [tokens.get(users[write.telegram_id].id, 0) for write in batch]
+                    await db.commit()
+                break
+            except (IntegrityError, OperationalError) as e:
+                # A user created by a chat read, or a lock held longer than the busy timeout
+                if attempt == _COMMIT_ATTEMPTS:
+                    self._fail(batch, e)
+                    return
+                self._metrics["retries"] += 1
+                logger.warning(f"Retrying a batch of {len(batch)} profile writes (attempt {attempt}): {e}")
+            except Exception as e:
+                self._fail(batch, e)
+                return
+
+        self._metrics["transactions"] += 1
+        self._metrics["writes"] += len(batch)
+        for write, result in zip(batch, results):
+            if not write.future.done():
+                write.future.set_result(result)
+
+    def _fail(self, batch: List[_ProfileWrite], error: Exception):
+        logger.error(f"Failed to write a batch of {len(batch)} profile writes: {error}", exc_info=error)
+        self._metrics["failed_writes"] += len(batch)
+        for write in batch:
+            if not write.future.done():
+                write.future.set_exception(error)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            write = await self._queue.get()
+            if write is _STOP:
+                return
+            batch = [write]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    write = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if write is _STOP:
+                    stopping = True
+                    break
+                batch.append(write)
+            await self._write_batch(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        transactions = self._metrics["transactions"]
+        return {
+            **self._metrics,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "avg_batch_size": self._metrics["writes"] / transactions if transactions else 0.0,
+        }
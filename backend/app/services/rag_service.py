@@ -1,93 +1,184 @@
+import asyncio
+import itertools
 import logging
-import io
-import chromadb
-import pypdf
-from sentence_transformers import SentenceTransformer
+import os
+import tempfile
+from concurrent.futures import Executor
+from functools import partial
+from contextlib import closing
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi.concurrency import run_in_threadpool
 from fastapi import Depends, Request, HTTPException
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from rank_bm25 import BM25Okapi
-from typing import List
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Dict, Iterator, List
 
-from ..models.document import Document
 from ..core.config import settings
 from ..core.exceptions import RAGServiceError, LLMServiceError
+from ..core.startup import require_ready
+from .answer_cache import SemanticAnswerCache
+from .chunk_store import ChunkStore
+from .document_processing import iter_chunks, read_spooled_pages, spool_pages
+from .embedding_service import EmbeddingService
+from .ingestion import (
+    DocumentIngestion,
+    IngestionPlan,
+    IngestionProgress,
+    apply_ingestion_plans,
+    is_document_current,
+    record_ingestion,
+)
+from .keyword_index import BM25Index
+from .reranker import CrossEncoderReranker
+from .vector_store import VectorStore
 from .llm_service import LLMService, PromptStrategy, get_llm_service
 from .user_service import UserService, get_user_service
 
+if TYPE_CHECKING:
+    import chromadb
+
+    from .retrieval_client import RetrievalClient
+
 logger = logging.getLogger(__name__)
 
-def _extract_text_from_pdf(content: bytes) -> str:
-    """Extracts text from a PDF file's byte content."""
-    try:
-        pdf_reader = pypdf.PdfReader(io.BytesIO(content))
-        return "".join(page.extract_text() for page in pdf_reader.pages if page.extract_text())
-    except pypdf.errors.PdfReadError as e:
-        logger.error(f"Failed to read PDF: {e}")
-        raise RAGServiceError("Could not process PDF file. It may be corrupt or unsupported.")
-
-def _db_check_existing(db: Session, file_name: str) -> bool:
-    return db.query(Document).filter(Document.file_name == file_name).first() is not None
-
-def _db_add_document(db: Session, doc: Document):
-    try:
-        db.add(doc)
-        db.commit()
-    except SQLAlchemyError:
-        db.rollback()
-        raise
+def _take(iterator: Iterator, n: int) -> List:
+    return list(itertools.islice(iterator, n))
+
+@dataclass
+class Retrieval:
+    """
+    The outcome of hybrid retrieval for one query: the chunks to answer from, or a final
+    answer (a cached one, or why there is nothing to answer from).
+    """
+    documents: List[str] = field(default_factory=list)
+    answer: str | None = None
+    query_embedding: Any = None
+    cache_generation: int | None = None
+
+@dataclass
+class _AnswerPlan:
+    """The outcome of the retrieval stage: a final answer, or the LLM request that produces one."""
+    answer: str | None = None
+    strategy: PromptStrategy | None = None
+    llm_context: Dict[str, str] = field(default_factory=dict)
+    query_embedding: Any = None
+    cache_generation: int | None = None
+
+@dataclass
+class _SemanticBranch:
+    """What the embedding + vector search branch produced before it finished or timed out."""
+    query_embedding: Any = None
+    cached_answer: str | None = None
+    ids: List[str] = field(default_factory=list)
 
 class RAGService:
     def __init__(
         self,
         llm_service: LLMService,
         user_service: UserService,
-        model: SentenceTransformer,
-        collection: chromadb.Collection,
+        embedding_service: EmbeddingService,
+        collection: "chromadb.Collection",
+        keyword_index: BM25Index,
+        chunk_store: ChunkStore,
+        vector_store: VectorStore,
+        answer_cache: SemanticAnswerCache | None = None,
+        extraction_pool: Executor | None = None,
+        ingest_executor: Executor | None = None,
+        reranker: CrossEncoderReranker | None = None,
     ):
         self.llm_service = llm_service
         self.user_service = user_service
-        self.model = model
+        self.embedding_service = embedding_service
         self.collection = collection
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200
-        )
+        self.keyword_index = keyword_index
+        self.chunk_store = chunk_store
+        self.vector_store = vector_store
+        self.answer_cache = answer_cache
+        self.extraction_pool = extraction_pool
+        # Blocking ingestion work runs here rather than in the threadpool serving chat requests
+        self.ingest_executor = ingest_executor
+        self.reranker = reranker
+
+    async def _run_ingest(self, executor: Executor | None, func, *args):
+        if executor is None:
+            return await run_in_threadpool(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(func, *args))
 
-    async def ingest_document(self, db: Session, file_name: str, content: bytes):
+    async def ingest_document(
+        self,
+        db: Session,
+        file_name: str,
+        path: str,
+        content_hash: str,
+        progress: IngestionProgress | None = None,
+    ):
+        """
+        Ingests a document spooled to `path`. Text is extracted page by page in a worker
+        process, then chunked, embedded and written in bounded batches, so peak memory
+        does not depend on the size of the document. `progress` is updated as it goes.
+        """
+        progress = progress or IngestionProgress()
+        run = partial(self._run_ingest, self.ingest_executor)
         try:
-            if await run_in_threadpool(_db_check_existing, db, file_name):
-                logger.info(f"Document '{file_name}' already ingested. Skipping.")
+            if await run(is_document_current, db, file_name, content_hash):
+                logger.info(f"Document '{file_name}' already ingested with identical content. Skipping.")
+                progress.stage = "skipped"
                 return
 
-            text_content = ""
-            if file_name.endswith(".pdf"):
-                text_content = await run_in_threadpool(_extract_text_from_pdf, content)
-            else: # For .txt, .md
+            with tempfile.TemporaryDirectory(dir=settings.INGEST_SPOOL_DIR) as spool_dir:
+                spool_path = os.path.join(spool_dir, "pages.jsonl")
+                progress.stage = "extracting"
+                progress.pages = await self._run_ingest(
+                    self.extraction_pool or self.ingest_executor, spool_pages, path, file_name, spool_path
+                )
+
+                progress.stage = "embedding"
+                ingestion = await run(DocumentIngestion, db, self.collection, self.vector_store, file_name, content_hash)
                 try:
-                    text_content = content.decode("utf-8")
-                except UnicodeDecodeError:
-                    logger.warning(f"UTF-8 decoding failed for {file_name}, trying latin-1.")
-                    text_content = content.decode("latin-1", errors="ignore")
-            
-            if not text_content.strip():
-                raise RAGServiceError(f"No text content extracted from {file_name}.")
-
-            chunks = self.text_splitter.split_text(text_content)
-            if not chunks:
-                raise RAGServiceError(f"No content chunks to ingest from {file_name}.")
-
-            ids = [f"{file_name}_{i}" for i in range(len(chunks))]
-            embeddings = await run_in_threadpool(self.model.encode, chunks)
-            
-            await run_in_threadpool(
-                self.collection.upsert, embeddings=embeddings, documents=chunks, metadatas=[{"source": file_name}] * len(chunks), ids=ids
-            )
+                    with closing(iter_chunks(read_spooled_pages(spool_path))) as chunks:
+                        # Only chunks whose content changed are embedded and written
+                        while batch := await run(_take, chunks, self.embedding_service.ingest_batch_size):
+                            plan = await run(ingestion.plan_batch, batch)
+                            await self._apply_plan(plan)
+                            progress.chunks += len(plan.chunk_ids)
+                            progress.chunks_embedded += len(plan.new_chunks) - len(plan.reused_embeddings)
+                            progress.chunks_reused += len(plan.reused_embeddings)
+
+                    if not ingestion.chunk_ids:
+                        raise RAGServiceError(f"No text content extracted from {file_name}.")
 
-            new_doc_meta = Document(source="local", file_name=file_name)
-            await run_in_threadpool(_db_add_document, db, new_doc_meta)
-            logger.info(f"Successfully ingested {len(chunks)} chunks from '{file_name}'.")
+                    # Recorded before the stale chunks are deleted, so the database never
+                    # describes a version whose chunks the stores no longer hold
+                    progress.stage = "finalizing"
+                    final_plan = ingestion.finish()
+                    await run(record_ingestion, db, [final_plan])
+                except Exception:
+                    # Leave the previous version of the document intact
+                    await run(
+                        apply_ingestion_plans,
+                        self.collection,
+                        self.keyword_index,
+                        self.chunk_store,
+                        self.vector_store,
+                        [ingestion.rollback()],
+                        {},
+                    )
+                    raise
+
+            # Delete the chunks that disappeared from the new version
+            await self._apply_plan(final_plan)
+            progress.chunks_removed = len(final_plan.stale_ids)
+            await run(self.keyword_index.save)
+            await run(self.vector_store.save)
+            if self.answer_cache:
+                # Cached answers may no longer reflect the knowledge base.
+                self.answer_cache.invalidate()
+            progress.stage = "done"
+            logger.info(
+                f"Ingested '{file_name}': {len(final_plan.chunk_ids)} chunks, "
+                f"{len(ingestion.written_ids)} new, {len(final_plan.stale_ids)} removed."
+            )
 
         except (RAGServiceError, LLMServiceError) as e:
             logger.error(f"Service error during ingestion: {e}")
@@ -99,81 +190,196 @@ class RAGService:
             logger.error(f"Unexpected error ingesting {file_name}: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail="An unexpected server error occurred.")
 
-    async def query(self, db: Session, user_query: str, user_id: int | None = None) -> str:
-        logger.info(f"Performing HYBRID RAG query for: '{user_query}'")
+    async def _apply_plan(self, plan: IngestionPlan):
+        """Embeds the changed chunks of a plan and writes the delta to the stores."""
+        to_embed = plan.to_embed
+        embeddings = {}
+        if to_embed:
+            vectors = await self.embedding_service.embed_documents(list(to_embed.values()))
+            embeddings = dict(zip(to_embed, vectors.tolist()))
+        if plan.changes_stores:
+            await self._run_ingest(
+                self.ingest_executor,
+                apply_ingestion_plans,
+                self.collection,
+                self.keyword_index,
+                self.chunk_store,
+                self.vector_store,
+                [plan],
+                embeddings,
+            )
+
+    async def _run_branch(self, name: str, branch: Awaitable, timeout_ms: float, default: Any) -> Any:
+        """Awaits one retrieval branch, degrading to `default` if it fails or exceeds its timeout."""
+        try:
+            return await asyncio.wait_for(branch, timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            logger.warning(f"The {name} retrieval branch timed out after {timeout_ms:g} ms; continuing without it.")
+        except Exception as e:
+            logger.error(f"The {name} retrieval branch failed: {e}", exc_info=True)
+        return default
+
+    async def _keyword_search(self, user_query: str, n_results: int) -> List[str]:
+        """Keyword Search (BM25) with top-k pruning over the persistent inverted index."""
+        bm25_results = await run_in_threadpool(self.keyword_index.search, user_query, n_results)
+        return [doc_id for doc_id, _ in bm25_results]
+
+    async def _semantic_search(
+        self, user_query: str, strategy: PromptStrategy, user_id: int | None, n_results: int, result: "_SemanticBranch"
+    ):
+        """
+        Embeds the query, serves a semantically equivalent cached answer if there is one,
+        and otherwise runs the vector search. Fills in `result` as it goes, so the query
+        embedding survives even if the vector search times out.
+        """
+        query_embedding = await self.embedding_service.embed_query(user_query)
+        result.query_embedding = query_embedding[0]
+        if self.answer_cache:
+            result.cached_answer = self.answer_cache.lookup(query_embedding[0], strategy, user_id)
+            if result.cached_answer is not None:
+                return
+        semantic_results = await run_in_threadpool(self.vector_store.search, query_embedding, n_results)
+        result.ids = semantic_results[0]
+
+    async def retrieve(self, user_query: str, strategy: PromptStrategy, user_id: int | None) -> Retrieval:
+        """
+        Runs the answer cache lookup and hybrid retrieval: keyword and vector search,
+        fusion, and optional re-ranking. Needs no database session.
+        """
+        if len(self.keyword_index) == 0:
+            return Retrieval(answer="I could not find any information to answer your question as the knowledge base is empty.")
+
+        # With a re-ranker, both retrievers supply a wider candidate pool for it to choose from
+        n_candidates = settings.RERANK_CANDIDATE_POOL if self.reranker else settings.RAG_N_RESULTS
+        cache_generation = self.answer_cache.generation if self.answer_cache else None
+
+        # 1-3. Run the keyword search concurrently with embedding the query, looking up the answer
+        # cache and the vector search; a cache hit cancels the keyword search. Each branch has its
+        # own timeout; a branch that fails or times out contributes no results.
+        keyword_branch = asyncio.ensure_future(
+            self._run_branch(
+                "keyword", self._keyword_search(user_query, n_candidates), settings.RAG_KEYWORD_TIMEOUT_MS, []
+            )
+        )
+        semantic = _SemanticBranch()
         try:
-            # 1. Retrieve all documents from ChromaDB for BM25 indexing.
-            # This is inefficient for very large collections but suitable for this implementation.
-            # In a production system, the BM25 index might be pre-built and maintained separately.
-            all_docs_data = await run_in_threadpool(self.collection.get, include=["documents"])
-            
-            corpus_docs = all_docs_data.get('documents')
-            corpus_ids = all_docs_data.get('ids')
-
-            if not corpus_docs:
-                return "I could not find any information to answer your question as the knowledge base is empty."
-
-            # 2. Perform Keyword Search (BM25)
-            tokenized_corpus = [doc.lower().split() for doc in corpus_docs]
-            bm25 = BM25Okapi(tokenized_corpus)
-            tokenized_query = user_query.lower().split()
-            
-            bm25_scores = bm25.get_scores(tokenized_query)
-            
-            # Get top N results indices from BM25
-            top_n_bm25_indices = sorted(range(len(bm25_scores)), key=lambda i: bm25_scores[i], reverse=True)[:settings.RAG_N_RESULTS]
-            bm25_ids = [corpus_ids[i] for i in top_n_bm25_indices]
-            logger.debug(f"BM25 top IDs: {bm25_ids}")
-
-            # 3. Perform Semantic Search (Vector Search)
-            query_embedding = await run_in_threadpool(self.model.encode, [user_query])
-            semantic_results = await run_in_threadpool(
-                self.collection.query, query_embeddings=query_embedding, n_results=settings.RAG_N_RESULTS
+            await self._run_branch(
+                "semantic",
+                self._semantic_search(user_query, strategy, user_id, n_candidates, semantic),
+                settings.RAG_SEMANTIC_TIMEOUT_MS,
+                None,
             )
-            semantic_ids = semantic_results.get('ids', [[]])[0]
-            logger.debug(f"Semantic top IDs: {semantic_ids}")
-            
-            # 4. Re-rank results using Reciprocal Rank Fusion (RRF)
-            # RRF is a simple and effective method to combine ranked lists.
-            k = 60  # RRF constant, common default
-            rrf_scores = {}
-            
-            for rank, doc_id in enumerate(semantic_ids):
-                rrf_scores[doc_id] = rrf_scores.get(doc_id, 0) + 1 / (k + rank + 1)
-            
-            for rank, doc_id in enumerate(bm25_ids):
-                rrf_scores[doc_id] = rrf_scores.get(doc_id, 0) + 1 / (k + rank + 1)
-                
-            sorted_fused_ids = sorted(rrf_scores.keys(), key=lambda id: rrf_scores[id], reverse=True)
-            
-            # Get top N results from the fused list
-            final_doc_ids = sorted_fused_ids[:settings.RAG_N_RESULTS]
-            logger.info(f"Final re-ranked doc IDs: {final_doc_ids}")
-
-            # 5. Retrieve document content for the final IDs
-            id_to_doc_map = dict(zip(corpus_ids, corpus_docs))
-            final_documents = [id_to_doc_map[doc_id] for doc_id in final_doc_ids if doc_id in id_to_doc_map]
-            
-            if not final_documents:
-                return "I could not find any relevant information to answer your question."
-            
-            document_context = "\n\n---\n\n".join(final_documents)
-
-            # 6. Generate response with LLM (same as before)
-            llm_context = {"document_context": document_context, "user_query": user_query}
-            strategy = PromptStrategy.GENERAL_QA
-
-            if user_id:
-                user = await self.user_service.get_or_create_user(db, user_id)
-                if user:
-                    logger.info(f"Personalizing query for user_id: {user.id}")
-                    llm_context.update({
-                        "user_interests": str(user.interests),
-                        "user_interaction_summary": user.interaction_summary,
-                    })
-                    strategy = PromptStrategy.PERSONALIZE_RESPONSE
-
-            return await self.llm_service.generate_response(strategy=strategy, context=llm_context)
+            if semantic.cached_answer is not None:
+                logger.info("Serving answer from the semantic answer cache.")
+                return Retrieval(answer=semantic.cached_answer)
+            bm25_ids = await keyword_branch
+        finally:
+            # No-op once the keyword branch finished; otherwise its result is no longer wanted
+            keyword_branch.cancel()
+        semantic_ids = semantic.ids
+        logger.debug(f"BM25 top IDs: {bm25_ids}")
+        logger.debug(f"Semantic top IDs: {semantic_ids}")
+
+        # 4. Re-rank results using Reciprocal Rank Fusion (RRF)
+        # RRF is a simple and effective method to combine ranked lists.
+        k = 60  # RRF constant, common default
+        rrf_scores = {}
+
+        for rank, doc_id in enumerate(semantic_ids):
+            rrf_scores[doc_id] = rrf_scores.get(doc_id, 0) + 1 / (k + rank + 1)
+
+        for rank, doc_id in enumerate(bm25_ids):
+            rrf_scores[doc_id] = rrf_scores.get(doc_id, 0) + 1 / (k + rank + 1)
+
+        sorted_fused_ids = sorted(rrf_scores.keys(), key=lambda id: rrf_scores[id], reverse=True)
+        candidate_ids = sorted_fused_ids[:n_candidates]
+
+        # 5. Fetch the text of the candidates only, by id, from the chunk store
+        id_to_doc_map = await run_in_threadpool(self.chunk_store.get_chunks, candidate_ids) if candidate_ids else {}
+        missing_ids = [doc_id for doc_id in candidate_ids if doc_id not in id_to_doc_map]
+        if missing_ids:
+            # Fall back to ChromaDB for chunks the store does not have (e.g. written by an older version)
+            docs_data = await run_in_threadpool(self.collection.get, ids=missing_ids, include=["documents"])
+            id_to_doc_map.update(zip(docs_data.get('ids', []), docs_data.get('documents', [])))
+        candidate_ids = [doc_id for doc_id in candidate_ids if doc_id in id_to_doc_map]
+
+        # 6. Optionally re-score the candidates with the cross-encoder, within its latency budget
+        if self.reranker and len(candidate_ids) > settings.RAG_N_RESULTS:
+            candidates = [(doc_id, id_to_doc_map[doc_id]) for doc_id in candidate_ids]
+            final_doc_ids = await run_in_threadpool(self.reranker.rerank, user_query, candidates, settings.RAG_N_RESULTS)
+        else:
+            final_doc_ids = candidate_ids[:settings.RAG_N_RESULTS]
+        logger.info(f"Final re-ranked doc IDs: {final_doc_ids}")
+        final_documents = [id_to_doc_map[doc_id] for doc_id in final_doc_ids]
+
+        if not final_documents:
+            return Retrieval(answer="I could not find any relevant information to answer your question.")
+        return Retrieval(
+            documents=final_documents, query_embedding=semantic.query_embedding, cache_generation=cache_generation
+        )
+
+    async def store_answer(
+        self,
+        query_embedding: Any,
+        strategy: PromptStrategy,
+        answer: str,
+        user_id: int | None,
+        cache_generation: int | None,
+    ):
+        """Caches an answer produced from a `Retrieval`, unless documents were ingested since."""
+        if self.answer_cache:
+            self.answer_cache.store(query_embedding, strategy, answer, user_id, generation=cache_generation)
+
+    async def _plan_answer(self, db: AsyncSession, user_query: str, user_id: int | None) -> _AnswerPlan:
+        """
+        Runs everything that precedes the LLM call: retrieval (including the answer cache
+        lookup) and personalization. Returns either a final answer or the LLM request to make.
+        """
+        # Answers are personalized whenever the asker is known.
+        strategy = PromptStrategy.PERSONALIZE_RESPONSE if user_id else PromptStrategy.GENERAL_QA
+
+        retrieval = await self.retrieve(user_query, strategy, user_id)
+        if retrieval.answer is not None:
+            return _AnswerPlan(answer=retrieval.answer)
+
+        document_context = "\n\n---\n\n".join(retrieval.documents)
+
+        # 7. Build the LLM request
+        llm_context = {"document_context": document_context, "user_query": user_query}
+
+        if strategy == PromptStrategy.PERSONALIZE_RESPONSE:
+            user = await self.user_service.get_profile(db, user_id)
+            if user:
+                logger.info(f"Personalizing query for user_id: {user.id}")
+                llm_context.update({
+                    "user_interests": str(user.interests),
+                    "user_interaction_history": self.user_service.personalization_context(user),
+                })
+            else:
+                strategy = PromptStrategy.GENERAL_QA
+
+        return _AnswerPlan(
+            strategy=strategy,
+            llm_context=llm_context,
+            query_embedding=retrieval.query_embedding,
+            cache_generation=retrieval.cache_generation,
+        )
+
+    async def _cache_answer(self, plan: _AnswerPlan, answer: str, user_id: int | None):
+        # The query embedding is missing if the semantic branch timed out before producing it
+        if answer and plan.query_embedding is not None:
+            await self.store_answer(plan.query_embedding, plan.strategy, answer, user_id, plan.cache_generation)
+
+    async def query(self, db: AsyncSession, user_query: str, user_id: int | None = None) -> str:
+        logger.info(f"Performing HYBRID RAG query for: '{user_query}'")
+        try:
+            plan = await self._plan_answer(db, user_query, user_id)
+            if plan.answer is not None:
+                return plan.answer
+
+            answer = await self.llm_service.generate_response(strategy=plan.strategy, context=plan.llm_context)
+            await self._cache_answer(plan, answer, user_id)
+            return answer
 
         except (LLMServiceError, RAGServiceError) as e:
             logger.error(f"Service error during query: {e}")
@@ -182,14 +388,85 @@ class RAGService:
             logger.error(f"Unexpected error during RAG query: {e}", exc_info=True)
             return "I'm sorry, but an unexpected error occurred while processing your request."
 
+    async def query_stream(self, db: AsyncSession, user_query: str, user_id: int | None = None) -> AsyncIterator[str]:
+        """
+        Streaming variant of `query` that yields the answer as the LLM produces it. Errors
+        are raised rather than yielded as text, since part of the answer may already be out;
+        unexpected ones are wrapped in RAGServiceError.
+        """
+        logger.info(f"Performing streaming HYBRID RAG query for: '{user_query}'")
+        try:
+            plan = await self._plan_answer(db, user_query, user_id)
+            if plan.answer is not None:
+                yield plan.answer
+                return
+
+            parts = []
+            async for delta in self.llm_service.stream_response(strategy=plan.strategy, context=plan.llm_context):
+                parts.append(delta)
+                yield delta
+            await self._cache_answer(plan, "".join(parts).strip(), user_id)
+
+        except (LLMServiceError, RAGServiceError) as e:
+            logger.error(f"Service error during streaming query: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error during streaming RAG query: {e}", exc_info=True)
+            raise RAGServiceError("An unexpected error occurred while processing your request.") from e
+
+class RemoteRAGService(RAGService):
+    """
+    A RAGService for API workers that share one retrieval server: retrieval and the
+    answer cache live in the server, while personalization and the LLM call run here.
+    Documents are ingested through the server's job queue, never by the workers.
+    """
+
+    def __init__(self, llm_service: LLMService, user_service: UserService, client: "RetrievalClient"):
+        self.llm_service = llm_service
+        self.user_service = user_service
+        self.client = client
+
+    async def ingest_document(self, *args, **kwargs):
+        raise RAGServiceError("Documents are ingested by the retrieval server; submit them to its ingestion queue.")
+
+    async def retrieve(self, user_query: str, strategy: PromptStrategy, user_id: int | None) -> Retrieval:
+        return await self.client.retrieve(user_query, strategy, user_id)
+
+    async def store_answer(
+        self,
+        query_embedding: Any,
+        strategy: PromptStrategy,
+        answer: str,
+        user_id: int | None,
+        cache_generation: int | None,
+    ):
+        await self.client.store_answer(query_embedding, strategy, answer, user_id, cache_generation)
+
+def create_rag_service(state, llm_service: LLMService, user_service: UserService) -> RAGService:
+    """
+    Builds a RAGService around the long-lived components kept in `app.state`, or around
+    the retrieval server when the workers share one.
+    """
+    if getattr(state, "retrieval_client", None):
+        return RemoteRAGService(llm_service, user_service, state.retrieval_client)
+    return RAGService(
+        llm_service=llm_service,
+        user_service=user_service,
+        embedding_service=state.embedding_service,
+        collection=state.rag_collection,
+        keyword_index=state.keyword_index,
+        chunk_store=state.chunk_store,
+        vector_store=state.vector_store,
+        answer_cache=state.answer_cache,
+        extraction_pool=state.extraction_pool,
+        ingest_executor=state.ingest_executor,
+        reranker=state.reranker,
+    )
+
 def get_rag_service(
     request: Request,
     llm_service: LLMService = Depends(get_llm_service),
     user_service: UserService = Depends(get_user_service),
 ) -> RAGService:
-    return RAGService(
-        llm_service=llm_service,
-        user_service=user_service,
-        model=request.app.state.rag_model,
-        collection=request.app.state.rag_collection,
-    )
+    require_ready(request)
+    return create_rag_service(request.app.state, llm_service, user_service)
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest observation in the moving average of scoring cost per pair
+_COST_SMOOTHING = 0.2
+
+
+class CrossEncoderReranker:
+    """
+    Re-scores retrieval candidates with a cross-encoder, which reads the query and a chunk
+    together and ranks far better than either retriever alone.
+
+    Candidates are scored in batches, and (query, chunk id) scores are cached; chunk ids
+    are derived from chunk content, so a cached score never goes stale. A latency budget
+    bounds each call: from a moving average of the cost per pair, only as many uncached
+    candidates are scored as fit the budget (best-fused first), and scoring stops early
+    if a batch overruns it. Candidates left unscored keep their fused order after the
+    scored ones. The lock guards the cache and counters only; the model scores
+    concurrent calls in parallel.
+    """
+
+    def __init__(self, model: Any, batch_size: int = 16, cache_size: int = 10000, latency_budget_ms: float = 300.0):
+        self.model = model
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.latency_budget = latency_budget_ms / 1000
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._seconds_per_pair: float | None = None
+        self._metrics = {"calls": 0, "pairs_scored": 0, "cache_hits": 0, "truncated": 0, "skipped": 0, "score_seconds": 0.0}
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return " ".join(query.casefold().split())
+
+    def _cached(self, key: Tuple[str, str]) -> float | None:
+        score = self._cache.get(key)
+        if score is not None:
+            self._cache.move_to_end(key)
+        return score
+
+    def _remember(self, key: Tuple[str, str], score: float):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = score
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def rerank(self, query: str, candidates: Sequence[Tuple[str, str]], top_n: int) -> List[str]:
+        """
+        Orders (chunk_id, text) candidates, given in fused order, by cross-encoder relevance
+        and returns the ids of the best `top_n`. Blocking; call from a worker thread.
+        """
+        started = time.perf_counter()
+        query_key = self._normalize(query)
+        scores: Dict[str, float] = {}
+        pending: List[Tuple[str, str]] = []
+        with self._lock:
+            self._metrics["calls"] += 1
+            for chunk_id, text in candidates:
+                score = self._cached((query_key, chunk_id))
+                if score is None:
+                    pending.append((chunk_id, text))
+                else:
+                    scores[chunk_id] = score
+                    self._metrics["cache_hits"] += 1
+
+            if pending and self._seconds_per_pair:
+                remaining = self.latency_budget - (time.perf_counter() - started)
+                affordable = max(0, int(remaining / self._seconds_per_pair))
+                if affordable < len(pending):
+                    self._metrics["truncated" if affordable else "skipped"] += 1
+                    pending = pending[:affordable]
+
+        # Scored outside the lock, so concurrent requests re-rank in parallel rather than queueing
+        for start in range(0, len(pending), self.batch_size):
+            if time.perf_counter() - started >= self.latency_budget:
+                with self._lock:
+                    self._metrics["truncated"] += 1
+                break
+            batch = pending[start:start + self.batch_size]
+            batch_started = time.perf_counter()
+            batch_scores = self.model.predict([(query, text) for _, text in batch], batch_size=len(batch))
+            elapsed = time.perf_counter() - batch_started
+
+            per_pair = elapsed / len(batch)
+            with self._lock:
+                if self._seconds_per_pair is None:
+                    self._seconds_per_pair = per_pair
+                else:
+                    self._seconds_per_pair += _COST_SMOOTHING * (per_pair - self._seconds_per_pair)
+                self._metrics["pairs_scored"] += len(batch)
+                self._metrics["score_seconds"] += elapsed
+                for (chunk_id, _), score in zip(batch, batch_scores):
+                    scores[chunk_id] = float(score)
+                    self._remember((query_key, chunk_id), float(score))
+
+        fused_order = [chunk_id for chunk_id, _ in candidates]
+        scored = sorted((chunk_id for chunk_id in fused_order if chunk_id in scores), key=lambda c: scores[c], reverse=True)
+        unscored = [chunk_id for chunk_id in fused_order if chunk_id not in scores]
+        return (scored + unscored)[:top_n]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._metrics,
+                "cache_entries": len(self._cache),
+                "ms_per_pair": self._seconds_per_pair * 1000 if self._seconds_per_pair else None,
+            }
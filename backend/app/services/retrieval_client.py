@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from typing import Any, Dict, Tuple
+
+import httpx
+import numpy as np
+
+from ..core.exceptions import RAGServiceError
+from ..core.startup import StartupProgress
+from .ingestion_jobs import IngestionQueueFullError
+from .rag_service import Retrieval
+from .llm_service import PromptStrategy
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalClient:
+    """
+    Talks to the retrieval server (`app.retrieval_server`) over its Unix socket. API
+    workers use it instead of loading the models, ChromaDB and the indexes themselves.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=socket_path), base_url="http://retrieval-server", timeout=timeout
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _request(
+        self, method: str, url: str, expected_statuses: Tuple[int, ...] = (), **kwargs
+    ) -> httpx.Response:
+        """Sends a request; any error status not in `expected_statuses` raises RAGServiceError."""
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.RequestError as e:
+            raise RAGServiceError(f"The retrieval server at '{self.socket_path}' is unreachable: {e}") from e
+        if response.is_error and response.status_code not in expected_statuses:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise RAGServiceError(
+                f"The retrieval server answered {method} {url} with status {response.status_code}: {detail}"
+            )
+        return response
+
+    async def wait_until_ready(self, startup: StartupProgress, poll_seconds: float = 0.5):
+        """Polls the server's /ready until it has loaded its models and indexes, then marks this worker ready."""
+        with startup.step("retrieval server"):
+            while True:
+                try:
+                    response = await self.client.get("/ready")
+                    if response.status_code == 200:
+                        break
+                    if response.json().get("status") == "failed":
+                        startup.mark_failed(f"The retrieval server failed to start: {response.json().get('error')}")
+                        return
+                except httpx.RequestError:
+                    pass  # Not listening yet
+                await asyncio.sleep(poll_seconds)
+        startup.mark_ready()
+
+    async def retrieve(self, user_query: str, strategy: PromptStrategy, user_id: int | None) -> Retrieval:
+        response = await self._request(
+            "POST", "/retrieve", json={"query": user_query, "strategy": strategy.value, "user_id": user_id}
+        )
+        return Retrieval(**response.json())
+
+    async def store_answer(
+        self, query_embedding: Any, strategy: PromptStrategy, answer: str, user_id: int | None, cache_generation: int | None
+    ):
+        await self._request(
+            "POST",
+            "/answers",
+            json={
+                "query_embedding": np.asarray(query_embedding, dtype=np.float32).tolist(),
+                "strategy": strategy.value,
+                "answer": answer,
+                "user_id": user_id,
+                "cache_generation": cache_generation,
+            },
+        )
+
+    async def submit_ingestion(self, file_name: str, path: str, content_hash: str, priority: int = 0) -> Dict[str, Any]:
+        """
+        Queues a spooled document on the server, which takes ownership of the file at
+        `path` (it must be on a file system the server can read). Returns the job.
+        """
+        response = await self._request(
+            "POST",
+            "/ingest/jobs",
+            expected_statuses=(429,),
+            json={"file_name": file_name, "path": path, "content_hash": content_hash, "priority": priority},
+        )
+        if response.status_code == 429:
+            raise IngestionQueueFullError(response.json()["detail"])
+        return response.json()
+
+    async def get_ingestion_job(self, job_id: str) -> Dict[str, Any] | None:
+        response = await self._request("GET", f"/ingest/jobs/{job_id}", expected_statuses=(404,))
+        if response.status_code == 404:
+            return None
+        return response.json()
+
+    async def request_compaction(self, telegram_id: int, unsummarized_tokens: int):
+        """Asks the server's summary compactor, shared by every worker, to fold a user's older turns."""
+        await self._request(
+            "POST", "/compactions", json={"telegram_id": telegram_id, "unsummarized_tokens": unsummarized_tokens}
+        )
+
+    async def metrics(self) -> Dict[str, Any]:
+        response = await self._request("GET", "/metrics")
+        return response.json()
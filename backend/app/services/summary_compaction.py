@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Dict, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from .interaction_history import USER_ROLE, Turn, load_unsummarized_turns
+from .llm_service import PromptStrategy
+from .profile_writer import ProfileWriter
+
+if TYPE_CHECKING:
+    from .user_service import UserService
+
+logger = logging.getLogger(__name__)
+
+_HOUR_SECONDS = 3600.0
+
+
+class SummaryCompactor:
+    """
+    Folds a user's older turns into their rolling summary once the turns not yet in it
+    pass the high-water mark, off the chat path.
+
+    Logging an interaction only asks for a compaction. Requests are debounced per user:
+    the compaction runs once the user has been quiet for `debounce_seconds`, or at the
+    latest `max_delay_seconds` after the first request, so a chatty user costs one LLM
+    call per burst rather than one every few messages. A user is scheduled at most once
+    and compacted by one task at a time. Due users are compacted in batches, their LLM
+    calls running concurrently. The newest turns, up to the low-water mark, are left out
+    of the summary, so it takes a good many interactions before the next compaction.
+    """
+
+    def __init__(
+        self,
+        user_service: "UserService",
+        session_factory: Callable[[], AsyncSession],
+        profile_writer: ProfileWriter | None = None,
+        high_water_tokens: int = 1500,
+        low_water_tokens: int = 500,
+        max_summary_chars: int = 1200,
+        debounce_seconds: float = 30.0,
+        max_delay_seconds: float = 300.0,
+        max_batch_size: int = 8,
+    ):
+        self.user_service = user_service
+        self.session_factory = session_factory
+        self.profile_writer = profile_writer
+        self.high_water_tokens = high_water_tokens
+        self.low_water_tokens = low_water_tokens
+        self.max_summary_chars = max_summary_chars
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_batch_size = max_batch_size
+        # Telegram id -> (due at, first requested at), in loop time
+        self._scheduled: Dict[int, tuple[float, float]] = {}
+        self._in_flight: set[int] = set()
+        self._wakeup: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self._completed_at: deque = deque()  # Wall-clock times of the compactions of the last hour
+        self._metrics = {
+            "requests": 0, "compactions": 0, "skipped": 0, "failures": 0, "batches": 0, "turns_folded": 0, "tokens_folded": 0
+        }
+
+    def start(self):
+        """Starts the scheduler task. Must be called from a running event loop."""
+        if self._worker is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Summary compaction started (high_water_tokens={self.high_water_tokens}, "
+            f"low_water_tokens={self.low_water_tokens}, debounce_seconds={self.debounce_seconds:g})."
+        )
+
+    async def stop(self):
+        """Stops the scheduler. Summaries still scheduled are compacted on their next request."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+
+    def request(self, telegram_id: int, unsummarized_tokens: int):
+        """
+        Schedules a compaction if the turns not in the summary passed the high-water mark,
+        pushing back one already scheduled.
+        """
+        if unsummarized_tokens <= self.high_water_tokens:
+            return
+        if self._worker is None:
+            self.start()
+        self._metrics["requests"] += 1
+        now = asyncio.get_running_loop().time()
+        _, first_requested = self._scheduled.get(telegram_id, (None, now))
+        due_at = min(now + self.debounce_seconds, first_requested + self.max_delay_seconds)
+        self._scheduled[telegram_id] = (due_at, first_requested)
+        self._wakeup.set()
+
+    def _due(self, now: float) -> List[int]:
+        due = sorted(
+            (due_at, telegram_id)
+            for telegram_id, (due_at, _) in self._scheduled.items()
+            if due_at <= now and telegram_id not in self._in_flight
+        )
+        return [telegram_id for _, telegram_id in due[:self.max_batch_size]]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self._due(loop.time())
+            if not batch:
+                self._wakeup.clear()
+                next_due = min((due_at for due_at, _ in self._scheduled.values()), default=None)
+                timeout = None if next_due is None else max(next_due - loop.time(), 0)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for telegram_id in batch:
+                del self._scheduled[telegram_id]
+                self._in_flight.add(telegram_id)
+            self._metrics["batches"] += 1
+            try:
+                await asyncio.gather(*(self._compact(telegram_id) for telegram_id in batch))
+            finally:
+                self._in_flight.difference_update(batch)
+
+    def _turns_to_fold(self, turns: List[Turn]) -> List[Turn]:
+        """
+        The oldest turns, leaving out of the summary the newest ones that fit under the
+        low-water mark. Only whole exchanges are folded: the turns left out start with a
+        user message, never with an answer whose question went into the summary.
+        """
+        kept_tokens = 0
+        kept = 0
+        for turn in reversed(turns):
+            if kept_tokens + turn.token_count > self.low_water_tokens:
+                break
+            kept_tokens += turn.token_count
+            kept += 1
+        boundary = len(turns) - kept
+        while boundary < len(turns) and turns[boundary].role != USER_ROLE:
+            boundary += 1
+        return turns[:boundary]
+
+    async def _compact(self, telegram_id: int):
+        try:
+            async with self.session_factory() as db:
+                # Read now rather than at request time: interactions logged meanwhile are included
+                user = await self.user_service.get_user_by_telegram_id(db, telegram_id)
+                turns = await load_unsummarized_turns(db, user) if user else []
+                if sum(turn.token_count for turn in turns) <= self.high_water_tokens:
+                    self._metrics["skipped"] += 1  # Compacted since it was requested
+                    return
+                folded = self._turns_to_fold(turns)
+                summary = await self.user_service.condense_summary(
+                    telegram_id, user.interaction_summary or "", folded, self.max_summary_chars
+                )
+                await self.user_service.replace_summary(
+                    db, self.profile_writer, telegram_id, summary, folded[-1].id, user.summarized_interaction_id
+                )
+        except Exception as e:
+            # The turns stay out of the summary; the next interaction logged requests another compaction
+            self._metrics["failures"] += 1
+            logger.error(f"Failed to compact the interaction history of user {telegram_id}: {e}", exc_info=True)
+            return
+        self._metrics["compactions"] += 1
+        self._metrics["turns_folded"] += len(folded)
+        self._metrics["tokens_folded"] += sum(turn.token_count for turn in folded)
+        self._completed_at.append(time.time())
+        logger.info(f"Folded {len(folded)} turns of user {telegram_id} into a {len(summary)}-char summary.")
+
+    def stats(self) -> Dict[str, Any]:
+        while self._completed_at and self._completed_at[0] < time.time() - _HOUR_SECONDS:
+            self._completed_at.popleft()
+        usage = self.user_service.llm_service.usage_stats().get(PromptStrategy.SUMMARIZE_INTERACTION_HISTORY.value, {})
+        compactions = self._metrics["compactions"]
+        return {
+            **self._metrics,
+            "scheduled": len(self._scheduled),
+            "in_flight": len(self._in_flight),
+            "compactions_last_hour": len(self._completed_at),
+            "llm_tokens": usage.get("total_tokens", 0),
+            "llm_tokens_per_compaction": usage.get("total_tokens", 0) / compactions if compactions else 0.0,
+        }
+
+
+def build_summary_compactor(
+    user_service: "UserService", session_factory: Callable[[], AsyncSession], profile_writer: ProfileWriter | None = None
+) -> SummaryCompactor:
+    """Builds the summary compactor described by the application settings."""
+    return SummaryCompactor(
+        user_service,
+        session_factory,
+        profile_writer=profile_writer,
+        high_water_tokens=settings.SUMMARY_COMPACTION_HIGH_WATER_TOKENS,
+        low_water_tokens=settings.SUMMARY_COMPACTION_LOW_WATER_TOKENS,
+        max_summary_chars=settings.INTERACTION_SUMMARY_MAX_CHARS,
+        debounce_seconds=settings.SUMMARY_COMPACTION_DEBOUNCE_SECONDS,
+        max_delay_seconds=settings.SUMMARY_COMPACTION_MAX_DELAY_SECONDS,
+        max_batch_size=settings.SUMMARY_COMPACTION_MAX_BATCH_SIZE,
+    )
@@ -1,125 +1,218 @@
 import logging
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import SQLAlchemyError
-from typing import Dict, Any
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from typing import Dict, Any, List, Sequence
+from dataclasses import replace
 from functools import lru_cache
-from fastapi.concurrency import run_in_threadpool
 from fastapi import Depends
 
+from ..core.config import settings
+from ..models.interaction import Interaction
 from ..models.user import User
+from .interaction_history import Turn, build_personalization_context, load_recent_turns, render_turns, unsummarized_tokens
 from .llm_service import LLMService, get_llm_service, PromptStrategy
+from .profile_cache import UserProfile, UserProfileCache
+from .profile_writer import ProfileWriter
 
 # Define fields that are allowed to be updated to prevent mass assignment vulnerabilities
 ALLOWED_UPDATE_FIELDS = ["interests", "interaction_summary"]
 
 logger = logging.getLogger(__name__)
 
-def _db_get_user(db: Session, telegram_id: int) -> User | None:
-    return db.query(User).filter(User.telegram_id == telegram_id).first()
+async def _db_get_user(db: AsyncSession, telegram_id: int) -> User | None:
+    return await db.scalar(select(User).where(User.telegram_id == telegram_id))
 
-def _db_create_user(db: Session, telegram_id: int) -> User:
-    new_user = User(telegram_id=telegram_id)
+async def _db_create_user(db: AsyncSession, telegram_id: int) -> User:
+    # Set the defaults here so the new user is complete without reading it back
+    new_user = User(telegram_id=telegram_id, interests=[], interaction_summary="")
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
         return new_user
     except SQLAlchemyError:
-        db.rollback()
+        await db.rollback()
         raise
 
-def _db_append_interaction_summary(db: Session, user: User, new_interaction: str) -> User:
-    current_summary = user.interaction_summary or ""
-    new_summary = f"{current_summary}\n- {new_interaction}".strip()
-    user.interaction_summary = new_summary
+async def _db_append_interactions(db: AsyncSession, user: User, turns: Sequence[Turn]) -> int:
+    db.add_all(
+        Interaction(user_id=user.id, role=turn.role, text=turn.text, token_count=turn.token_count) for turn in turns
+    )
     try:
-        db.commit()
-        db.refresh(user)
-        return user
+        await db.commit()
     except SQLAlchemyError:
-        db.rollback()
+        await db.rollback()
         raise
+    return (await unsummarized_tokens(db, [user.id])).get(user.id, 0)
 
-def _db_update_user(db: Session, user: User, profile_data: Dict[str, Any]) -> User:
+async def _db_update_user(db: AsyncSession, user: User, profile_data: Dict[str, Any]) -> User:
     for key, value in profile_data.items():
         if key in ALLOWED_UPDATE_FIELDS:
             setattr(user, key, value)
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
         return user
     except SQLAlchemyError:
-        db.rollback()
+        await db.rollback()
         raise
 
 class UserService:
-    # Define a threshold for when to summarize the interaction history (in characters)
-    MAX_SUMMARY_LENGTH = 2000
-
-    def __init__(self, llm_service: LLMService):
+    def __init__(
+        self,
+        llm_service: LLMService,
+        profile_cache: UserProfileCache | None = None,
+        max_recent_turns: int = 10,
+        context_token_budget: int = 800,
+    ):
         self.llm_service = llm_service
-    async def get_user_by_telegram_id(self, db: Session, telegram_id: int) -> User | None:
+        self.profile_cache = profile_cache
+        self.max_recent_turns = max_recent_turns
+        self.context_token_budget = context_token_budget
+
+    async def get_user_by_telegram_id(self, db: AsyncSession, telegram_id: int) -> User | None:
         """Asynchronously retrieve a user by their Telegram ID."""
-        return await run_in_threadpool(_db_get_user, db, telegram_id)
+        return await _db_get_user(db, telegram_id)
 
-    async def create_user(self, db: Session, telegram_id: int) -> User:
+    async def create_user(self, db: AsyncSession, telegram_id: int) -> User:
         """Asynchronously create a new user with a given Telegram ID."""
-        return await run_in_threadpool(_db_create_user, db, telegram_id)
+        return await _db_create_user(db, telegram_id)
 
-    async def get_or_create_user(self, db: Session, telegram_id: int) -> User:
+    async def get_or_create_user(self, db: AsyncSession, telegram_id: int) -> User:
         """Asynchronously retrieve a user or create them if they don't exist."""
         user = await self.get_user_by_telegram_id(db, telegram_id)
         if not user:
-            user = await self.create_user(db, telegram_id)
+            try:
+                user = await self.create_user(db, telegram_id)
+            except IntegrityError:
+                # A concurrent request created the user first
+                user = await self.get_user_by_telegram_id(db, telegram_id)
         return user
 
-    async def update_user_profile(self, db: Session, telegram_id: int, profile_data: Dict[str, Any]) -> User | None:
+    async def get_profile(self, db: AsyncSession, telegram_id: int) -> UserProfile:
+        """
+        Returns the profile that personalizes a user's answers, from the profile cache
+        when the user is active, creating the user if they don't exist.
+        """
+        if not self.profile_cache:
+            return await self._load_profile(db, telegram_id)
+        profile = self.profile_cache.get(telegram_id)
+        if profile is None:
+            fill_token = self.profile_cache.start_fill(telegram_id)
+            profile = await self._load_profile(db, telegram_id)
+            self.profile_cache.put(profile, fill_token)
+        return profile
+
+    async def _load_profile(self, db: AsyncSession, telegram_id: int) -> UserProfile:
+        user = await self.get_or_create_user(db, telegram_id)
+        return UserProfile.from_user(user, await load_recent_turns(db, user, self.max_recent_turns))
+
+    def personalization_context(self, profile: UserProfile) -> str:
+        """The user's interaction history for a personalized prompt: their summary and latest turns, within the token budget."""
+        return build_personalization_context(profile.interaction_summary, profile.recent_turns, self.context_token_budget)
+
+    async def update_user_profile(self, db: AsyncSession, telegram_id: int, profile_data: Dict[str, Any]) -> User | None:
         """
         Asynchronously update a user's profile with new data.
         `profile_data` can contain 'interests' or 'interaction_summary'.
         """
         user = await self.get_user_by_telegram_id(db, telegram_id)
         if user:
-            return await run_in_threadpool(_db_update_user, db, user, profile_data)
+            user = await _db_update_user(db, user, profile_data)
+            if self.profile_cache:
+                self.profile_cache.invalidate(telegram_id)
+            return user
         return None
 
-    async def update_interaction_summary(self, db: Session, telegram_id: int, new_interaction: str) -> User | None:
+    async def add_interactions(self, db: AsyncSession, telegram_id: int, turns: Sequence[Turn]) -> int:
         """
-        Appends a new interaction and, if the summary is too long, triggers a background summarization.
+        Appends turns to the user's interaction history. Returns the tokens in their turns
+        not yet folded into the summary, which the summary compactor decides on.
         """
         user = await self.get_or_create_user(db, telegram_id)
-        if not user:
-            return None
+        tokens = await _db_append_interactions(db, user, turns)
+        if self.profile_cache:
+            self.profile_cache.invalidate(telegram_id)
+        return tokens
 
-        # First, append the latest interaction to ensure it's saved immediately
-        user = await run_in_threadpool(_db_append_interaction_summary, db, user, new_interaction)
-
-        # Check if the summary now needs to be condensed
-        if len(user.interaction_summary) > self.MAX_SUMMARY_LENGTH:
-            logger.info(
-                f"Interaction summary for user {telegram_id} exceeds "
-                f"{self.MAX_SUMMARY_LENGTH} chars. Triggering summarization."
-            )
-            try:
-                # Generate the new summary using the LLM service
-                new_summary = await self.llm_service.generate_response(
-                    strategy=PromptStrategy.SUMMARIZE_INTERACTION_HISTORY,
-                    context={"interaction_history": user.interaction_summary},
-                )
-
-                # Replace the old summary with the new condensed version
-                summary_prefix = "--- CONVERSATION SUMMARY ---"
-                profile_data = {"interaction_summary": f"{summary_prefix}\n{new_summary}"}
-                user = await run_in_threadpool(_db_update_user, db, user, profile_data)
-                logger.info(f"Successfully summarized and updated history for user {telegram_id}.")
-
-            except Exception as e:
-                # If summarization fails, log the error but don't crash the background task.
-                # The full summary is still preserved in the DB for the next attempt.
-                logger.error(f"Failed to summarize interaction history for user {telegram_id}: {e}", exc_info=True)
-
-        return user
+    async def log_interaction(self, profile_writer: ProfileWriter, telegram_id: int, turns: Sequence[Turn]) -> int:
+        """
+        Like `add_interactions`, but the insert goes through the single profile writer,
+        which batches it with those of concurrent chats. A cached profile sees the turns
+        at once; the database gets them with the writer's next batch.
+        """
+        return await self._write_behind(
+            telegram_id,
+            lambda profile: replace(profile, recent_turns=(profile.recent_turns + tuple(turns))[-self.max_recent_turns:]),
+            profile_writer.append_interactions(telegram_id, turns),
+        )
+
+    async def replace_summary(
+        self,
+        db: AsyncSession,
+        profile_writer: ProfileWriter | None,
+        telegram_id: int,
+        summary: str,
+        summarized_through: int,
+        previous_through: int | None,
+    ):
+        """
+        Replaces the user's summary with one covering their turns up to `summarized_through`,
+        through the profile writer if there is one. Skipped if the summary was replaced
+        since it covered `previous_through`.
+        """
+        if profile_writer:
+            await profile_writer.replace_summary(telegram_id, summary, summarized_through, previous_through)
+        else:
+            user = await self.get_user_by_telegram_id(db, telegram_id)
+            if user and user.summarized_interaction_id == previous_through:
+                user.summarized_interaction_id = summarized_through
+                await _db_update_user(db, user, {"interaction_summary": summary})
+        if self.profile_cache:
+            # Reloaded on next use, without the turns now in the summary
+            self.profile_cache.invalidate(telegram_id)
+
+    async def _write_behind(self, telegram_id: int, transform, write) -> int:
+        """
+        Applies `transform` to the cached profile, then awaits `write`, the same change
+        queued on the writer. Returns the writer's result: the user's unsummarized tokens.
+        """
+        if not self.profile_cache:
+            return await write
+        self.profile_cache.begin_write(telegram_id, transform)
+        persisted = False
+        try:
+            unsummarized_tokens = await write
+            persisted = True
+            return unsummarized_tokens
+        finally:
+            self.profile_cache.end_write(telegram_id, persisted)
+
+    async def condense_summary(self, telegram_id: int, summary: str, turns: List[Turn], max_length: int) -> str:
+        """Returns an LLM-condensed summary of `summary` followed by `turns`, at most `max_length` chars long."""
+        summary_prefix = "--- CONVERSATION SUMMARY ---\n"
+        max_length = max(max_length - len(summary_prefix), 0)
+        history = f"{summary.removeprefix(summary_prefix)}\n{render_turns(turns)}".strip()
+        new_summary = await self.llm_service.generate_response(
+            strategy=PromptStrategy.SUMMARIZE_INTERACTION_HISTORY,
+            context={"interaction_history": history, "max_length": max_length},
+            use_cache=False,
+        )
+        if len(new_summary) > max_length:
+            # The model overshot the target; cut at a word so the summary stays bounded
+            logger.debug(f"Truncating the {len(new_summary)}-char summary of user {telegram_id} to {max_length} chars.")
+            new_summary = new_summary[:max_length].rsplit(" ", 1)[0]
+        return f"{summary_prefix}{new_summary}"
 
 @lru_cache()
 def get_user_service(llm_service: LLMService = Depends(get_llm_service)) -> UserService:
-    return UserService(llm_service=llm_service)
+    profile_cache = None
+    if settings.USER_PROFILE_CACHE_ENABLED:
+        profile_cache = UserProfileCache(
+            max_entries=settings.USER_PROFILE_CACHE_MAX_ENTRIES, ttl_seconds=settings.USER_PROFILE_CACHE_TTL_SECONDS
+        )
+    return UserService(
+        llm_service=llm_service,
+        profile_cache=profile_cache,
+        max_recent_turns=settings.INTERACTION_CONTEXT_MAX_TURNS,
+        context_token_budget=settings.INTERACTION_CONTEXT_TOKEN_BUDGET,
+    )
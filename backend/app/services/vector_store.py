@@ -0,0 +1,400 @@
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the on-disk layout of the flat index changes; stale files are rebuilt from the chunk store.
+FLAT_INDEX_FORMAT_VERSION = 2
+
+# Number of chunks fetched per page when rebuilding an index.
+REBUILD_PAGE_SIZE = 1000
+
+# What ChromaDB stores as the embedding of every chunk when the flat backend keeps the
+# vectors. ChromaDB requires one, and one dimension keeps its HNSW index negligible.
+PLACEHOLDER_EMBEDDING = [1.0]
+
+SUPPORTED_SPACES = ("l2", "cosine", "ip")
+SUPPORTED_QUANTIZATIONS = ("none", "float16", "int8")
+
+# Rows dequantized at a time while scanning, which bounds the float32 scratch memory of a search
+_SCAN_BLOCK_ROWS = 16384
+
+_CODE_DTYPES = {"none": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def chroma_hnsw_metadata() -> Dict[str, Any]:
+    """
+    The HNSW parameters ChromaDB builds the collection with. ChromaDB only applies them
+    when the collection is created; changing the space, M or construction ef of an
+    existing collection requires re-creating it and re-ingesting.
+    """
+    return {
+        "hnsw:space": settings.VECTOR_INDEX_SPACE,
+        "hnsw:M": settings.HNSW_M,
+        "hnsw:construction_ef": settings.HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": settings.HNSW_SEARCH_EF,
+    }
+
+
+def check_collection_metadata(collection):
+    """Warns when an existing collection was built with other HNSW parameters than the settings ask for."""
+    current = collection.metadata or {}
+    for key, wanted in chroma_hnsw_metadata().items():
+        if key in current and current[key] != wanted:
+            logger.warning(
+                f"Collection '{collection.name}' was created with {key}={current[key]}, but the settings ask for "
+                f"{wanted}. Re-create the collection and re-ingest to apply it."
+            )
+
+
+def check_collection_embeddings(collection, embeddings_in_chunk_store: bool):
+    """
+    Refuses a collection written for the other backend: ChromaDB fixes the embedding
+    dimension of a collection on its first write, and only one side holds the vectors.
+    """
+    sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+    if sample is None or len(sample) == 0:
+        return
+    has_placeholders = len(sample[0]) == len(PLACEHOLDER_EMBEDDING)
+    if has_placeholders != embeddings_in_chunk_store:
+        holder = "the chunk store (flat backend)" if has_placeholders else "ChromaDB (chroma backend)"
+        raise ValueError(
+            f"Collection '{collection.name}' was ingested with its embeddings kept in {holder}, but "
+            f"VECTOR_STORE_BACKEND is '{settings.VECTOR_STORE_BACKEND}'. Re-create the collection and re-ingest "
+            f"to switch backends."
+        )
+
+
+class VectorStore(ABC):
+    """
+    Abstract base class for the nearest-neighbour index behind semantic search.
+
+    ChromaDB stays the system of record for chunks and their metadata; a vector store
+    answers "which chunk ids are closest to this query embedding" and knows where the
+    exact embeddings of stored chunks are kept.
+    """
+
+    # True when the exact embeddings live in the chunk store; ChromaDB then gets
+    # PLACEHOLDER_EMBEDDING for every chunk instead of the vector
+    embeddings_in_chunk_store = False
+
+    @abstractmethod
+    def search(self, query_embeddings: Sequence[Sequence[float]], n_results: int) -> List[List[str]]:
+        """Returns the ids of the `n_results` nearest chunks for each query embedding, nearest first."""
+        pass
+
+    @abstractmethod
+    def embeddings(self, chunk_ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        """Returns the exact stored embeddings of the given chunks; ids without one are left out."""
+        pass
+
+    def add(self, chunk_ids: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        """Adds (or replaces) the embeddings of the given chunks."""
+        pass
+
+    def remove(self, chunk_ids: Sequence[str]):
+        pass
+
+    def save(self):
+        """Persists the index, if the backend keeps its own copy of the vectors."""
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+class ChromaVectorStore(VectorStore):
+    """Searches ChromaDB's own HNSW index. Writes are no-ops: the collection is the index."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def search(self, query_embeddings: Sequence[Sequence[float]], n_results: int) -> List[List[str]]:
+        results = self.collection.query(query_embeddings=query_embeddings, n_results=n_results, include=[])
+        return results.get("ids") or [[] for _ in query_embeddings]
+
+    def embeddings(self, chunk_ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        data = self.collection.get(ids=list(chunk_ids), include=["embeddings"])
+        return dict(zip(data["ids"], data["embeddings"]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "chroma", **{key: value for key, value in (self.collection.metadata or {}).items() if key.startswith("hnsw:")}}
+
+
+class FlatVectorStore(VectorStore):
+    """
+    Brute-force search over an in-process matrix.
+
+    For corpora up to a few hundred thousand chunks a single scan is fast, with no index
+    to tune. Rows grow geometrically; removed chunks are swapped with the last row so the
+    matrix stays dense. Distances follow ChromaDB's definitions for the configured space,
+    so both backends rank identically.
+
+    This matrix is the only vector index: ChromaDB keeps a placeholder per chunk, and the
+    exact float32 vectors stay on disk in `embedding_source` (the chunk store). Vectors
+    can be held quantized to cut memory: `float16` halves it, and `int8` (a per-vector
+    scale times signed bytes) quarters it. A quantized scan then picks a shortlist of
+    `rescore_factor * n_results` candidates, which are re-ranked with their exact vectors
+    read from `embedding_source`.
+    """
+
+    embeddings_in_chunk_store = True
+
+    def __init__(
+        self,
+        path: str | None = None,
+        space: str = "l2",
+        quantization: str = "none",
+        embedding_source: Callable[[Sequence[str]], Dict[str, Sequence[float]]] | None = None,
+        rescore_factor: int = 4,
+    ):
+        if space not in SUPPORTED_SPACES:
+            raise ValueError(f"Unsupported vector space '{space}'. Supported spaces: {', '.join(SUPPORTED_SPACES)}")
+        if quantization not in SUPPORTED_QUANTIZATIONS:
+            raise ValueError(
+                f"Unsupported quantization '{quantization}'. Supported modes: {', '.join(SUPPORTED_QUANTIZATIONS)}"
+            )
+        self.path = path
+        self.space = space
+        self.quantization = quantization
+        self.embedding_source = embedding_source
+        self.rescore_factor = rescore_factor
+        self._lock = threading.Lock()
+        self._codes: np.ndarray | None = None
+        self._scales: np.ndarray | None = None
+        self._sq_norms: np.ndarray | None = None
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _prepare(self, vectors: Sequence[Sequence[float]]) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the stored codes and per-vector scales of float32 vectors."""
+        if self.quantization == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return vectors.astype(_CODE_DTYPES[self.quantization]), np.ones(len(vectors), dtype=np.float32)
+
+    def _reserve(self, rows: int, dim: int):
+        if self._codes is None:
+            capacity = max(rows, 1024)
+            self._codes = np.empty((capacity, dim), dtype=_CODE_DTYPES[self.quantization])
+            self._scales = np.empty(capacity, dtype=np.float32)
+            self._sq_norms = np.empty(capacity, dtype=np.float32)
+        elif rows > len(self._codes):
+            capacity = max(rows, 2 * len(self._codes))
+            self._codes = np.resize(self._codes, (capacity, dim))
+            self._scales = np.resize(self._scales, capacity)
+            self._sq_norms = np.resize(self._sq_norms, capacity)
+
+    def add(self, chunk_ids: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        if not chunk_ids:
+            return
+        vectors = self._prepare(embeddings)
+        codes, scales = self._quantize(vectors)
+        sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        with self._lock:
+            self._reserve(len(self._ids) + len(chunk_ids), vectors.shape[1])
+            for i, chunk_id in enumerate(chunk_ids):
+                row = self._rows.get(chunk_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._ids.append(chunk_id)
+                    self._rows[chunk_id] = row
+                self._codes[row] = codes[i]
+                self._scales[row] = scales[i]
+                self._sq_norms[row] = sq_norms[i]
+
+    def remove(self, chunk_ids: Sequence[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is None:
+                    continue
+                last = len(self._ids) - 1
+                if row != last:
+                    moved_id = self._ids[last]
+                    self._codes[row] = self._codes[last]
+                    self._scales[row] = self._scales[last]
+                    self._sq_norms[row] = self._sq_norms[last]
+                    self._ids[row] = moved_id
+                    self._rows[moved_id] = row
+                self._ids.pop()
+
+    def _similarities(self, queries: np.ndarray, vectors: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        """Higher is nearer; a monotonic transform of ChromaDB's distance for the space."""
+        similarities = queries @ vectors.T
+        if self.space == "l2":
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2; the last term does not change the ranking
+            similarities = 2 * similarities - sq_norms
+        return similarities
+
+    def _scan(self, queries: np.ndarray, size: int) -> np.ndarray:
+        if self.quantization == "none":
+            return self._similarities(queries, self._codes[:size], self._sq_norms[:size])
+        similarities = np.empty((len(queries), size), dtype=np.float32)
+        for start in range(0, size, _SCAN_BLOCK_ROWS):
+            end = min(start + _SCAN_BLOCK_ROWS, size)
+            block = self._codes[start:end].astype(np.float32) * self._scales[start:end, None]
+            similarities[:, start:end] = self._similarities(queries, block, self._sq_norms[start:end])
+        return similarities
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def search(self, query_embeddings: Sequence[Sequence[float]], n_results: int) -> List[List[str]]:
+        queries = self._prepare(query_embeddings)
+        rescore = self.quantization != "none" and self.embedding_source is not None
+        with self._lock:
+            size = len(self._ids)
+            if size == 0 or n_results <= 0:
+                return [[] for _ in queries]
+            k = min(n_results * self.rescore_factor if rescore else n_results, size)
+            similarities = self._scan(queries, size)
+            shortlists = [[self._ids[row] for row in self._top(row_scores, k)] for row_scores in similarities]
+        if not rescore:
+            return shortlists
+        return [self._rescore(query, shortlist, n_results) for query, shortlist in zip(queries, shortlists)]
+
+    def _rescore(self, query: np.ndarray, shortlist: List[str], n_results: int) -> List[str]:
+        """Re-ranks a quantized shortlist with the exact float32 vectors."""
+        exact = self.embedding_source(shortlist)
+        chunk_ids = [chunk_id for chunk_id in shortlist if chunk_id in exact]
+        if not chunk_ids:
+            return shortlist[:n_results]
+        vectors = self._prepare([exact[chunk_id] for chunk_id in chunk_ids])
+        scores = self._similarities(query[None, :], vectors, np.einsum("ij,ij->i", vectors, vectors))[0]
+        return [chunk_ids[i] for i in self._top(scores, min(n_results, len(chunk_ids)))]
+
+    def embeddings(self, chunk_ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        return self.embedding_source(chunk_ids) if self.embedding_source else {}
+
+    def save(self):
+        """Atomically writes the index to `self.path`."""
+        if not self.path:
+            return
+        with self._lock:
+            size = len(self._ids)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    version=FLAT_INDEX_FORMAT_VERSION,
+                    space=self.space,
+                    quantization=self.quantization,
+                    ids=np.array(self._ids, dtype=str),
+                    codes=self._codes[:size] if self._codes is not None else np.empty((0, 0)),
+                    scales=self._scales[:size] if self._scales is not None else np.empty(0),
+                    sq_norms=self._sq_norms[:size] if self._sq_norms is not None else np.empty(0),
+                )
+            os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, path: str, space: str = "l2", quantization: str = "none", **kwargs) -> "FlatVectorStore | None":
+        """Loads a previously saved index, or returns None if it is missing, outdated or built differently."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as state:
+                version = int(state["version"])
+                stored = (str(state["space"]), str(state["quantization"]))
+                ids, codes, scales, sq_norms = state["ids"].tolist(), state["codes"], state["scales"], state["sq_norms"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read vector index at '{path}': {e}")
+            return None
+        if version != FLAT_INDEX_FORMAT_VERSION or stored != (space, quantization):
+            logger.info(f"Vector index at '{path}' is outdated or was built with another space or quantization.")
+            return None
+
+        store = cls(path=path, space=space, quantization=quantization, **kwargs)
+        if ids:
+            store._reserve(len(ids), codes.shape[1])
+            store._codes[:len(ids)] = codes
+            store._scales[:len(ids)] = scales
+            store._sq_norms[:len(ids)] = sq_norms
+            store._ids = ids
+            store._rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        return store
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the stored vectors and their per-vector scale and norm."""
+        if self._codes is None:
+            return 0
+        return len(self._ids) * (self._codes.shape[1] * self._codes.itemsize + self._scales.itemsize + self._sq_norms.itemsize)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "flat",
+                "space": self.space,
+                "quantization": self.quantization,
+                "vectors": len(self._ids),
+                "bytes": self.memory_bytes(),
+            }
+
+
+def load_flat_vector_store(
+    path: str, chunk_store, collection_size: int, space: str = "l2", quantization: str = "none", rescore_factor: int = 4
+) -> FlatVectorStore:
+    """
+    Loads the persisted flat index, rebuilding it from the embeddings kept in the chunk
+    store when it is missing, outdated, built differently, or out of sync with the
+    collection. Quantized indexes re-score their shortlist with those same embeddings.
+    """
+    options = {"embedding_source": chunk_store.get_embeddings, "rescore_factor": rescore_factor}
+    store = FlatVectorStore.load(path, space, quantization, **options)
+    if store is not None and len(store) == collection_size:
+        logger.info(f"Loaded flat vector index with {len(store)} vectors from '{path}'.")
+        return store
+
+    logger.info(f"Rebuilding flat vector index for {collection_size} chunks from the chunk store...")
+    store = FlatVectorStore(path=path, space=space, quantization=quantization, **options)
+    for chunk_ids, vectors in chunk_store.iter_embeddings(REBUILD_PAGE_SIZE):
+        store.add(chunk_ids, vectors)
+    store.save()
+    logger.info(f"Flat vector index rebuilt with {len(store)} vectors ({quantization}).")
+    if len(store) < collection_size:
+        logger.warning(
+            f"{collection_size - len(store)} chunks have no stored embedding and are left out of semantic search; "
+            f"re-ingest their documents."
+        )
+    return store
+
+
+def build_vector_store(collection, chunk_store) -> VectorStore:
+    """Builds the vector store described by the application settings. Open the chunk store first."""
+    if settings.VECTOR_STORE_BACKEND == "chroma":
+        check_collection_embeddings(collection, embeddings_in_chunk_store=False)
+        check_collection_metadata(collection)
+        return ChromaVectorStore(collection)
+    if settings.VECTOR_STORE_BACKEND == "flat":
+        check_collection_embeddings(collection, embeddings_in_chunk_store=True)
+        return load_flat_vector_store(
+            settings.VECTOR_INDEX_PATH,
+            chunk_store,
+            collection.count(),
+            settings.VECTOR_INDEX_SPACE,
+            quantization=settings.VECTOR_QUANTIZATION,
+            rescore_factor=settings.VECTOR_RESCORE_FACTOR,
+        )
+    raise ValueError(f"Unknown vector store backend '{settings.VECTOR_STORE_BACKEND}'. Use 'chroma' or 'flat'.")
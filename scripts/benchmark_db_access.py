@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import logging
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.db.session import async_database_url, engine_options
+from app.models.base import Base
+from app.models.user import User
+from app.services.user_service import UserService
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# The previous data-access path: sync sessions, one threadpool hop per query
+def _sync_get_user(db: Session, telegram_id: int) -> User | None:
+    return db.query(User).filter(User.telegram_id == telegram_id).first()
+
+
+def _sync_create_user(db: Session, telegram_id: int) -> User:
+    user = User(telegram_id=telegram_id)
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+async def _busy_threadpool(stop: asyncio.Event, hold_seconds: float, latencies: List[float]):
+    """Keeps one threadpool thread busy, as an embedding or search call on the chat path does."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await run_in_threadpool(time.sleep, hold_seconds)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def _drive(
+    request: Callable[[int], Awaitable], telegram_ids: List[int], concurrency: int, busy_threads: int, hold_seconds: float
+):
+    """
+    Runs one request per id, `concurrency` at a time, next to `busy_threads` threadpool
+    hogs. Returns requests/s, request p50/p95 and the p95 of the hogs' calls in ms.
+    """
+    stop = asyncio.Event()
+    hog_latencies: List[float] = []
+    hogs = [asyncio.create_task(_busy_threadpool(stop, hold_seconds, hog_latencies)) for _ in range(busy_threads)]
+    pending = iter(telegram_ids)
+    latencies: List[float] = []
+
+    async def worker():
+        for telegram_id in pending:
+            started = time.perf_counter()
+            await request(telegram_id)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*hogs)
+    hog_p95 = float(np.percentile(hog_latencies, 95)) if hog_latencies else 0.0
+    return (
+        len(telegram_ids) / elapsed,
+        float(np.percentile(latencies, 50)),
+        float(np.percentile(latencies, 95)),
+        hog_p95,
+    )
+
+
+async def benchmark_db_access(
+    database_url: str | None = None,
+    requests: int = 5000,
+    concurrency: int = 64,
+    users: int = 1000,
+    busy_threads: int = 32,
+    hold_seconds: float = 0.005,
+    new_user_ratio: float = 0.1,
+    seed: int = 0,
+):
+    """
+    Compares `get_or_create_user` on the threadpool-wrapped sync session with the async
+    session, while other tasks keep the threadpool busy the way the embedding calls do.
+    Reports request throughput and latency, and the p95 latency of the threadpool calls,
+    which is what the database traffic costs the embedding path. Most users exist
+    beforehand (`new_user_ratio` do not), so the run is mostly lookups with some inserts.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        url = database_url or f"sqlite:///{Path(tmp) / 'benchmark.db'}"
+        engine = create_engine(url, **engine_options(make_url(url)))
+        async_url = async_database_url(url)
+        async_engine = create_async_engine(async_url, **engine_options(async_url))
+        session_factory = sessionmaker(bind=engine, autoflush=False)
+        async_session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        user_service = UserService(llm_service=None)
+        rng = random.Random(seed)
+
+        def reset_users():
+            Base.metadata.drop_all(engine, tables=[User.__table__])
+            Base.metadata.create_all(engine, tables=[User.__table__])
+            with session_factory() as db:
+                db.add_all(User(telegram_id=telegram_id) for telegram_id in range(int(users * new_user_ratio), users))
+                db.commit()
+
+        async def threadpool_request(telegram_id: int):
+            db = session_factory()
+            try:
+                user = await run_in_threadpool(_sync_get_user, db, telegram_id)
+                if not user:
+                    try:
+                        await run_in_threadpool(_sync_create_user, db, telegram_id)
+                    except Exception:
+                        db.rollback()  # Created concurrently by another request
+            finally:
+                db.close()
+
+        async def async_request(telegram_id: int):
+            async with async_session_factory() as db:
+                await user_service.get_or_create_user(db, telegram_id)
+
+        logger.info(
+            f"{requests} get_or_create_user requests on {make_url(url).get_backend_name()}, "
+            f"{concurrency} concurrent, {busy_threads} threadpool threads kept busy."
+        )
+        results = {}
+        try:
+            for label, request in (("sync + threadpool", threadpool_request), ("async session", async_request)):
+                reset_users()
+                telegram_ids = [rng.randrange(users) for _ in range(requests)]
+                results[label] = await _drive(request, telegram_ids, concurrency, busy_threads, hold_seconds)
+        finally:
+            engine.dispose()
+            await async_engine.dispose()
+
+    baseline = results["sync + threadpool"][0]
+    logger.info(
+        f"{'data access':<20} {'requests/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8} {'threadpool p95 ms':>18}"
+    )
+    for label, (rate, p50, p95, hog_p95) in results.items():
+        logger.info(f"{label:<20} {rate:>11.1f} {p50:>8.2f} {p95:>8.2f} {rate / baseline:>7.2f}x {hog_p95:>18.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the threadpool-wrapped sync and the async user data access.")
+    parser.add_argument("--database-url", help="Sync URL of a scratch database; a temporary SQLite file otherwise.")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=1000, help="Distinct Telegram ids.")
+    parser.add_argument("--new-user-ratio", type=float, default=0.1, help="Share of the ids not created up front.")
+    parser.add_argument("--busy-threads", type=int, default=32, help="Threadpool threads kept busy meanwhile.")
+    parser.add_argument("--hold-ms", type=float, default=5.0, help="How long each busy call holds its thread.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(
+        benchmark_db_access(
+            database_url=args.database_url,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            users=args.users,
+            busy_threads=args.busy_threads,
+            hold_seconds=args.hold_ms / 1000,
+            new_user_ratio=args.new_user_ratio,
+            seed=args.seed,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import chromadb
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+from app.services.embedding_models import (
+    ONNX_CONFIG_FILE,
+    ONNX_QUANTIZED_MODEL_FILE,
+    OnnxSentenceEncoder,
+    export_onnx_model,
+    onnx_model_dir,
+    quantize_onnx_model,
+)
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity to the PyTorch embedding of the same sentence
+PARITY_THRESHOLDS = {"onnx": 0.9999, "onnx-int8": 0.99}
+
+
+def load_sentences(sentences_file: Path | None, limit: int) -> List[str]:
+    """Reads sentences from `sentences_file` (one per line), or chunk texts from the knowledge base."""
+    if sentences_file:
+        lines = [line.strip() for line in sentences_file.read_text(encoding="utf-8").splitlines() if line.strip()]
+        return lines[:limit]
+    chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
+    collection = chroma_client.get_or_create_collection(name=settings.COLLECTION_NAME)
+    return collection.get(include=["documents"], limit=limit)["documents"]
+
+
+def throughput(model, sentences: List[str], batch_size: int, min_seconds: float) -> float:
+    """Sentences embedded per second at the given batch size, after one warm-up batch."""
+    model.encode(sentences[:batch_size], batch_size=batch_size)
+    embedded, started = 0, time.perf_counter()
+    while True:
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            model.encode(batch, batch_size=batch_size)
+            embedded += len(batch)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return embedded / elapsed
+
+
+def benchmark_embeddings(
+    sentences_file: Path | None = None,
+    limit: int = 512,
+    batch_sizes: List[int] = (1, 64),
+    threads: int = settings.EMBEDDING_ONNX_THREADS,
+    min_seconds: float = 5.0,
+) -> bool:
+    """
+    Checks that the ONNX Runtime backends (fp32 and int8) reproduce the PyTorch embeddings
+    and measures the throughput of all three. Returns False if a backend fails parity.
+    """
+    sentences = load_sentences(sentences_file, limit)
+    if not sentences:
+        logger.error("No sentences to embed; pass --sentences-file or ingest some documents first.")
+        return False
+
+    model_dir = onnx_model_dir(settings.EMBEDDING_MODEL)
+    if not (Path(model_dir) / ONNX_CONFIG_FILE).exists():
+        export_onnx_model(settings.EMBEDDING_MODEL, model_dir, quantize=True)
+    elif not (Path(model_dir) / ONNX_QUANTIZED_MODEL_FILE).exists():
+        quantize_onnx_model(model_dir)
+
+    models = {
+        "torch": SentenceTransformer(settings.EMBEDDING_MODEL, device="cpu"),
+        "onnx": OnnxSentenceEncoder(model_dir, quantized=False, intra_op_threads=threads),
+        "onnx-int8": OnnxSentenceEncoder(model_dir, quantized=True, intra_op_threads=threads),
+    }
+    logger.info(f"Embedding {len(sentences)} sentences with '{settings.EMBEDDING_MODEL}'.")
+
+    # --- Parity against PyTorch ---
+    reference = np.asarray(models["torch"].encode(sentences, batch_size=64), dtype=np.float32)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    passed = True
+    for name in ("onnx", "onnx-int8"):
+        embeddings = models[name].encode(sentences, batch_size=64)
+        cosines = np.einsum("ij,ij->i", reference, embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True))
+        ok = cosines.min() >= PARITY_THRESHOLDS[name]
+        passed &= bool(ok)
+        logger.info(
+            f"Parity {name}: min cosine {cosines.min():.6f}, mean {cosines.mean():.6f} "
+            f"(threshold {PARITY_THRESHOLDS[name]}) -> {'OK' if ok else 'FAILED'}"
+        )
+
+    # --- Throughput ---
+    results: Dict[str, Dict[int, float]] = {
+        name: {batch_size: throughput(model, sentences, batch_size, min_seconds) for batch_size in batch_sizes}
+        for name, model in models.items()
+    }
+    logger.info(f"{'backend':<10} " + " ".join(f"{'batch ' + str(size) + ' sent/s':>18}" for size in batch_sizes))
+    for name, rates in results.items():
+        speedups = " ".join(
+            f"{rates[size]:>10.1f} ({rates[size] / results['torch'][size]:>4.1f}x)" for size in batch_sizes
+        )
+        logger.info(f"{name:<10} {speedups}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check ONNX embedding parity with PyTorch and compare throughput.")
+    parser.add_argument("--sentences-file", type=Path, help="Sentences, one per line; knowledge base chunks otherwise.")
+    parser.add_argument("--limit", type=int, default=512, help="Max sentences used.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--threads", type=int, default=settings.EMBEDDING_ONNX_THREADS, help="ONNX Runtime intra-op threads.")
+    parser.add_argument("--min-seconds", type=float, default=5.0, help="Minimum run time per throughput measurement.")
+    args = parser.parse_args()
+
+    passed = benchmark_embeddings(
+        sentences_file=args.sentences_file,
+        limit=args.limit,
+        batch_sizes=args.batch_sizes,
+        threads=args.threads,
+        min_seconds=args.min_seconds,
+    )
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
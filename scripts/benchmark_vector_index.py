@@ -0,0 +1,298 @@
+import argparse
+import gc
+import itertools
+import logging
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Sequence, Tuple
+
+import chromadb
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+from app.services.chunk_store import ChunkStore
+from app.services.vector_store import REBUILD_PAGE_SIZE, FlatVectorStore
+
+# --- Setup Logging ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Chroma rejects larger batches in a single add
+_ADD_BATCH_SIZE = 1000
+
+
+@dataclass
+class BenchmarkResult:
+    label: str
+    recall: float
+    p50_ms: float
+    p95_ms: float
+    build_seconds: float = 0.0
+    memory_bytes: int | None = None  # Vectors held in memory, where the backend reports it
+    rss_bytes: int | None = None  # Growth of the process RSS while the index was built and queried
+    disk_bytes: int | None = None  # Everything the backend writes to disk for the vectors
+
+
+def process_rss() -> int | None:
+    """The resident set size of this process, where /proc exposes it."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def disk_size(path: str) -> int:
+    """Bytes taken by a file, or by every file under a directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def rss_growth(baseline: int | None) -> int | None:
+    current = process_rss()
+    return None if baseline is None or current is None else max(0, current - baseline)
+
+
+def load_corpus(collection) -> Tuple[List[str], np.ndarray]:
+    """
+    Reads every chunk id and embedding of the knowledge base: from the chunk store with
+    the flat backend, which keeps the vectors out of ChromaDB, or from the collection.
+    """
+    ids: List[str] = []
+    vectors = []
+    if settings.VECTOR_STORE_BACKEND == "flat":
+        for chunk_ids, page in ChunkStore(settings.CHUNK_STORE_PATH, hot_cache_size=0).iter_embeddings(REBUILD_PAGE_SIZE):
+            ids.extend(chunk_ids)
+            vectors.append(page)
+    else:
+        for offset in range(0, collection.count(), REBUILD_PAGE_SIZE):
+            page = collection.get(include=["embeddings"], limit=REBUILD_PAGE_SIZE, offset=offset)
+            ids.extend(page["ids"])
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+    return ids, np.concatenate(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+
+
+def load_queries(corpus: np.ndarray, queries_file: Path | None, sample: int, seed: int) -> np.ndarray:
+    """
+    Embeds the queries in `queries_file` (one per line) with the configured model, or
+    falls back to a random sample of stored chunk embeddings used as queries.
+    """
+    if queries_file:
+        queries = [line.strip() for line in queries_file.read_text(encoding="utf-8").splitlines() if line.strip()]
+        model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        return np.asarray(model.encode(queries[:sample] if sample else queries), dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(corpus), size=min(sample, len(corpus)), replace=False)
+    return corpus[rows]
+
+
+def measure(
+    label: str, search: Callable[[np.ndarray], List[str]], queries: np.ndarray, truth: Sequence[List[str]], k: int
+) -> BenchmarkResult:
+    """Runs each query on its own, as the chat path does, and compares the results with exact search."""
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        found = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(set(found[:k]) & set(expected))
+    return BenchmarkResult(
+        label=label,
+        recall=hits / max(1, sum(len(expected) for expected in truth)),
+        p50_ms=float(np.percentile(latencies, 50)),
+        p95_ms=float(np.percentile(latencies, 95)),
+    )
+
+
+def benchmark_chroma(
+    ids: List[str],
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: Sequence[List[str]],
+    k: int,
+    space: str,
+    m: int,
+    construction_ef: int,
+    search_ef: int,
+) -> BenchmarkResult:
+    """Builds a throwaway persistent Chroma collection with the given HNSW parameters and measures it."""
+    gc.collect()
+    baseline = process_rss()
+    with tempfile.TemporaryDirectory(prefix="benchmark_chroma_", ignore_cleanup_errors=True) as persist_dir:
+        client = chromadb.PersistentClient(path=persist_dir)
+        name = f"benchmark_{uuid.uuid4().hex[:8]}"
+        collection = client.create_collection(
+            name=name,
+            metadata={"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef, "hnsw:search_ef": search_ef},
+        )
+        try:
+            started = time.perf_counter()
+            for start in range(0, len(ids), _ADD_BATCH_SIZE):
+                collection.add(
+                    ids=ids[start:start + _ADD_BATCH_SIZE], embeddings=corpus[start:start + _ADD_BATCH_SIZE].tolist()
+                )
+            build_seconds = time.perf_counter() - started
+
+            def search(query: np.ndarray) -> List[str]:
+                return collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])["ids"][0]
+
+            result = measure(f"chroma M={m} construction_ef={construction_ef} search_ef={search_ef}", search, queries, truth, k)
+            result.build_seconds = build_seconds
+            result.rss_bytes = rss_growth(baseline)
+            result.disk_bytes = disk_size(persist_dir)
+            return result
+        finally:
+            client.delete_collection(name)
+
+
+def benchmark_flat(
+    ids: List[str],
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    truth: Sequence[List[str]],
+    k: int,
+    space: str,
+    quantization: str,
+    rescore_factor: int | None,
+) -> BenchmarkResult:
+    """
+    Measures the flat backend as deployed: the index saved to disk, and the exact vectors
+    in an on-disk chunk store, which `rescore_factor` (if set) re-scores the shortlist from.
+    """
+    gc.collect()
+    baseline = process_rss()
+    with tempfile.TemporaryDirectory(prefix="benchmark_flat_", ignore_cleanup_errors=True) as work_dir:
+        chunk_store = ChunkStore(os.path.join(work_dir, "chunk_store.sqlite3"), hot_cache_size=0)
+        store = FlatVectorStore(
+            path=os.path.join(work_dir, "flat_vector_index.npz"),
+            space=space,
+            quantization=quantization,
+            embedding_source=chunk_store.get_embeddings if rescore_factor else None,
+            rescore_factor=rescore_factor or 1,
+        )
+        started = time.perf_counter()
+        for start in range(0, len(ids), REBUILD_PAGE_SIZE):
+            batch_ids, batch = ids[start:start + REBUILD_PAGE_SIZE], corpus[start:start + REBUILD_PAGE_SIZE]
+            chunk_store.add_chunks(batch_ids, [""] * len(batch_ids), batch)
+            store.add(batch_ids, batch)
+        store.save()
+        build_seconds = time.perf_counter() - started
+
+        label = f"flat {quantization}" + (f" rescore x{rescore_factor}" if rescore_factor and quantization != "none" else "")
+        result = measure(label, lambda query: store.search([query], k)[0], queries, truth, k)
+        result.build_seconds = build_seconds
+        result.memory_bytes = store.memory_bytes()
+        result.rss_bytes = rss_growth(baseline)
+        result.disk_bytes = disk_size(work_dir)
+        return result
+
+
+def benchmark_vector_index(
+    k: int = 10,
+    sample: int = 200,
+    queries_file: Path | None = None,
+    space: str = settings.VECTOR_INDEX_SPACE,
+    m_values: Sequence[int] = (16, 32),
+    construction_ef_values: Sequence[int] = (100, 200),
+    search_ef_values: Sequence[int] = (10, 50, 100),
+    quantizations: Sequence[str] = ("float16", "int8"),
+    rescore_factor: int = settings.VECTOR_RESCORE_FACTOR,
+    target_recall: float = 0.95,
+    seed: int = 0,
+):
+    """
+    Measures recall@k against exact search, per-query latency, vector memory, process
+    RSS growth and on-disk size for the flat backend (float32 and quantized, with and
+    without exact re-scoring) and a grid of Chroma HNSW parameters, on the embeddings of
+    our own knowledge base. RSS is sampled from /proc, so it is only reported on Linux.
+    """
+    chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
+    collection = chroma_client.get_or_create_collection(name=settings.COLLECTION_NAME)
+    ids, corpus = load_corpus(collection)
+    if not ids:
+        logger.error("The collection is empty; ingest some documents first.")
+        return
+    deployed = {
+        "ChromaDB": settings.CHROMA_PERSIST_DIR,
+        "chunk store": settings.CHUNK_STORE_PATH,
+        "flat index": settings.VECTOR_INDEX_PATH,
+    }
+    logger.info(
+        f"On disk ({settings.VECTOR_STORE_BACKEND} backend): "
+        + ", ".join(f"{name} {disk_size(path) / 2**20:.1f} MB" for name, path in deployed.items() if os.path.exists(path))
+    )
+    queries = load_queries(corpus, queries_file, sample, seed)
+    logger.info(f"Benchmarking {len(queries)} queries against {len(ids)} chunks (k={k}, space={space}).")
+
+    # Exact float32 search is the ground truth, and is itself one of the candidates
+    exact = FlatVectorStore(space=space)
+    exact.add(ids, corpus)
+    truth = exact.search(queries, k)
+
+    results = [benchmark_flat(ids, corpus, queries, truth, k, space, "none", None)]
+    for quantization in quantizations:
+        results.append(benchmark_flat(ids, corpus, queries, truth, k, space, quantization, None))
+        results.append(benchmark_flat(ids, corpus, queries, truth, k, space, quantization, rescore_factor))
+    for m, construction_ef, search_ef in itertools.product(m_values, construction_ef_values, search_ef_values):
+        results.append(benchmark_chroma(ids, corpus, queries, truth, k, space, m, construction_ef, search_ef))
+
+    def megabytes(value: int | None) -> str:
+        return f"{value / 2**20:>10.1f}" if value is not None else f"{'-':>10}"
+
+    logger.info(
+        f"{'configuration':<58} {'recall@' + str(k):>9} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8} "
+        f"{'vectors MB':>10} {'RSS MB':>10} {'disk MB':>10}"
+    )
+    for result in results:
+        logger.info(
+            f"{result.label:<58} {result.recall:>9.3f} {result.p50_ms:>8.2f} {result.p95_ms:>8.2f} "
+            f"{result.build_seconds:>8.1f} {megabytes(result.memory_bytes)} {megabytes(result.rss_bytes)} "
+            f"{megabytes(result.disk_bytes)}"
+        )
+
+    eligible = [result for result in results if result.recall >= target_recall]
+    if eligible:
+        best = min(eligible, key=lambda result: result.p50_ms)
+        logger.info(f"Fastest configuration with recall@{k} >= {target_recall}: {best.label}")
+    else:
+        logger.info(f"No configuration reached recall@{k} >= {target_recall}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall and latency of vector index configurations on the knowledge base.")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours retrieved per query.")
+    parser.add_argument("--sample", type=int, default=200, help="Number of queries.")
+    parser.add_argument("--queries-file", type=Path, help="Real queries, one per line; stored chunks are used otherwise.")
+    parser.add_argument("--space", default=settings.VECTOR_INDEX_SPACE, choices=["l2", "cosine", "ip"])
+    parser.add_argument("--m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--quantization", nargs="*", default=["float16", "int8"], choices=["float16", "int8"])
+    parser.add_argument("--rescore-factor", type=int, default=settings.VECTOR_RESCORE_FACTOR)
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    benchmark_vector_index(
+        k=args.k,
+        sample=args.sample,
+        queries_file=args.queries_file,
+        space=args.space,
+        m_values=args.m,
+        construction_ef_values=args.construction_ef,
+        search_ef_values=args.search_ef,
+        quantizations=args.quantization,
+        rescore_factor=args.rescore_factor,
+        target_recall=args.target_recall,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,29 @@
+import argparse
+import itertools
+import json
 import logging
-import chromadb
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from typing import Dict, List, Tuple
+
+import chromadb
 
 # Now that the project is an installable package, we can use direct imports
 from app.core.config import settings
 from app.db.session import SessionLocal, init_db
-from app.db.models import DocumentMetadata
+from app.services.document_processing import SUPPORTED_EXTENSIONS, hash_file, iter_chunks, iter_pages
+from app.services.embedding_models import load_embedding_model
+from app.services.embedding_service import EmbeddingService
+from app.services.chunk_store import load_chunk_store
+from app.services.ingestion import IngestionPlan, apply_ingestion_plans, is_document_current, plan_ingestion, record_ingestion
+from app.services.keyword_index import build_tokenizer, load_keyword_index
+from app.services.vector_store import build_vector_store, chroma_hnsw_metadata
 
 # --- Setup Logging ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -17,75 +33,389 @@ logger = logging.getLogger(__name__)
 # Use a more robust path for the data directory, assuming it's in the project root
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DATA_PATH = PROJECT_ROOT / "data"
+CHECKPOINT_PATH = PROJECT_ROOT / ".ingest_checkpoint.json"
+
+# Closes the queue between two pipeline stages
+_DONE = None
+
+
+@dataclass
+class SourceFile:
+    # Path relative to the data directory, used in the checkpoint and as the document name:
+    # files with the same name in different directories are different documents
+    key: str
+    path: Path
+    fingerprint: str
+
+
+@dataclass
+class FileWork:
+    """A file travelling through the pipeline with the delta to apply to the stores."""
+    source: SourceFile
+    plan: IngestionPlan
+    embeddings: Dict[str, List[float]]
+
+
+class PipelineStats:
+    """Counters and per-stage busy time for the throughput report."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.files = 0
+        self.failed_files = 0
+        self.unchanged_files = 0
+        self.chunks = 0
+        self.embeddings = 0
+        self.reused_embeddings = 0
+        self.upserted = 0
+        self.deleted = 0
+        self.stage_seconds = {"extract": 0.0, "embed": 0.0, "upsert": 0.0}
+
+    def add(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def add_time(self, stage: str, seconds: float):
+        with self.lock:
+            self.stage_seconds[stage] += seconds
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        logger.info("--- Ingestion throughput ---")
+        logger.info(f"Elapsed: {elapsed:.1f}s")
+        logger.info(
+            f"Files: {self.files} ({self.files / elapsed:.2f} files/s), "
+            f"unchanged: {self.unchanged_files}, failed: {self.failed_files}"
+        )
+        logger.info(f"Chunks: {self.chunks} ({self.chunks / elapsed:.1f} chunks/s)")
+        logger.info(f"Embeddings: {self.embeddings} ({self.embeddings / elapsed:.1f} embeddings/s), reused: {self.reused_embeddings}")
+        logger.info(f"Upserted: {self.upserted}, deleted: {self.deleted}")
+        for stage, seconds in self.stage_seconds.items():
+            logger.info(f"Stage '{stage}' busy for {seconds:.1f}s")
+
+
+class Checkpoint:
+    """Records fully ingested files so an interrupted run resumes where it stopped."""
+
+    def __init__(self, path: Path, reset: bool = False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.completed: Dict[str, str] = {}
+        if path.exists() and not reset:
+            with open(path, "r", encoding="utf-8") as f:
+                self.completed = json.load(f).get("completed", {})
+            logger.info(f"Resuming from checkpoint with {len(self.completed)} completed file(s).")
+
+    def is_done(self, source: SourceFile) -> bool:
+        return self.completed.get(source.key) == source.fingerprint
+
+    def mark_done(self, fingerprints: Dict[str, str]):
+        with self.lock:
+            self.completed.update(fingerprints)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"completed": self.completed}, f)
+            os.replace(tmp_path, self.path)
 
-def ingest_data():
+
+def _discover(data_dir: Path, checkpoint: Checkpoint) -> List[SourceFile]:
+    sources = []
+    for path in sorted(data_dir.glob("**/*")):
+        if not path.is_file() or path.suffix not in SUPPORTED_EXTENSIONS:
+            continue
+        stat = path.stat()
+        source = SourceFile(
+            key=path.relative_to(data_dir).as_posix(),
+            path=path,
+            fingerprint=f"{stat.st_size}:{stat.st_mtime_ns}",
+        )
+        if not checkpoint.is_done(source):
+            sources.append(source)
+    return sources
+
+
+def _process_file(path: str) -> Tuple[str, List[Tuple[str, int | None]]]:
+    """Hashes, extracts and chunks one file page by page. Runs in a worker process."""
+    file_path = Path(path)
+    with open(file_path, "rb") as f:
+        content_hash = hash_file(f)
+    return content_hash, list(iter_chunks(iter_pages(path, file_path.name)))
+
+
+def _extract_stage(
+    sources: List[SourceFile],
+    workers: int,
+    collection,
+    vector_store,
+    out_queue: queue.Queue,
+    checkpoint: Checkpoint,
+    abort: threading.Event,
+    stats: PipelineStats,
+):
     """
-    Reads documents from the data directory, chunks them using an advanced splitter,
-    generates embeddings, and upserts them into ChromaDB. This process is idempotent.
+    Stage 1: extracts and chunks files in a process pool, keeping a bounded number in
+    flight, and plans the delta of each file against what is already stored.
     """
-    logger.info("Starting data ingestion...")
+    db = SessionLocal()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            remaining = iter(sources)
+            in_flight = deque(
+                (source, pool.submit(_process_file, str(source.path)))
+                for source in itertools.islice(remaining, workers * 2)
+            )
+            while in_flight and not abort.is_set():
+                source, future = in_flight.popleft()
+                next_source = next(remaining, None)
+                if next_source is not None:
+                    in_flight.append((next_source, pool.submit(_process_file, str(next_source.path))))
 
-    # --- Initialize clients and services ---
+                started = time.perf_counter()
+                try:
+                    content_hash, chunks = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to process '{source.key}': {e}")
+                    stats.add(failed_files=1)
+                    continue
+                if is_document_current(db, source.key, content_hash):
+                    stats.add(unchanged_files=1)
+                    checkpoint.mark_done({source.key: source.fingerprint})
+                    continue
+
+                # A file emptied since the last run plans the deletion of all its chunks
+                plan = plan_ingestion(db, collection, vector_store, source.key, content_hash, chunks)
+                if not chunks and not plan.stale_ids:
+                    logger.warning(f"No content chunks found in {source.key}. Skipping.")
+                    checkpoint.mark_done({source.key: source.fingerprint})
+                    continue
+                if not chunks:
+                    logger.warning(f"No content chunks left in {source.key}; removing its {len(plan.stale_ids)} stored chunk(s).")
+                stats.add_time("extract", time.perf_counter() - started)
+                stats.add(files=1, chunks=len(plan.chunk_ids), reused_embeddings=len(plan.reused_embeddings))
+                out_queue.put(FileWork(source, plan, {}))
+    except Exception as e:
+        logger.error(f"Extraction stage failed: {e}", exc_info=True)
+        abort.set()
+    finally:
+        db.close()
+        out_queue.put(_DONE)
+
+
+def _embed_batch(batch: List[FileWork], embedding_service: EmbeddingService, stats: PipelineStats):
+    # Identical chunks across the batch are embedded once
+    texts_by_hash: Dict[str, str] = {}
+    for work in batch:
+        hash_by_id = dict(zip(work.plan.chunk_ids, work.plan.chunk_hashes))
+        for chunk_id, text in work.plan.to_embed.items():
+            texts_by_hash.setdefault(hash_by_id[chunk_id], text)
+    if not texts_by_hash:
+        return
+
+    started = time.perf_counter()
+    vectors = embedding_service.encode(list(texts_by_hash.values()))
+    stats.add_time("embed", time.perf_counter() - started)
+    stats.add(embeddings=len(texts_by_hash))
+
+    vector_by_hash = dict(zip(texts_by_hash, vectors.tolist()))
+    for work in batch:
+        hash_by_id = dict(zip(work.plan.chunk_ids, work.plan.chunk_hashes))
+        work.embeddings = {chunk_id: vector_by_hash[hash_by_id[chunk_id]] for chunk_id in work.plan.to_embed}
+
+
+def _embed_stage(
+    in_queue: queue.Queue,
+    out_queue: queue.Queue,
+    embedding_service: EmbeddingService,
+    batch_size: int,
+    abort: threading.Event,
+    stats: PipelineStats,
+):
+    """Stage 2: embeds the changed chunks of several files at once in large batches with a single model instance."""
+    batch: List[FileWork] = []
+    pending_texts = 0
+    try:
+        while True:
+            work = in_queue.get()
+            if work is not _DONE and not abort.is_set():
+                batch.append(work)
+                pending_texts += len(work.plan.to_embed)
+            if batch and (work is _DONE or pending_texts >= batch_size):
+                _embed_batch(batch, embedding_service, stats)
+                for done in batch:
+                    out_queue.put(done)
+                batch, pending_texts = [], 0
+            if work is _DONE:
+                return
+    except Exception as e:
+        logger.error(f"Embedding stage failed: {e}", exc_info=True)
+        abort.set()
+        # Keep draining so the extraction stage is never blocked on a full queue
+        while in_queue.get() is not _DONE:
+            pass
+    finally:
+        out_queue.put(_DONE)
+
+
+def _upsert_stage(
+    in_queue: queue.Queue,
+    collection,
+    keyword_index,
+    chunk_store,
+    vector_store,
+    checkpoint: Checkpoint,
+    batch_size: int,
+    abort: threading.Event,
+    stats: PipelineStats,
+):
+    """Stage 3: applies the deltas of several files in large batches and checkpoints them once stored."""
     db = SessionLocal()
-    model = SentenceTransformer(settings.EMBEDDING_MODEL)
-    chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
-    collection = chroma_client.get_or_create_collection(name=settings.COLLECTION_NAME)
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
+    batch: List[FileWork] = []
+    pending_chunks = 0
+    try:
+        while True:
+            work = in_queue.get()
+            if work is not _DONE and not abort.is_set():
+                batch.append(work)
+                pending_chunks += len(work.plan.new_chunks) + len(work.plan.stale_ids)
+            if batch and (work is _DONE or pending_chunks >= batch_size):
+                started = time.perf_counter()
+                _flush(batch, collection, keyword_index, chunk_store, vector_store, db, checkpoint, stats)
+                stats.add_time("upsert", time.perf_counter() - started)
+                batch, pending_chunks = [], 0
+            if work is _DONE:
+                return
+    except Exception as e:
+        logger.error(f"Upsert stage failed: {e}", exc_info=True)
+        abort.set()
+        while in_queue.get() is not _DONE:
+            pass
+    finally:
+        db.close()
+
+
+def _flush(
+    batch: List[FileWork],
+    collection,
+    keyword_index,
+    chunk_store,
+    vector_store,
+    db,
+    checkpoint: Checkpoint,
+    stats: PipelineStats,
+):
+    plans = [work.plan for work in batch]
+    embeddings = {chunk_id: vector for work in batch for chunk_id, vector in work.embeddings.items()}
+    apply_ingestion_plans(collection, keyword_index, chunk_store, vector_store, plans, embeddings)
+    record_ingestion(db, plans)
+    checkpoint.mark_done({work.source.key: work.source.fingerprint for work in batch})
+    stats.add(
+        upserted=sum(len(plan.new_chunks) for plan in plans),
+        deleted=sum(len(plan.stale_ids) for plan in plans),
     )
+    logger.info(f"Completed {len(batch)} file(s): {', '.join(sorted(work.source.key for work in batch))}")
+
+
+def ingest_data(
+    data_dir: Path = DATA_PATH,
+    workers: int = os.cpu_count() or 1,
+    embed_batch_size: int = settings.EMBEDDING_INGEST_BATCH_SIZE,
+    upsert_batch_size: int = 1000,
+    queue_size: int = 16,
+    checkpoint_path: Path = CHECKPOINT_PATH,
+    reset: bool = False,
+):
+    """
+    Bulk-ingests the data directory through a staged pipeline:
+    discover -> read/extract/chunk (process pool) -> embed (large batches) -> upsert (large batches).
+
+    Stages are connected by bounded queues, completed files are recorded in a checkpoint
+    so an interrupted run resumes, and upserts are idempotent. Only chunks whose content
+    hash changed are embedded and written, and chunks that disappeared are deleted.
+    """
+    logger.info("Starting data ingestion...")
 
     # --- Ensure DB tables exist ---
     init_db()
     logger.info("Database initialized.")
 
-    # --- Process files ---
-    doc_files = list(DATA_PATH.glob("**/*"))
-    logger.info(f"Found {len(doc_files)} files to process in {DATA_PATH}.")
+    # --- Initialize clients and services ---
+    embedding_service = EmbeddingService(
+        load_embedding_model(settings.EMBEDDING_MODEL),
+        ingest_batch_size=embed_batch_size,
+    )
+    chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
+    collection = chroma_client.get_or_create_collection(name=settings.COLLECTION_NAME, metadata=chroma_hnsw_metadata())
+    keyword_index = load_keyword_index(
+        settings.KEYWORD_INDEX_PATH,
+        collection,
+        build_tokenizer(stop_words=settings.KEYWORD_STOP_WORDS, stemming=settings.KEYWORD_STEMMING),
+    )
+    chunk_store = load_chunk_store(settings.CHUNK_STORE_PATH, collection, hot_cache_size=0)
+    vector_store = build_vector_store(collection, chunk_store)
+    checkpoint = Checkpoint(checkpoint_path, reset=reset)
 
-    try:
-        for doc_file in doc_files:
-            if doc_file.is_file() and doc_file.suffix in ['.md', '.txt']:
-                logger.info(f"--- Processing {doc_file.name} ---")
-
-                # --- 1. Store metadata in SQLite (if it doesn't exist) ---
-                # This part remains the same, as it's a check against the relational DB
-                existing_doc = db.query(DocumentMetadata).filter(DocumentMetadata.file_name == doc_file.name).first()
-                if not existing_doc:
-                    new_doc_meta = DocumentMetadata(source="local", file_name=doc_file.name)
-                    db.add(new_doc_meta)
-                    db.commit()
-                    logger.info(f"Added '{doc_file.name}' to metadata database.")
-
-                # --- 2. Process and store content in ChromaDB using upsert ---
-                with open(doc_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-
-                # Use advanced text splitter
-                chunks = text_splitter.split_text(content)
-                if not chunks:
-                    logger.warning(f"No content chunks found in {doc_file.name}. Skipping.")
-                    continue
+    # --- Discover files ---
+    sources = _discover(data_dir, checkpoint)
+    logger.info(f"Found {len(sources)} file(s) to process in {data_dir}.")
+    if not sources:
+        return
 
-                # Generate IDs for ChromaDB. Using upsert handles existence checks.
-                ids = [f"{doc_file.name}_{i}" for i in range(len(chunks))]
-                
-                # Generate embeddings for all chunks
-                embeddings = model.encode(chunks).tolist()
-
-                # Use upsert to add or update chunks. This is idempotent.
-                collection.upsert(
-                    embeddings=embeddings,
-                    documents=chunks,
-                    metadatas=[{"source": doc_file.name} for _ in chunks],
-                    ids=ids
-                )
-                logger.info(f"Upserted {len(chunks)} chunks from '{doc_file.name}' to vector store.")
+    stats = PipelineStats()
+    abort = threading.Event()
+    planned_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    embedded_queue: queue.Queue = queue.Queue(maxsize=queue_size)
 
+    extractor = threading.Thread(
+        target=_extract_stage, args=(sources, workers, collection, vector_store, planned_queue, checkpoint, abort, stats), name="extract"
+    )
+    upserter = threading.Thread(
+        target=_upsert_stage,
+        args=(
+            embedded_queue, collection, keyword_index, chunk_store, vector_store, checkpoint, upsert_batch_size, abort, stats
+        ),
+        name="upsert",
+    )
+    extractor.start()
+    upserter.start()
+    try:
+        # The embedding stage runs on the main thread so the model has the process to itself
+        _embed_stage(planned_queue, embedded_queue, embedding_service, embed_batch_size, abort, stats)
     finally:
-        db.close()
-        logger.info("\nData ingestion complete.")
+        extractor.join()
+        upserter.join()
+        keyword_index.save()
+        vector_store.save()
+        stats.report()
+
+    if abort.is_set():
+        logger.error("Data ingestion stopped early; re-run to resume from the checkpoint.")
+    else:
+        logger.info("Data ingestion complete.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest documents into the Greenstein knowledge base.")
+    parser.add_argument("--data-dir", type=Path, default=DATA_PATH)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes.")
+    parser.add_argument("--embed-batch-size", type=int, default=settings.EMBEDDING_INGEST_BATCH_SIZE)
+    parser.add_argument("--upsert-batch-size", type=int, default=1000)
+    parser.add_argument("--queue-size", type=int, default=16, help="Max files buffered between stages.")
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH)
+    parser.add_argument("--reset", action="store_true", help="Ignore the checkpoint and re-ingest everything.")
+    args = parser.parse_args()
+
+    ingest_data(
+        data_dir=args.data_dir,
+        workers=args.workers,
+        embed_batch_size=args.embed_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        queue_size=args.queue_size,
+        checkpoint_path=args.checkpoint,
+        reset=args.reset,
+    )
+
 
 if __name__ == "__main__":
-    ingest_data()
+    main()
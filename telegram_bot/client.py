@@ -1,7 +1,8 @@
 import httpx
+import json
 import os
 from dotenv import load_dotenv
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List
 from loguru import logger
 
 # Load environment variables
@@ -63,10 +64,49 @@ class ApiClient:
     async def get_chat_response(self, message: str, user_id: int) -> Dict[str, Any]:
         """Gets a chat response from the backend's RAG chat endpoint."""
         url = "/api/v1/chat/"
-        payload = {"message": message[:1024], "user_id": user_id}  # Truncate for safety
+        payload = {"message": message[:1024], "telegram_id": user_id}  # Truncate for safety
         logger.info(f"Sending chat request for user {user_id} (message: '{message[:80]}...')")
         return await self._handle_request("POST", url, json=payload)
 
+    async def stream_chat_response(self, message: str, user_id: int) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams a chat response from the backend's Server-Sent-Events chat endpoint.
+
+        Yields `{"delta": text}` for each piece of the answer as it arrives, and a single
+        `{"error": message}` last if the request fails, possibly after some deltas.
+        """
+        url = "/api/v1/chat/stream"
+        payload = {"message": message[:1024], "telegram_id": user_id}  # Truncate for safety
+        logger.info(f"Sending streaming chat request for user {user_id} (message: '{message[:80]}...')")
+        try:
+            async with self.client.stream("POST", url, json=payload) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                event = "message"
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):].strip()
+                        if event == "done":
+                            break
+                    elif line.startswith("data: "):
+                        data = json.loads(line[len("data: "):])
+                        if event == "error":
+                            yield {"error": data.get("error") or "The backend failed to answer."}
+                            break
+                        if data.get("delta"):
+                            yield {"delta": data["delta"]}
+                    elif not line:
+                        event = "message"  # A blank line ends the event
+        except httpx.HTTPStatusError as e:
+            yield await self._handle_error(e)
+        except httpx.RequestError as e:
+            logger.error(f"Streaming request failed: {e}")
+            yield {"error": "Could not connect to the backend service."}
+        except Exception as e:
+            logger.critical(f"An unexpected error occurred while streaming a chat response: {e}", exc_info=True)
+            yield {"error": "An unexpected internal error occurred."}
+
     async def execute_agent_task(self, user_request: str) -> Dict[str, Any]:
         """Executes a task using the backend's Master Agent."""
         url = "/api/v1/agent/execute"
@@ -76,9 +116,14 @@ class ApiClient:
         return await self._handle_request("POST", url, json=payload, timeout=120.0)
 
     async def ingest_file(self, file_content: bytes, filename: str, user_id: int) -> Dict[str, Any]:
-        """Ingests a file into the RAG knowledge base."""
-        url = "/api/v1/ingest/"
+        """Queues a file for ingestion into the RAG knowledge base. Returns the ingestion job."""
+        url = "/api/v1/ingest/upload"
         files = {'file': (filename, file_content)}  # Let httpx set the MIME type
         logger.info(f"Ingesting file '{filename}' for user {user_id}")
-        # Use a longer timeout for file uploads.
-        return await self._handle_request("POST", url, files=files, timeout=180.0)
+        # Use a longer timeout for file uploads; ingestion itself happens in the background.
+        return await self._handle_request("POST", url, files=files, timeout=120.0)
+
+    async def get_ingestion_job(self, job_id: str) -> Dict[str, Any]:
+        """Gets the status and progress of an ingestion job."""
+        url = f"/api/v1/ingest/jobs/{job_id}"
+        return await self._handle_request("GET", url)
@@ -1,4 +1,7 @@
-from telegram import Update
+import asyncio
+
+from telegram import Message, Update
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import ContextTypes
 from telegram.constants import ChatAction
 
@@ -6,6 +9,80 @@ from ..client import ApiClient, logger
 
 SUPPORTED_MIME_TYPES = ['application/pdf', 'text/plain', 'text/markdown']
 MAX_FILE_SIZE_BYTES = 20 * 1024 * 1024  # 20 MB
+INGESTION_POLL_INTERVAL_SECONDS = 3.0
+INGESTION_POLL_TIMEOUT_SECONDS = 30 * 60
+# Consecutive failed status polls tolerated before the job is reported lost
+INGESTION_POLL_MAX_ERRORS = 5
+# How often the final status edit waits out flood control before giving up
+FINAL_EDIT_ATTEMPTS = 3
+
+def _describe_job(job: dict) -> str:
+    progress = job.get("progress", {})
+    file_name = job.get("file_name", "your file")
+    status = job.get("status")
+    if status == "queued":
+        return f"'{file_name}' is queued for ingestion."
+    if status == "running":
+        return (
+            f"Ingesting '{file_name}' ({progress.get('stage')}): {progress.get('pages', 0)} pages, "
+            f"{progress.get('chunks', 0)} chunks processed, {progress.get('chunks_embedded', 0)} embedded."
+        )
+    if status == "succeeded":
+        if progress.get("stage") == "skipped":
+            return f"'{file_name}' is already in the knowledge base."
+        return f"Successfully ingested '{file_name}' ({progress.get('chunks', 0)} chunks)."
+    return f"Failed to ingest '{file_name}': {job.get('error') or 'unknown error'}"
+
+async def _edit_status(status_message: Message, text: str, final: bool = False) -> bool:
+    """
+    Edits the ingestion status message. Returns False if Telegram rejected the edit.
+    Progress edits are skipped under flood control, as the next poll catches up;
+    the `final` edit waits it out instead, or the user never learns the outcome.
+    """
+    attempts = FINAL_EDIT_ATTEMPTS if final else 1
+    for attempt in range(1, attempts + 1):
+        try:
+            await status_message.edit_text(text)
+            return True
+        except RetryAfter as e:
+            if attempt == attempts:
+                logger.warning(f"Gave up updating ingestion status message under flood control: {e}")
+                return False
+            retry_after = e.retry_after
+            await asyncio.sleep(retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after)
+        except BadRequest as e:
+            logger.warning(f"Could not update ingestion status message: {e}")
+            return False
+    return False
+
+async def _report_ingestion(api_client: ApiClient, status_message: Message, job_id: str):
+    """Polls an ingestion job and keeps the status message up to date until it finishes."""
+    last_text = status_message.text
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + INGESTION_POLL_TIMEOUT_SECONDS
+    errors = 0
+    while loop.time() < deadline:
+        await asyncio.sleep(INGESTION_POLL_INTERVAL_SECONDS)
+        job = await api_client.get_ingestion_job(job_id)
+        if "status" not in job:
+            # A failed poll, e.g. the backend briefly unreachable; the job itself may still succeed.
+            # Only after several in a row is it reported lost, e.g. the backend restarted and forgot it.
+            errors += 1
+            logger.warning(f"Polling ingestion job {job_id} failed ({errors}/{INGESTION_POLL_MAX_ERRORS}): {job.get('error')}")
+            if errors >= INGESTION_POLL_MAX_ERRORS:
+                await _edit_status(status_message, job.get("error") or "Lost track of the ingestion job.", final=True)
+                return
+            continue
+        errors = 0
+        finished = job["status"] in ("succeeded", "failed")
+        text = _describe_job(job)
+        if text != last_text and await _edit_status(status_message, text, final=finished):
+            last_text = text
+        if finished:
+            return
+    await _edit_status(
+        status_message, "Ingestion is taking longer than expected; it will continue in the background.", final=True
+    )
 
 async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /upload command for adding files to the knowledge base."""
@@ -40,8 +117,15 @@ async def upload_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_id=user_id
         )
         
-        reply_text = response.get("message") or response.get("error", "An unknown error occurred during ingestion.")
-        await update.message.reply_text(reply_text)
+        if "job_id" not in response:
+            await update.message.reply_text(response.get("error", "An unknown error occurred during ingestion."))
+            return
+
+        status_message = await update.message.reply_text(response.get("message", "Queued for ingestion."))
+        # Follow the job in the background so this handler returns immediately
+        context.application.create_task(
+            _report_ingestion(api_client, status_message, response["job_id"]), update=update
+        )
         
     except Exception as e:
         logger.exception(f"Error during file upload process for user {user_id}: {e}")
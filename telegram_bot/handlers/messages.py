@@ -1,4 +1,7 @@
-from telegram import Update
+import asyncio
+import time
+from telegram import Message, Update
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import ContextTypes
 from telegram.constants import ChatAction
 
@@ -6,6 +9,39 @@ from ..client import ApiClient, logger
 from .. import history
 from .commands import escape_markdown_v2
 
+# Minimum delay between progressive edits of a streamed reply, to stay within Telegram's rate limits.
+STREAM_EDIT_INTERVAL_SECONDS = 1.0
+# How often the final edit of a streamed reply waits out flood control before giving up
+FINAL_EDIT_ATTEMPTS = 3
+
+async def _edit_reply(context: ContextTypes.DEFAULT_TYPE, reply: Message, text: str, final: bool = False) -> bool:
+    """
+    Edits a streamed reply in place. Returns False if Telegram rejected the edit.
+    Progressive edits are skipped under flood control, as the next one catches up;
+    the `final` edit waits out the flood control instead, or the answer stays truncated.
+    """
+    attempts = FINAL_EDIT_ATTEMPTS if final else 1
+    for attempt in range(1, attempts + 1):
+        try:
+            await context.bot.edit_message_text(
+                chat_id=reply.chat_id,
+                message_id=reply.message_id,
+                text=escape_markdown_v2(text),
+                parse_mode='MarkdownV2',
+            )
+            return True
+        except RetryAfter as e:
+            if attempt == attempts:
+                logger.warning(f"Gave up editing streamed reply {reply.message_id} under flood control: {e}")
+                return False
+            retry_after = e.retry_after
+            await asyncio.sleep(retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after)
+        except BadRequest as e:
+            # e.g. "message is not modified"
+            logger.debug(f"Skipped editing streamed reply {reply.message_id}: {e}")
+            return False
+    return False
+
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles incoming text messages, responding in DMs, replies, or mentions."""
     message = update.effective_message
@@ -38,16 +74,42 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     logger.info(f"Handling text message from user {user_id} in chat {chat_id}")
     await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
 
-    # Get chat response from the backend
-    response_data = await api_client.get_chat_response(message=message_text, user_id=user_id)
-    
-    reply = response_data.get("response") or response_data.get("error", "Sorry, I had trouble thinking of a response.")
+    # Stream the chat response from the backend, progressively editing a single reply
+    reply_message = None
+    reply = ""
+    shown_text = ""
+    last_edit = 0.0
+    error = None
+    async for event in api_client.stream_chat_response(message=message_text, user_id=user_id):
+        if "error" in event:
+            error = event["error"]
+            break
+        reply += event["delta"]
+        now = time.monotonic()
+        if reply_message is None:
+            # The first token ends the typing indicator (time-to-first-token)
+            reply_message = await update.message.reply_text(escape_markdown_v2(reply), parse_mode='MarkdownV2')
+            shown_text, last_edit = reply, now
+        elif now - last_edit >= STREAM_EDIT_INTERVAL_SECONDS:
+            if await _edit_reply(context, reply_message, reply):
+                shown_text = reply
+            last_edit = now
+
+    if not reply.strip() and error is None:
+        reply = "Sorry, I had trouble thinking of a response."
 
-    # Add bot's response to history
-    history.add_message_to_history(chat_id, "Greenstein", reply)
+    if reply.strip():
+        # Add bot's response to history
+        history.add_message_to_history(chat_id, "Greenstein", reply)
 
-    logger.info(f"Sending chat response to user {user_id} in chat {chat_id}")
-    # The reply is dynamic content from the API and must be escaped.
-    await update.message.reply_text(escape_markdown_v2(reply), parse_mode='MarkdownV2')
+        logger.info(f"Sending chat response to user {user_id} in chat {chat_id}")
+        # The reply is dynamic content from the API and must be escaped.
+        if reply_message is None:
+            await update.message.reply_text(escape_markdown_v2(reply), parse_mode='MarkdownV2')
+        elif reply != shown_text:
+            await _edit_reply(context, reply_message, reply, final=True)
 
-    await update.message.reply_text(escape_markdown_v2(reply), parse_mode='MarkdownV2')
+    if error is not None:
+        # Sent on its own, so a partial answer above is not mistaken for a complete one
+        logger.warning(f"Chat response to user {user_id} in chat {chat_id} failed: {error}")
+        await update.message.reply_text(escape_markdown_v2(error), parse_mode='MarkdownV2')